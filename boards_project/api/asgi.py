@@ -0,0 +1,21 @@
+"""
+ASGI config for api project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be served by an ASGI server, e.g. ``uvicorn api.asgi:application``.
+Requests are handled by the WSGI application in threads, except for the event
+streams and long polling, see boards/asgi.py.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
+
+# Sets Django up before the boards application is imported
+wsgi_application = get_wsgi_application()
+
+from boards.asgi import BoardsApplication  # noqa: E402
+
+application = BoardsApplication(wsgi_application)
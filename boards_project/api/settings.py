@@ -52,6 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'boards.metrics.RequestMetricsMiddleware',
+    'boards.throttling.LoadSheddingMiddleware',
+    'boards.compression.CompressionMiddleware',
+    'boards.routers.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,11 +73,41 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'boards.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # Token buckets of each process (see boards/throttling.py) : 'N/period' lets N requests
+    # go at once, then N per period. Scopes without a rate are not limited.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'boards.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': config('THROTTLE_USER_RATE', '50/second'),
+        'anon': config('THROTTLE_ANON_RATE', '20/second'),
+        'board': config('THROTTLE_BOARD_RATE', '200/second'),
+        'global': config('THROTTLE_GLOBAL_RATE', None),
+    },
 }
 
+# Throttling buckets kept by each process, and whether the processes coordinate through the
+# shared cache, every THROTTLE_SYNC_INTERVAL seconds
+THROTTLE_BUCKETS_SIZE = config('THROTTLE_BUCKETS_SIZE', 100000, cast=int)
+THROTTLE_SHARED = config('THROTTLE_SHARED', False, cast=bool)
+THROTTLE_SYNC_INTERVAL = config('THROTTLE_SYNC_INTERVAL', 0.5, cast=float)
+
+# Requests are turned down with a 503 by boards.throttling.LoadSheddingMiddleware beyond that
+# many requests in flight in the process, or once they waited that long behind the proxy
+# (X-Request-Start header). 0 disables either limit.
+LOAD_SHEDDING_MAX_IN_FLIGHT = config('LOAD_SHEDDING_MAX_IN_FLIGHT', 64, cast=int)
+LOAD_SHEDDING_MAX_QUEUE_MS = config('LOAD_SHEDDING_MAX_QUEUE_MS', 2000, cast=int)
+LOAD_SHEDDING_RETRY_AFTER = config('LOAD_SHEDDING_RETRY_AFTER', 1, cast=int)
+
+# Responses shorter than this are not compressed by boards.compression.CompressionMiddleware
+COMPRESSION_MIN_LENGTH = config('COMPRESSION_MIN_LENGTH', 1024, cast=int)
+
+# Requests slower than this are logged by boards.metrics.RequestMetricsMiddleware
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', 500, cast=int)
+
 # Security settingsCSRF_COOKIE_SECURE
 if config('ENV') == 'production':
     CORS_ORIGIN_ALLOW_ALL = True
@@ -128,6 +162,96 @@ DATABASES = {
     }
 }
 
+# Read replica, optional (see boards/routers.py) : the read-only board and member views read from it.
+# Tests read from the test database of the primary instead. The routing itself is tested against
+# a `replica` alias of another local database, added to DATABASES (see boards/tests/test_routers.py)
+if config('DB_REPLICA_HOST', ''):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=config('DB_REPLICA_HOST'),
+        PORT=config('DB_REPLICA_PORT', ''),
+        TEST={'MIRROR': 'default'},
+    )
+REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['boards.routers.ReplicaRouter']
+# Seconds the reads of a client stay on the primary after a write, above the lag of the replica
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', 5, cast=int)
+
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND':  config('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', ''),
+    }
+}
+
+# Serialized board payloads (see boards/cache.py)
+BOARDS_CACHE = 'default'
+BOARDS_CACHE_TIMEOUT = config('BOARDS_CACHE_TIMEOUT', 300, cast=int)
+
+# Responses stored for the retries carrying the same Idempotency-Key (see boards/idempotency.py)
+IDEMPOTENCY_KEY_TIMEOUT = config('IDEMPOTENCY_KEY_TIMEOUT', 24 * 60 * 60, cast=int)
+# Seconds a key stays locked by an attempt in progress, above the request timeout : the attempts
+# of a worker killed meanwhile can be retried after that
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', 60, cast=int)
+
+# Background jobs (see boards/jobs.py), run by the run_jobs command
+JOBS_POOL = config('JOBS_POOL', 'thread')  # thread or process
+JOBS_CONCURRENCY = config('JOBS_CONCURRENCY', 4, cast=int)
+JOBS_BATCH_SIZE = config('JOBS_BATCH_SIZE', 20, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', 1.0, cast=float)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', 5, cast=int)
+# Retries are delayed exponentially from JOBS_RETRY_DELAY seconds, up to JOBS_MAX_RETRY_DELAY
+JOBS_RETRY_DELAY = config('JOBS_RETRY_DELAY', 10, cast=int)
+JOBS_MAX_RETRY_DELAY = config('JOBS_MAX_RETRY_DELAY', 3600, cast=int)
+# Running jobs claimed longer ago than this are requeued, their worker being deemed dead
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', 600, cast=int)
+
+# Changes logged less than this many seconds ago are sent again by the changes feed, its
+# cursor staying before them : above the longest write transaction, which may commit its
+# changes after later ones (see boards/views.py ChangesView)
+CHANGES_SETTLE_SECONDS = config('CHANGES_SETTLE_SECONDS', 5, cast=int)
+
+# Operations accepted in one request by the batch endpoint (see boards/batch.py)
+BATCH_MAX_OPERATIONS = config('BATCH_MAX_OPERATIONS', 50, cast=int)
+
+# Live events of boards, streamed by the ASGI application (see boards/events.py and boards/asgi.py)
+# boards.events.PostgresBroadcaster reaches the subscribers of every process
+BOARDS_EVENTS_BACKEND = config('BOARDS_EVENTS_BACKEND', 'boards.events.InProcessBroadcaster')
+# Events buffered for a subscriber before it is dropped as too slow
+BOARDS_EVENTS_QUEUE_SIZE = config('BOARDS_EVENTS_QUEUE_SIZE', 100, cast=int)
+# Seconds between the keepalive comments of idle event streams
+BOARDS_EVENTS_HEARTBEAT = config('BOARDS_EVENTS_HEARTBEAT', 15, cast=int)
+# Longest `wait` of the long polling read requests
+BOARDS_LONG_POLL_MAX_WAIT = config('BOARDS_LONG_POLL_MAX_WAIT', 60, cast=int)
+
+# In-memory index of the ranks of the largest boards (see boards/ranks.py) : boards of at
+# least RANK_INDEX_MIN_MEMBERS members are indexed, up to RANK_INDEX_MAX_MEMBERS members per process
+RANK_INDEX_ENABLED = config('RANK_INDEX_ENABLED', True, cast=bool)
+RANK_INDEX_MIN_MEMBERS = config('RANK_INDEX_MIN_MEMBERS', 1000, cast=int)
+RANK_INDEX_MAX_MEMBERS = config('RANK_INDEX_MAX_MEMBERS', 1000000, cast=int)
+
+# Boards not modified for ARCHIVE_INACTIVE_DAYS are moved out of the hot tables by the
+# archive_boards command, ARCHIVE_BATCH_SIZE at a time (see boards/archive.py)
+ARCHIVE_INACTIVE_DAYS = config('ARCHIVE_INACTIVE_DAYS', 90, cast=int)
+ARCHIVE_BATCH_SIZE = config('ARCHIVE_BATCH_SIZE', 500, cast=int)
+
+# Admin changelists estimate their number of rows from the planner statistics beyond
+# that many rows, instead of counting them (see boards/admin.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000, cast=int)
+
+# Hot read paths build their payloads without DRF serializers (see boards/fast_serializers.py)
+BOARDS_FAST_SERIALIZATION = config('BOARDS_FAST_SERIALIZATION', True, cast=bool)
+
+# Authenticated tokens (see boards/authentication.py) : entries of the LRU of each process,
+# and how long they live there and in the cache, in seconds
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', 10000, cast=int)
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', 30, cast=int)
+TOKEN_CACHE_TIMEOUT = config('TOKEN_CACHE_TIMEOUT', 300, cast=int)
 
 
 # Password validation
@@ -180,5 +304,6 @@ STATIC_URL = '/static/'
 STATIC_ROOT = config('STATIC_DIR')
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
 
 SITE_ID = 1
@@ -1,7 +1,132 @@
+"""
+Admin of the boards, members and users tables, which are large
+
+Changelists read a page of rows in a single query, their relations joined (list_select_related),
+and never count a whole table : the number of rows is estimated from the planner statistics
+where it is large (see EstimatedCountPaginator), and the unfiltered total is not shown.
+Searches are exact matches on indexed columns (see IndexedSearchMixin), relations are edited
+with raw id widgets, and filters only offer choices which cost no query.
+"""
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import ArchivedBoard, Board, AppUser, BoardMember, Job
+
+
+def estimate_count(queryset):
+    """
+    Returns the number of rows of a queryset as estimated by the planner of PostgreSQL,
+    None on other databases
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts the rows exactly only when the planner estimates less than
+    ADMIN_ESTIMATED_COUNT_THRESHOLD of them : pages of larger tables are numbered from the estimate
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
+class IndexedSearchMixin:
+    """
+    Searches the exact value of each of the search_fields the term is valid for, so that the
+    indexes of these fields serve the search, instead of the case insensitive lookups of the
+    admin, which read every row
+    """
+
+    def get_search_field(self, name):
+        model, field = self.model, None
+        for part in name.split('__'):
+            field = model._meta.get_field(part)
+            model = field.related_model
+        return field.target_field if field.is_relation else field
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for name in self.search_fields:
+            try:
+                value = self.get_search_field(name).to_python(search_term)
+            except ValidationError:
+                continue
+            query |= Q(**{name: value})
+        if not query:
+            return queryset.none(), False
+        return queryset.filter(query), False
+
+
+class LargeTableAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Board)
+class BoardAdmin(LargeTableAdmin):
+    list_display = ('title', 'id', 'members_count', 'version', 'updated_at')
+    readonly_fields = Board.MAINTAINED_FIELDS
+    search_fields = ('id',)
+    list_filter = ('updated_at',)
+
+
+@admin.register(BoardMember)
+class BoardMemberAdmin(LargeTableAdmin):
+    list_display = ('username', 'score', 'user', 'board')
+    list_select_related = ('user', 'board')
+    raw_id_fields = ('user', 'board')
+    # Served by the primary key, the (user, board) and the (board, score, id) indexes
+    search_fields = ('id', 'user__email', 'board')
+
+
+@admin.register(AppUser)
+class AppUserAdmin(LargeTableAdmin):
+    list_display = ('email', 'username', 'id', 'is_staff', 'is_active', 'date_joined')
+    search_fields = ('id', 'email', 'username')
+    list_filter = ('is_staff', 'is_active', 'date_joined')
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at')
+    search_fields = ('id',)
+    list_filter = ('status',)
+
 
-from .models import Board, AppUser, BoardMember
+@admin.register(ArchivedBoard)
+class ArchivedBoardAdmin(LargeTableAdmin):
+    list_display = ('title', 'id', 'members_count', 'updated_at', 'archived_at')
+    raw_id_fields = ('users',)
+    search_fields = ('id',)
+    list_filter = ('archived_at',)
 
-admin.site.register(Board)
-admin.site.register(BoardMember)
-admin.site.register(AppUser)
+    def get_queryset(self, request):
+        # Members are not shown
+        return super().get_queryset(request).defer('members_data')
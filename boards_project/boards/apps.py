@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BoardsConfig(AppConfig):
     name = 'boards'
+
+    def ready(self):
+        # Connects the receivers keeping board versions and cache up to date
+        from . import signals
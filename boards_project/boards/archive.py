@@ -0,0 +1,212 @@
+"""
+Archival of idle boards out of the hot tables
+
+Boards not modified for ARCHIVE_INACTIVE_DAYS are moved by the archive_boards command into
+ArchivedBoard : one row per board, its members packed into a compressed blob, its users in a
+table of their own so that membership checks still find them (see get_user_board_ids).
+The boards and members tables, and their indexes, only keep the boards in use.
+
+Archiving is not a change of the board : its version is kept, so are its ETag and its cached
+payloads, no change is logged and no event is published. Archived boards stay readable, without restoring anything :
+- the board details, its members, leaderboard and next member are served from the archive,
+  the members being read in memory (see get_members, get_member, get_rank, get_neighbours)
+- the summary and the list of the boards of a user include them
+Writes restore the board first, as it was, in a single transaction (see restore), after which
+it is served from the hot tables again.
+Exports and the changes feed only cover the boards in the hot tables.
+Deleting a user removes them from the archives of their boards (see remove_user).
+
+Boards are archived batch by batch, each batch locked and checked to still be idle in the
+transaction which moves it, so that a board written meanwhile is left in place.
+"""
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils import timezone
+
+from . import cache, ranks, routers
+from .models import ArchivedBoard, Board, BoardMember
+
+
+def get_candidates(inactive_since):
+    """
+    Returns the boards not modified since `inactive_since`, least recently modified first
+    """
+    return Board.objects.filter(updated_at__lt=inactive_since).order_by('updated_at', 'id')
+
+
+def archive_batch(inactive_since, batch_size):
+    """
+    Archives up to batch_size idle boards in a single transaction, returning the number of
+    boards and of members archived. Boards locked by a write are skipped where supported.
+    """
+    with transaction.atomic():
+        boards = list(get_candidates(inactive_since).select_for_update(skip_locked=True)[:batch_size])
+        if not boards:
+            return 0, 0
+        board_ids = [board.id for board in boards]
+
+        members = {board_id: [] for board_id in board_ids}
+        rows = BoardMember.objects.filter(board_id__in=board_ids).order_by('board_id', 'score', 'id')
+        for board_id, *member in rows.values_list('board_id', 'id', 'username', 'score', 'user_id'):
+            members[board_id].append(member)
+
+        ArchivedBoard.objects.bulk_create(
+            [ArchivedBoard.for_board(board, members[board.id]) for board in boards]
+        )
+        ArchivedBoard.users.through.objects.bulk_create([
+            ArchivedBoard.users.through(archivedboard_id=board_id, appuser_id=user_id)
+            for board_id, board_members in members.items()
+            for _, _, _, user_id in board_members
+        ])
+        # Deleted without the deletion signals : nothing changed for the clients
+        BoardMember.objects.filter(board_id__in=board_ids)._raw_delete(DEFAULT_DB_ALIAS)
+        Board.objects.filter(id__in=board_ids)._raw_delete(DEFAULT_DB_ALIAS)
+
+    indexes = ranks.get_indexes()
+    for board_id in board_ids:
+        indexes.pop(board_id)
+    return len(board_ids), sum(len(board_members) for board_members in members.values())
+
+
+def archive_boards(inactive_since, batch_size=None):
+    """
+    Archives every board not modified since `inactive_since`, batch by batch.
+    Returns the number of boards and of members archived.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    boards_count = members_count = 0
+    while True:
+        boards, members = archive_batch(inactive_since, batch_size)
+        if not boards:
+            break
+        boards_count += boards
+        members_count += members
+
+    if boards_count and connection.vendor == 'postgresql':
+        # Planner statistics of the hot tables, a large part of which may just have moved.
+        # The space of the rows moved is reused by the next inserts, and released by VACUUM FULL.
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Board._meta.db_table}, {BoardMember._meta.db_table}')
+    return boards_count, members_count
+
+
+def get_archived_board(board_id):
+    """
+    Returns an archived board as an unsaved Board instance, its members prefetched, None if
+    there is no such archive
+    """
+    archived = ArchivedBoard.objects.filter(id=board_id).first()
+    return archived and archived.get_board()
+
+
+def get_members(board, after=None):
+    """
+    Returns the members of a board read from the archive in the leaderboard order, after the
+    (score, id) pair `after` if given, as Board.leaderboard
+    """
+    members = list(board.members.all())
+    if after is not None:
+        members = [member for member in members if (member.score, member.id) > after]
+    return members
+
+
+def get_member(board, member_id):
+    """
+    Returns a member of a board read from the archive, None if there is no such member
+    """
+    try:
+        member_id = uuid.UUID(str(member_id))
+    except ValueError:
+        return None
+    return next((member for member in board.members.all() if member.id == member_id), None)
+
+
+def get_rank(board, member_id):
+    """
+    Board.get_rank for a board read from the archive
+    """
+    member = get_member(board, member_id)
+    if member is None:
+        raise BoardMember.DoesNotExist()
+    return member, get_members(board).index(member) + 1
+
+
+def get_neighbours(board, member, count):
+    """
+    Board.get_neighbours for a board read from the archive
+    """
+    members = get_members(board)
+    position = members.index(member)
+    return members[max(position - count, 0):position], members[position + 1:position + 1 + count]
+
+
+def get_archived_boards(user):
+    """
+    Returns the archived boards the user is a member of, every one for staff users
+    """
+    if user.is_staff:
+        return ArchivedBoard.objects.all()
+    return ArchivedBoard.objects.filter(users=user)
+
+
+def restore(board_id):
+    """
+    Moves an archived board back into the hot tables, as it was, and returns it.
+    Returns the board if it was not archived, or restored concurrently, None if there is none.
+    The rest of the request reads from the primary, which the replica may not have caught up with.
+    Its update time is stamped, so that it is not archived again before it goes idle again.
+    """
+    routers.read_from_primary()
+    with transaction.atomic():
+        archived = ArchivedBoard.objects.select_for_update().filter(id=board_id).first()
+        if archived is None:
+            return Board.objects.filter(id=board_id).first()
+        # Inserted without the saving signals : nothing changed for the clients
+        board = archived.get_board(members=False)
+        board.archived = False
+        board.updated_at = timezone.now()
+        Board.objects.bulk_create([board])
+        BoardMember.objects.bulk_create(archived.get_members(), batch_size=settings.ARCHIVE_BATCH_SIZE)
+        archived.delete()
+    return board
+
+
+def restore_many(board_ids):
+    """
+    Restores those of the given boards which are archived
+    """
+    for board_id in ArchivedBoard.objects.filter(id__in=board_ids).values_list('id', flat=True):
+        restore(board_id)
+
+
+def remove_user(user):
+    """
+    Removes a user about to be deleted from the members of the archived boards, whose
+    aggregates are updated : their members are restored without them. As for the boards in
+    the hot tables, this is a change of the boards, whose version is bumped.
+    """
+    with transaction.atomic():
+        for archived in ArchivedBoard.objects.select_for_update().filter(users=user):
+            archived.set_members([member for member in archived.get_members() if member.user_id != user.id])
+            archived.version += 1
+            archived.updated_at = timezone.now()
+            archived.save()
+            cache.invalidate_board(archived.id)
+
+
+def table_sizes():
+    """
+    Returns the number of rows of the boards, members and archive tables, along with their
+    size on disk in bytes, indexes included, on PostgreSQL
+    """
+    sizes = {}
+    for model in (Board, BoardMember, ArchivedBoard, ArchivedBoard.users.through):
+        table = model._meta.db_table
+        sizes[table] = {'rows': model.objects.count()}
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+                sizes[table]['bytes'] = cursor.fetchone()[0]
+    return sizes
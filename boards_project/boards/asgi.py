@@ -0,0 +1,245 @@
+"""
+ASGI application, serving the API from an event loop (see api/asgi.py)
+
+Django 2.2 has no async views : requests are handled by the WSGI application, run in a pool of
+threads by asgiref's WsgiToAsgi, middlewares included. What waits is done by coroutines instead :
+- `GET boards/<id>/events/` streams the events of a board (see events.py) as server-sent events,
+  authenticated by a token, in the Authorization header or in the `token` query parameter since
+  EventSource cannot set headers. A stream ends when the board is deleted, the subscriber is
+  removed from it, or falls behind : clients then resync from the changes feed.
+- The reads of a board, of its members or of a member, given `wait` (in seconds) along with an
+  If-None-Match header matching the current version, are answered as soon as the board changes,
+  or with the 304 once `wait` has passed (long polling), instead of right away.
+A subscriber, or a client waiting for changes, costs a coroutine instead of a thread.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from rest_framework import exceptions
+
+from . import events
+from .authentication import CachedTokenAuthentication
+from .permissions import get_user_board_ids
+
+
+EVENTS_PATH = 'events/'
+LONG_POLL_ROUTES = ('board_details', 'board_members', 'board_member_details')
+
+
+def closing(wsgi_application):
+    """
+    Closes the responses, which WsgiToAsgi does not : Django sends request_finished on close
+    """
+    def application(environ, start_response):
+        response = wsgi_application(environ, start_response)
+        try:
+            yield from response
+        finally:
+            response.close()
+    return application
+
+
+def get_header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+def get_query_param(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode('latin1')).get(name)
+    return values[0] if values else None
+
+
+def format_event(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+async def empty_request():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_json(send, status, data, headers=()):
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+@sync_to_async
+def authorize(key, board_id):
+    """
+    Returns the user of a token, if a member of the board. Raises AuthenticationFailed or PermissionDenied.
+    """
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+        if board_id not in get_user_board_ids(user):
+            raise exceptions.PermissionDenied()
+        return user
+    finally:
+        # Run out of any request : the connection of the thread is not closed by request_finished
+        close_old_connections()
+
+
+class BufferedResponse:
+    """
+    ASGI `send` keeping the messages of a response, to be sent later, or not
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, message):
+        self.messages.append(message)
+
+    @property
+    def status(self):
+        return self.messages[0]['status']
+
+    async def send(self, send):
+        for message in self.messages:
+            await send(message)
+
+
+class BoardsApplication:
+    """
+    Streams events and waits for changes in coroutines, hands everything else to the WSGI application
+    """
+
+    def __init__(self, wsgi_application):
+        self.wsgi = WsgiToAsgi(closing(wsgi_application))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            path = scope['path']
+            if path.endswith('/' + EVENTS_PATH):
+                match = self.resolve(path[:-len(EVENTS_PATH)])
+                if match is not None and match.url_name == 'board_details':
+                    return await self.stream_events(scope, receive, send, match.kwargs['board_id'])
+
+            wait = self.get_wait(scope)
+            if wait:
+                match = self.resolve(path)
+                if match is not None and match.url_name in LONG_POLL_ROUTES:
+                    return await self.long_poll(scope, send, match.kwargs['board_id'], wait)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def resolve(self, path):
+        try:
+            return resolve(path)
+        except Resolver404:
+            return None
+
+    def get_wait(self, scope):
+        if get_header(scope, b'if-none-match') is None:
+            return None
+        try:
+            wait = float(get_query_param(scope, 'wait') or 0)
+        except ValueError:
+            return None
+        return min(max(wait, 0), settings.BOARDS_LONG_POLL_MAX_WAIT)
+
+    async def long_poll(self, scope, send, board_id, wait):
+        # Subscribed before the version is checked, so that no change is missed in between
+        broadcaster = events.get_broadcaster()
+        subscription = broadcaster.subscribe(board_id)
+        try:
+            response = BufferedResponse()
+            await self.wsgi(scope, empty_request, response)
+            if response.status == 304:
+                try:
+                    await asyncio.wait_for(subscription.get(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    response = BufferedResponse()
+                    await self.wsgi(scope, empty_request, response)
+            await response.send(send)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    async def stream_events(self, scope, receive, send, board_id):
+        authorization = (get_header(scope, b'authorization') or '').split()
+        if len(authorization) == 2 and authorization[0] == CachedTokenAuthentication.keyword:
+            key = authorization[1]
+        else:
+            key = get_query_param(scope, 'token')
+        if not key:
+            return await send_json(send, 401, {'detail': 'Authentication credentials were not provided.'},
+                                   [(b'www-authenticate', CachedTokenAuthentication.keyword.encode())])
+        try:
+            user = await authorize(key, board_id)
+        except exceptions.APIException as e:
+            return await send_json(send, e.status_code, {'detail': str(e.detail)})
+
+        broadcaster = events.get_broadcaster()
+        subscription = broadcaster.subscribe(board_id)
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        next_event = asyncio.ensure_future(subscription.get())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    # Not buffered by proxies
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': b': subscribed\n\n', 'more_body': True})
+
+            while True:
+                done, _ = await asyncio.wait(
+                    (next_event, disconnected), timeout=settings.BOARDS_EVENTS_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    return
+                if next_event not in done:
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+
+                event = next_event.result()
+                if event is None:
+                    # Overflowed
+                    event = {'type': events.BOARD_CHANGED}
+                await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+                if event['type'] in (events.BOARD_CHANGED, events.BOARD_DELETED) or (
+                    event['type'] == events.MEMBER_REMOVED and event['member']['user'] == str(user.id)
+                ):
+                    break
+                next_event = asyncio.ensure_future(subscription.get())
+
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            broadcaster.unsubscribe(subscription)
+            next_event.cancel()
+            disconnected.cancel()
@@ -0,0 +1,124 @@
+"""
+Token authentication without a query per request
+
+DRF's TokenAuthentication looks up the token and its user in the database on every call.
+CachedTokenAuthentication keeps the result in two tiers : a small LRU in the process,
+whose entries live TOKEN_CACHE_TTL seconds, then the shared cache (see cache.py), whose
+entries live TOKEN_CACHE_TIMEOUT seconds.
+
+Entries are evicted from both on logout, password change and any other change to the user
+(deactivation included), see signals.py. The LRUs of the other processes are not reached
+by evictions : they may keep authenticating a revoked token until their entry expires,
+which is what TOKEN_CACHE_TTL bounds.
+"""
+import collections
+import hashlib
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import get_cache
+
+
+TOKEN_KEY = 'tokens:{digest}'
+
+
+class LRU:
+    """
+    Thread-safe mapping of at most `size` entries, each expiring `ttl` seconds after being set
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LRU(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def _get_key(token_key):
+    # Tokens are credentials : they are not written as such in the shared cache
+    return TOKEN_KEY.format(digest=hashlib.sha256(token_key.encode()).hexdigest())
+
+
+def _evict(keys):
+    get_cache().delete_many([_get_key(key) for key in keys])
+    for key in keys:
+        _local.delete(key)
+
+
+def invalidate_token(token_key):
+    """
+    Evicts a token from the caches of this process, now and once the current transaction commits
+    """
+    _evict([token_key])
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _evict([token_key]))
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Evicts the tokens of a user, see invalidate_token
+    """
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def clear():
+    _local.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication reading the token and its user from the caches first, see the
+    module docstring. Only valid tokens of active users are cached.
+    Entries are pickled, so that each request gets its own user instance.
+    The password hash is left out of the entries : it is deferred on the cached users,
+    loaded from the database if ever read, and left alone when they are saved.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = _local.get(key)
+        if entry is None:
+            cache_key = _get_key(key)
+            entry = get_cache().get(cache_key)
+            if entry is None:
+                user, token = super().authenticate_credentials(key)
+                user.__dict__.pop('password', None)
+                entry = pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)
+                get_cache().set(cache_key, entry, settings.TOKEN_CACHE_TIMEOUT)
+            _local.set(key, entry)
+        return pickle.loads(entry)
@@ -0,0 +1,103 @@
+"""
+Execution of batches of API requests in one round trip
+
+Each operation is dispatched in-process to the view its path resolves to in boards/urls.py,
+as a request of its own authenticated as the user of the batch : views, permission classes
+and validation run as for separate requests, middlewares do not (they run once, for the batch).
+"""
+import io
+import json
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+
+from . import cache, idempotency
+
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# Headers of the responses passed on to the client
+RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Location')
+
+# Headers of the batch request which are not those of its operations
+BATCH_HEADERS = ('HTTP_IF_', 'HTTP_ACCEPT', 'CONTENT_')
+
+
+class Rollback(Exception):
+    pass
+
+
+def build_request(request, operation, path):
+    """
+    Returns the request of an operation, a copy of the batch request but for the method,
+    path, query string, headers and JSON body of the operation
+    """
+    body = json.dumps(operation['body']).encode() if 'body' in operation else b''
+    environ = {key: value for key, value in request.META.items() if not key.startswith(BATCH_HEADERS)}
+    environ.update({
+        'REQUEST_METHOD': operation['method'],
+        'PATH_INFO': path,
+        'QUERY_STRING': urlencode(operation.get('query', {}), doseq=True),
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    for name, value in operation.get('headers', {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    # Retries are covered by the key of the batch : operations rolled back with an atomic
+    # batch would have their response stored all the same
+    environ.pop(idempotency.HEADER, None)
+
+    operation_request = WSGIRequest(environ)
+    # Authenticated as the batch, without going through the authentication classes again
+    operation_request._force_auth_user = request.user
+    operation_request._force_auth_token = request.auth
+    return operation_request
+
+
+def dispatch(request, operation, prefix):
+    """
+    Executes an operation, returns its status, headers and body (the data of the response, not rendered)
+    """
+    path = operation['path']
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    try:
+        match = resolve('/' + path.lstrip('/'), urlconf='boards.urls')
+    except Resolver404:
+        return {'status': 404, 'headers': {}, 'body': {'detail': f'Unknown path {operation["path"]}'}}
+    if not getattr(getattr(match.func, 'view_class', None), 'batchable', True):
+        return {'status': 400, 'headers': {}, 'body': {'detail': f'{operation["path"]} cannot be batched'}}
+
+    operation_request = build_request(request, operation, prefix + path.lstrip('/'))
+    operation_request.resolver_match = match
+    response = match.func(operation_request, *match.args, **match.kwargs)
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in RESPONSE_HEADERS if response.has_header(name)},
+        'body': getattr(response, 'data', None),
+    }
+
+
+def execute(request, operations, atomic=False, prefix='/'):
+    """
+    Executes the operations in order, returns their responses and whether they were committed.
+    An atomic batch runs in one transaction, which the first operation failing rolls back :
+    the following ones are not executed.
+    """
+    if not atomic:
+        return [dispatch(request, operation, prefix) for operation in operations], True
+
+    responses = []
+    try:
+        # Operations may read what the previous ones wrote through the cache
+        with cache.atomic():
+            for operation in operations:
+                responses.append(dispatch(request, operation, prefix))
+                if responses[-1]['status'] >= 400:
+                    raise Rollback()
+    except Rollback:
+        return responses, False
+    return responses, True
@@ -0,0 +1,392 @@
+"""
+Benchmarks of every API route through the Django test client, at several data sizes
+
+Each route is measured in separate passes, so that instrumentation does not skew timings :
+latencies over a number of iterations, then the queries and the memory allocated by a
+single request. The report also compares the throughput of the serializers and of their
+fast path, the cost of authenticating a request with and without the tokens cache, the
+cost of ranks counted by the database and read from the in-memory index, and the overhead of
+throttling a request. Routes are benchmarked unthrottled, the throttle still running.
+It is a plain dict, meant to be dumped as JSON and diffed between releases.
+"""
+import datetime
+import platform
+import random
+import time
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.throttling import UserRateThrottle
+from rest_framework.views import APIView
+
+from . import authentication, cache, ranks, seeding, throttling
+from .models import AppUser, Board, BoardMember
+
+
+BENCHMARK_EMAIL = f'benchmark@{seeding.SEED_DOMAIN}'
+BENCHMARK_STAFF_EMAIL = f'benchmark_staff@{seeding.SEED_DOMAIN}'
+PERCENTILES = (50, 90, 99)
+
+
+class Context:
+    """
+    The benchmark user, along with the board, member and cursor the routes are called with
+    """
+
+    def __init__(self, user, board, member, cursor):
+        self.user = user
+        self.board = board
+        self.member = member
+        self.cursor = cursor
+
+
+def board_kwargs(context):
+    return {'board_id': context.board.id}
+
+
+def batch_body(context):
+    """
+    A representative batch : the reads a client refreshes a board with, and a score update
+    """
+    member_url = reverse('board_member_details', kwargs=dict(board_kwargs(context), member_id=context.member.id))
+    return {'requests': [
+        {'method': 'GET', 'path': reverse('board_details', kwargs=board_kwargs(context))},
+        {'method': 'GET', 'path': reverse('board_members', kwargs=board_kwargs(context))},
+        {'method': 'GET', 'path': reverse('board_leaderboard', kwargs=board_kwargs(context))},
+        {'method': 'PUT', 'path': member_url, 'body': {'delta': 1}},
+    ]}
+
+
+# name, method, url, body
+ROUTES = (
+    ('login', 'post', lambda c: reverse('rest_login'),
+        lambda c: {'email': BENCHMARK_EMAIL, 'password': seeding.DEFAULT_PASSWORD}),
+    ('boards_list', 'get', lambda c: reverse('boards'), None),
+    ('boards_create', 'post', lambda c: reverse('boards'), lambda c: {'title': 'Benchmark board'}),
+    ('boards_export_ndjson', 'get', lambda c: reverse('export_boards', kwargs={'export_format': 'ndjson'}), None),
+    ('boards_export_csv', 'get', lambda c: reverse('export_boards', kwargs={'export_format': 'csv'}), None),
+    ('boards_settle', 'post', lambda c: reverse('settle_scores'),
+        lambda c: {'boards': [str(c.board.id)], 'members': [str(c.member.id)], 'delta': 1}),
+    ('board_details', 'get', lambda c: reverse('board_details', kwargs=board_kwargs(c)), None),
+    ('board_members', 'get', lambda c: reverse('board_members', kwargs=board_kwargs(c)), None),
+    ('board_leaderboard', 'get', lambda c: reverse('board_leaderboard', kwargs=board_kwargs(c)), None),
+    ('board_member_details', 'get',
+        lambda c: reverse('board_member_details', kwargs=dict(board_kwargs(c), member_id=c.member.id)), None),
+    ('board_member_update', 'put',
+        lambda c: reverse('board_member_details', kwargs=dict(board_kwargs(c), member_id=c.member.id)),
+        lambda c: {'delta': 1}),
+    ('board_next_member', 'get', lambda c: reverse('board_next_member', kwargs=board_kwargs(c)), None),
+    ('board_next_member_take', 'post', lambda c: reverse('board_next_member', kwargs=board_kwargs(c)),
+        lambda c: {'delta': 1}),
+    ('changes', 'get', lambda c: f"{reverse('changes')}?cursor={c.cursor}", None),
+    ('batch', 'post', lambda c: reverse('batch'), batch_body),
+    ('user_profile', 'get', lambda c: reverse('user_profile'), None),
+    ('metrics', 'get', lambda c: reverse('metrics'), None),
+)
+
+# Routes called by a staff user, the benchmark user being a regular one
+STAFF_ROUTES = ('metrics',)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+
+def request(client, method, url, data):
+    response = getattr(client, method)(url, data, content_type='application/json')
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method.upper()} {url} answered {response.status_code}')
+    # Streamed responses are only produced while consumed
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(client, method, url, data, iterations, warmup):
+    for _ in range(warmup):
+        request(client, method, url, data)
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        request(client, method, url, data)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    # Counted through a wrapper, as the queries log is reset whenever a request starts
+    queries = []
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        request(client, method, url, data)
+
+    tracemalloc.start()
+    request(client, method, url, data)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'latency_ms': dict(
+            {f'p{p}': round(percentile(timings, p), 3) for p in PERCENTILES},
+            mean=round(sum(timings) / len(timings), 3),
+            max=round(timings[-1], 3),
+        ),
+        'queries': len(queries),
+        'allocated_kib': round(allocated / 1024, 1),
+    }
+
+
+def measure_authentication(user, iterations):
+    """
+    Compares the cost of authenticating a request with DRF's TokenAuthentication and with
+    CachedTokenAuthentication, warm : latencies in microseconds and queries per request
+    """
+    token = Token.objects.get_or_create(user=user)[0]
+    request = Request(RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token.key}'))
+    authentication.clear()
+
+    results = {}
+    for name, backend in (('token', TokenAuthentication()), ('cached_token', authentication.CachedTokenAuthentication())):
+        backend.authenticate(request)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            backend.authenticate(request)
+            timings.append((time.perf_counter() - start) * 1000000)
+        timings.sort()
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            backend.authenticate(request)
+        results[name] = {
+            'latency_us': {f'p{p}': round(percentile(timings, p), 1) for p in PERCENTILES},
+            'queries': len(queries),
+        }
+    return results
+
+
+def measure_ranks(board, iterations, rng):
+    """
+    Compares the cost of the rank of a member, and of its neighbours, counted by the database
+    and read from the in-memory index (see ranks.py), on members drawn all along the
+    leaderboard : latencies in microseconds and queries per call, warm
+    """
+    members = list(board.members.all())
+    sample = [rng.choice(members) for _ in range(iterations)]
+    results = {}
+    for mode, enabled in (('sql', False), ('index', True)):
+        with override_settings(RANK_INDEX_ENABLED=enabled, RANK_INDEX_MIN_MEMBERS=0):
+            ranks.clear()
+            board.get_rank(sample[0].id)
+            results[mode] = {}
+            for name, call in (
+                ('rank', lambda member: board.get_rank(member.id)),
+                ('neighbours', lambda member: board.get_neighbours(member, 5)),
+            ):
+                timings = []
+                for member in sample:
+                    start = time.perf_counter()
+                    call(member)
+                    timings.append((time.perf_counter() - start) * 1000000)
+                timings.sort()
+
+                queries = []
+                with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                    call(sample[-1])
+                results[mode][name] = {
+                    'latency_us': {f'p{p}': round(percentile(timings, p), 1) for p in PERCENTILES},
+                    'queries': len(queries),
+                }
+    ranks.clear()
+    return results
+
+
+def measure_hot_queries(iterations, rng):
+    """
+    Measures the queries the requests run on the boards and members tables, on members
+    drawn all over the members table : latencies in microseconds, warm.
+    Run before and after archiving (see the archive_boards command).
+    """
+    members = list(BoardMember.objects.values_list('id', 'board_id', 'user_id', 'score'))
+    if not members:
+        return {}
+    since = timezone.now() - datetime.timedelta(days=1)
+    queries = (
+        ('board', lambda member: Board.objects.get(id=member[1])),
+        ('board_members', lambda member: list(BoardMember.objects.filter(board_id=member[1]).order_by('score', 'id'))),
+        ('member', lambda member: BoardMember.objects.get(board_id=member[1], id=member[0])),
+        ('rank', lambda member: BoardMember.objects.filter(board_id=member[1], score__lt=member[3]).count()),
+        ('memberships', lambda member: list(BoardMember.objects.filter(user_id=member[2]).values_list('board_id'))),
+        ('recent_boards', lambda member: Board.objects.filter(updated_at__gte=since).count()),
+    )
+    sample = [rng.choice(members) for _ in range(iterations)]
+    results = {}
+    for name, query in queries:
+        query(sample[0])
+        timings = []
+        for member in sample:
+            start = time.perf_counter()
+            query(member)
+            timings.append((time.perf_counter() - start) * 1000000)
+        timings.sort()
+        results[name] = {f'p{p}': round(percentile(timings, p), 1) for p in PERCENTILES}
+    return results
+
+
+def throttle_rates(rates):
+    """
+    Overrides the throttling rates of REST_FRAMEWORK
+    """
+    return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates))
+
+
+def measure_throttling(user, iterations):
+    """
+    Measures the overhead of throttling a request, its user, board and global limits never
+    being reached : TokenBucketThrottle with buckets in the process, then coordinated through
+    the shared cache every THROTTLE_SYNC_INTERVAL, and for reference DRF's UserRateThrottle,
+    which reads and writes its history in the cache on every request. Latencies in microseconds, warm.
+    """
+    rate = f'{iterations * 10}/second'
+    request = Request(RequestFactory().get('/'))
+    request.user = user
+    view = APIView()
+    view.kwargs = {'board_id': uuid.uuid4()}
+    modes = (
+        ('token_bucket', throttling.TokenBucketThrottle, {'THROTTLE_SHARED': False}),
+        ('token_bucket_shared', throttling.TokenBucketThrottle, {'THROTTLE_SHARED': True}),
+        ('drf_user_rate', type('BenchmarkThrottle', (UserRateThrottle,), {'rate': rate}), {}),
+    )
+    results = {}
+    with throttle_rates({'user': rate, 'board': rate, 'global': rate}):
+        for name, throttle_class, overrides in modes:
+            with override_settings(**overrides):
+                throttling.clear()
+                cache.get_cache().clear()
+                throttle = throttle_class()
+                throttle.allow_request(request, view)
+                timings = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    allowed = throttle.allow_request(request, view)
+                    timings.append((time.perf_counter() - start) * 1000000)
+                    if not allowed:
+                        raise RuntimeError(f'{name} throttled the benchmark')
+                timings.sort()
+                results[name] = {f'p{p}': round(percentile(timings, p), 1) for p in PERCENTILES}
+    throttling.clear()
+    return results
+
+
+# Routes with a fast path (see fast_serializers.py)
+SERIALIZATION_ROUTES = ('boards_list', 'board_members', 'board_member_details')
+
+
+def measure_serialization(client, context, iterations):
+    """
+    Compares the throughput of the routes with a fast path, in requests per second on a
+    single core, with the serializers and with the fast path. The boards cache is cleared
+    before each request, outside of the timings.
+    """
+    routes = {name: (method, get_url(context)) for name, method, get_url, _ in ROUTES}
+    results = {}
+    for name in SERIALIZATION_ROUTES:
+        method, url = routes[name]
+        results[name] = {}
+        for mode, fast in (('serializers', False), ('fast', True)):
+            with override_settings(BOARDS_FAST_SERIALIZATION=fast):
+                request(client, method, url, None)
+                elapsed = 0
+                for _ in range(iterations):
+                    cache.invalidate_board(context.board.id)
+                    start = time.perf_counter()
+                    request(client, method, url, None)
+                    elapsed += time.perf_counter() - start
+            results[name][mode] = round(iterations / elapsed, 1)
+    return results
+
+
+def prepare(boards_count, rng):
+    """
+    Grows the dataset up to boards_count seeded boards, and gives the benchmark user a board
+    of boards_count members. Returns the context routes are called with.
+    """
+    seeded_boards = Board.objects.filter(title__startswith='Seed board').count()
+    seeding.seed_users(max(0, 2 * boards_count - seeding.get_seed_users().count()))
+    users = list(seeding.get_seed_users().exclude(email__in=(BENCHMARK_EMAIL, BENCHMARK_STAFF_EMAIL)))
+    seeding.seed_boards(max(0, boards_count - seeded_boards), users, rng=rng)
+
+    user = AppUser.objects.get(email=BENCHMARK_EMAIL)
+    board = Board.objects.create(title=f'Benchmark board of {boards_count}')
+    board.add_members(
+        [{'user': user.id}] + [{'user': member.id} for member in rng.sample(users, min(boards_count, len(users)))]
+    )
+    member = board.members.get(user=user)
+
+    # Seeded memberships were not invalidated
+    cache.get_cache().clear()
+    return Context(user, board, member, cursor=0)
+
+
+def run(sizes, iterations=30, warmup=3, seed=0, log=None):
+    """
+    Benchmarks every route at each size (a number of boards), on the current database,
+    which gets seeded along the way. Returns the report.
+    """
+    rng = random.Random(seed)
+    if not AppUser.objects.filter(email=BENCHMARK_EMAIL).exists():
+        AppUser.objects.create_user(username='benchmark', email=BENCHMARK_EMAIL, password=seeding.DEFAULT_PASSWORD)
+    if not AppUser.objects.filter(email=BENCHMARK_STAFF_EMAIL).exists():
+        AppUser.objects.create_user(
+            username='benchmark_staff', email=BENCHMARK_STAFF_EMAIL, password=seeding.DEFAULT_PASSWORD, is_staff=True
+        )
+    staff = AppUser.objects.get(email=BENCHMARK_STAFF_EMAIL)
+    staff_client = Client(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=staff)[0].key}')
+
+    report = {
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'iterations': iterations,
+        'sizes': [],
+    }
+    with throttle_rates({}):
+        for boards_count in sorted(sizes):
+            context = prepare(boards_count, rng)
+            client = Client(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=context.user)[0].key}')
+
+            routes = {}
+            for name, method, get_url, get_data in ROUTES:
+                if log:
+                    log(f'{boards_count} boards : {name}')
+                data = get_data(context) if get_data else None
+                routes[name] = measure(
+                    staff_client if name in STAFF_ROUTES else client, method, get_url(context), data, iterations, warmup
+                )
+
+            report['sizes'].append({
+                'boards': Board.objects.count(),
+                'members': BoardMember.objects.count(),
+                'users': AppUser.objects.count(),
+                'routes': routes,
+            })
+
+        report['serialization'] = measure_serialization(client, context, iterations)
+    report['ranks'] = measure_ranks(context.board, max(iterations, 100), rng)
+    report['authentication'] = measure_authentication(
+        AppUser.objects.get(email=BENCHMARK_EMAIL), max(iterations, 100)
+    )
+    report['throttling'] = measure_throttling(AppUser.objects.get(email=BENCHMARK_EMAIL), max(iterations, 1000))
+    return report
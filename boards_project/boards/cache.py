@@ -0,0 +1,162 @@
+"""
+Read-through cache of the serialized board and members payloads,
+and of the ids of the boards each user is a member of
+
+Entries are keyed by a generation number, per board or per user, stored in the cache
+itself. Invalidating only bumps the generation : entries of the previous generation are
+never read again, even if a slow request writes one after the invalidation, and expire
+on their own. Entries computed from a replica, which may lag behind the invalidation,
+are stored under keys of their own, which only reads from the replica use, and expire within
+REPLICA_PIN_SECONDS (see routers.py) : a client reading from the primary after its write never
+gets a payload computed from a replica which had not caught up with it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from . import routers
+
+
+GENERATION_KEY = '{scope}:{id}:generation'
+PAYLOAD_KEY = '{scope}:{id}:{generation}:{name}'
+REPLICA_PAYLOAD_KEY = PAYLOAD_KEY + ':replica'
+
+BOARDS = 'boards'
+USERS = 'users'
+
+_stats = {scope: {'hits': 0, 'misses': 0, 'evictions': 0} for scope in (BOARDS, USERS)}
+_stats_lock = threading.Lock()
+
+# Sets collecting the entries invalidated within atomic() blocks of the current thread
+_local = threading.local()
+
+
+def get_cache():
+    return caches[settings.BOARDS_CACHE]
+
+
+def _count(scope, name):
+    with _stats_lock:
+        _stats[scope][name] += 1
+
+
+def get_stats(scope=BOARDS):
+    """
+    Returns the hits, misses and evictions counted by this process, for boards or users entries
+    """
+    with _stats_lock:
+        return dict(_stats[scope])
+
+
+def reset_stats():
+    with _stats_lock:
+        for counters in _stats.values():
+            for name in counters:
+                counters[name] = 0
+
+
+def _get_generation(cache, scope, id):
+    key = GENERATION_KEY.format(scope=scope, id=id)
+    generation = cache.get(key)
+    if generation is None:
+        # A time based start, so a generation evicted from the cache never comes back
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump_generation(scope, id):
+    cache = get_cache()
+    key = GENERATION_KEY.format(scope=scope, id=id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+    _count(scope, 'evictions')
+
+
+def _get_or_set(scope, id, name, compute):
+    cache = get_cache()
+    generation = _get_generation(cache, scope, id)
+    key = PAYLOAD_KEY.format(scope=scope, id=id, generation=generation, name=name)
+    timeout = settings.BOARDS_CACHE_TIMEOUT
+    if routers.reading_from_replica():
+        # Entries computed from the primary are as fresh, those from the replica are kept apart
+        replica_key = REPLICA_PAYLOAD_KEY.format(scope=scope, id=id, generation=generation, name=name)
+        cached = cache.get_many([key, replica_key])
+        data = cached.get(key, cached.get(replica_key))
+        key, timeout = replica_key, min(timeout, settings.REPLICA_PIN_SECONDS)
+    else:
+        data = cache.get(key)
+    if data is not None:
+        _count(scope, 'hits')
+        return data
+
+    _count(scope, 'misses')
+    data = compute()
+    cache.set(key, data, timeout)
+    return data
+
+
+def _invalidate(scope, id):
+    # Within a transaction this is done again on commit, so a request reading between
+    # now and the commit cannot cache data the transaction is about to change
+    _bump_generation(scope, id)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump_generation(scope, id))
+    for invalidated in getattr(_local, 'invalidated', ()):
+        invalidated.add((scope, id))
+
+
+@contextmanager
+def atomic():
+    """
+    transaction.atomic() for blocks which may read what they wrote through the cache :
+    what they invalidated is invalidated again if they are rolled back, since the entries
+    cached in between were computed from data which never got committed
+    """
+    invalidated = set()
+    if not hasattr(_local, 'invalidated'):
+        _local.invalidated = []
+    _local.invalidated.append(invalidated)
+    try:
+        with transaction.atomic():
+            yield
+    except BaseException:
+        for scope, id in invalidated:
+            _bump_generation(scope, id)
+        raise
+    finally:
+        _local.invalidated.remove(invalidated)
+
+
+def get_or_set(board_id, name, compute):
+    """
+    Returns the payload `name` of a board from the cache, computing and storing it on a miss
+    """
+    return _get_or_set(BOARDS, board_id, name, compute)
+
+
+def invalidate_board(board_id):
+    """
+    Evicts every cached payload of a board
+    """
+    _invalidate(BOARDS, board_id)
+
+
+def get_or_set_user_board_ids(user_id, compute):
+    """
+    Returns the set of ids of the boards a user is a member of, computing it on a miss
+    """
+    return _get_or_set(USERS, user_id, 'board_ids', compute)
+
+
+def invalidate_user(user_id):
+    """
+    Evicts the cached board ids of a user, on any change of its memberships
+    """
+    _invalidate(USERS, user_id)
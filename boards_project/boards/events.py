@@ -0,0 +1,180 @@
+"""
+Live events of boards, pushed to the subscribers of their event streams (see asgi.py)
+
+Member additions, updates (score changes included) and removals are published once their
+transaction is committed, by whichever process made them, to the broadcaster named by
+BOARDS_EVENTS_BACKEND :
+- InProcessBroadcaster reaches the subscribers of the same process only, which is enough
+  when a single ASGI process serves both the changes and the streams
+- PostgresBroadcaster goes through LISTEN / NOTIFY, so that the changes made by any process
+  (WSGI workers, job workers, other ASGI processes) reach the subscribers of every process
+
+Subscribers are asyncio queues, a coroutine waiting on each : a subscription costs no thread.
+A subscriber too slow to keep up with its board is dropped, and resyncs from the changes feed.
+"""
+import asyncio
+import collections
+import json
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+
+MEMBER_ADDED = 'member.added'
+MEMBER_UPDATED = 'member.updated'
+MEMBER_REMOVED = 'member.removed'
+MEMBERS_SETTLED = 'members.settled'
+BOARD_DELETED = 'board.deleted'
+# Sent instead of an event too large to be broadcast : subscribers resync the whole board
+BOARD_CHANGED = 'board.changed'
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+class Subscription:
+    """
+    Events of a board, to be awaited with get() in the event loop which subscribed.
+    get() returns None once the subscription overflowed.
+    """
+
+    def __init__(self, board_id, size):
+        self.board_id = board_id
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def put(self, event):
+        # Called in the event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroadcaster:
+    """
+    Hands the events published by any thread to the subscriptions of this process
+    """
+
+    def __init__(self):
+        self._subscriptions = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, board_id):
+        subscription = Subscription(str(board_id), settings.BOARDS_EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions[subscription.board_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions[subscription.board_id]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.board_id]
+
+    def subscribers_count(self, board_id=None):
+        with self._lock:
+            if board_id is not None:
+                return len(self._subscriptions.get(str(board_id), ()))
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, board_id, event):
+        self.dispatch(str(board_id), event)
+
+    def dispatch(self, board_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(board_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+
+class PostgresBroadcaster(InProcessBroadcaster):
+    """
+    Publishes the events with NOTIFY, and listens to them in each process which has subscribers,
+    with a connection of its own read by the event loop. NOTIFY payloads are limited to 8000
+    bytes : larger events are replaced by a BOARD_CHANGED one.
+    """
+    channel = 'boards_events'
+    max_payload = 7900
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, board_id, event):
+        payload = json.dumps({'board': str(board_id), 'event': event})
+        if len(payload.encode()) > self.max_payload:
+            payload = json.dumps({'board': str(board_id), 'event': {'type': BOARD_CHANGED}})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def subscribe(self, board_id):
+        subscription = super().subscribe(board_id)
+        if self._listener is None:
+            self.listen(subscription.loop)
+        return subscription
+
+    def listen(self, loop):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        loop.add_reader(listener.fileno(), self.notified)
+        self._listener = listener
+
+    def notified(self):
+        self._listener.poll()
+        while self._listener.notifies:
+            notification = json.loads(self._listener.notifies.pop(0).payload)
+            self.dispatch(notification['board'], notification['event'])
+
+
+def get_broadcaster():
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = import_string(settings.BOARDS_EVENTS_BACKEND)()
+        return _broadcaster
+
+
+def member_data(member):
+    """
+    The member as in the payloads of MemberSerializer
+    """
+    return {
+        'id': str(member.id),
+        'board': str(member.board_id),
+        'user': str(member.user_id),
+        'username': member.username,
+        'score': member.score,
+    }
+
+
+def publish(board_id, event_type, **data):
+    """
+    Publishes an event of a board once the current transaction is committed
+    """
+    event = dict(data, type=event_type)
+    transaction.on_commit(lambda: get_broadcaster().publish(board_id, event))
+
+
+def member_changed(member, event_type):
+    if event_type == MEMBER_REMOVED:
+        publish(member.board_id, event_type, member={'id': str(member.id), 'user': str(member.user_id)})
+    else:
+        publish(member.board_id, event_type, member=member_data(member))
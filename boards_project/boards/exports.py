@@ -0,0 +1,69 @@
+"""
+Streamed exports of boards with their members
+
+Rows are read through a server-side cursor, chunk by chunk, and written out as soon as
+they are formatted, so memory use does not depend on the amount of data exported.
+"""
+import csv
+import itertools
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+CHUNK_SIZE = 2000
+
+MEMBER_FIELDS = ('id', 'username', 'score', 'user', 'board')
+ROW_FIELDS = (
+    'id',
+    'title',
+    'members__id',
+    'members__username',
+    'members__score',
+    'members__user_id',
+)
+CSV_HEADER = ('board_id', 'board_title', 'member_id', 'member_username', 'member_score', 'member_user')
+
+
+def iter_rows(boards):
+    """
+    Yields one row per member of the boards (one with empty member fields for boards
+    without members), ordered by board then as in the leaderboard
+    """
+    return (
+        boards
+        .order_by('id', 'members__score', 'members__id')
+        .values_list(*ROW_FIELDS)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def iter_ndjson(boards):
+    """
+    Yields one JSON line per board, shaped like the BoardSerializer payload
+    """
+    encoder = DjangoJSONEncoder()
+    for (board_id, title), rows in itertools.groupby(iter_rows(boards), key=lambda row: row[:2]):
+        members = [
+            dict(zip(MEMBER_FIELDS, (member_id, username, score, user_id, board_id)))
+            for _, _, member_id, username, score, user_id in rows
+            if member_id is not None
+        ]
+        yield encoder.encode({'id': board_id, 'title': title, 'members': members}) + '\n'
+
+
+class Echo:
+    """
+    File-like object handing back what is written, for csv.writer to format a single line
+    """
+    def write(self, value):
+        return value
+
+
+def iter_csv(boards):
+    """
+    Yields a header, then one CSV line per member
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in iter_rows(boards):
+        yield writer.writerow(['' if value is None else value for value in row])
@@ -0,0 +1,83 @@
+"""
+Hand-written equivalents of the serializers on the hot read paths
+
+They build plain dicts straight from values_list() querysets, skipping model instances and
+DRF fields. Their output must stay exactly that of the serializers they stand for, keys
+order included : test_fast_serializers compares both.
+They are used when BOARDS_FAST_SERIALIZATION is on, along with renderers.FastJSONRenderer.
+Sparse fieldsets (see fieldsets.py) are honored the same way, only their columns being read.
+"""
+from .fieldsets import select, select_nested
+from .metrics import timed_serialization
+from .models import BoardMember
+
+
+# Fields of MemberSerializer, of BoardSerializer, and of the members nested in BoardSerializer
+MEMBER_FIELDS = ('id', 'board', 'user', 'username', 'score')
+BOARD_FIELDS = ('id', 'title', 'members')
+NESTED_MEMBER_FIELDS = ('id', 'username', 'score', 'user', 'board')
+
+COLUMNS = {'board': 'board_id', 'user': 'user_id'}
+
+
+def _columns(fields):
+    return [COLUMNS.get(name, name) for name in fields]
+
+
+def _dicts(rows, fields):
+    # Primary keys are represented as strings by UUIDField, related ids are left as UUIDs
+    if 'id' not in fields:
+        return [dict(zip(fields, row)) for row in rows]
+    position = fields.index('id')
+    return [dict(zip(fields, row), id=str(row[position])) for row in rows]
+
+
+@timed_serialization()
+def serialize_members(members, fieldset=None):
+    """
+    Equivalent of MemberSerializer(members, many=True).data
+    """
+    fields = select(fieldset, MEMBER_FIELDS)
+    return _dicts(members.values_list(*_columns(fields)), fields)
+
+
+def serialize_member(members, member_id, fieldset=None):
+    """
+    Equivalent of MemberSerializer(members.get(id=member_id)).data, None if there is no such member
+    """
+    member = serialize_members(members.filter(id=member_id), fieldset)
+    return member[0] if member else None
+
+
+@timed_serialization()
+def serialize_boards(boards, fieldset=None):
+    """
+    Equivalent of BoardSerializer(boards.prefetch_related(members_prefetch()), many=True).data,
+    in as many queries
+    """
+    fields = select(fieldset, BOARD_FIELDS, ('members',))
+    member_fields = select_nested(fieldset, 'members', NESTED_MEMBER_FIELDS)
+    board_fields = tuple(name for name in fields if name != 'members')
+    rows = list(boards.values_list('id', *board_fields))
+    payloads = _dicts([row[1:] for row in rows], board_fields)
+    if 'members' not in fields:
+        return payloads
+
+    members = {}
+    for (board_id, *_), payload in zip(rows, payloads):
+        payload['members'] = members[board_id] = []
+    if not members:
+        return payloads
+
+    queryset = BoardMember.objects.filter(board_id__in=list(members)).order_by('score', 'id')
+    if member_fields is None:
+        # Not expanded : ids only
+        for board_id, id in queryset.values_list('board_id', 'id'):
+            members[board_id].append(id)
+        return payloads
+
+    member_rows = list(queryset.values_list('board_id', *_columns(member_fields)))
+    member_payloads = _dicts([row[1:] for row in member_rows], member_fields)
+    for (board_id, *_), member in zip(member_rows, member_payloads):
+        members[board_id].append(member)
+    return payloads
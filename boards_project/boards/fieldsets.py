@@ -0,0 +1,100 @@
+"""
+Sparse fieldsets of the board payloads, requested with two query parameters :
+- `fields` : comma separated fields to return, relations' own fields being given as
+  `relation.field`, such as `fields=id,title,members.username,members.score`
+- `expand` : comma separated relations to nest. Relations returned but not expanded are
+  lists of ids. Asking for some fields of a relation expands it.
+
+Without either parameter, payloads are complete, relations nested.
+Only the columns of the fields returned are read from the database.
+"""
+from rest_framework.exceptions import ParseError
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class Fieldset:
+    """
+    The fields and expanded relations requested, see the module docstring
+    `fields` is None when every field is requested, `nested` maps relations to their
+    requested fields, all of them if missing
+    """
+
+    def __init__(self, fields=None, nested=None, expand=()):
+        self.fields = fields
+        self.nested = nested or {}
+        self.expand = set(expand) | set(self.nested)
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Returns the fieldset of a request, None if the payload is to be complete
+        The fieldset is parsed once per request
+        """
+        if not hasattr(request, '_fieldset'):
+            params = request.query_params
+            fieldset = None
+            if 'fields' in params or 'expand' in params:
+                fields, nested = None, {}
+                if 'fields' in params:
+                    fields = set()
+                    for name in _split(params['fields']):
+                        relation, _, field = name.partition('.')
+                        fields.add(relation)
+                        if field:
+                            nested.setdefault(relation, set()).add(field)
+                fieldset = cls(fields, nested, _split(params.get('expand', '')))
+            request._fieldset = fieldset
+        return request._fieldset
+
+    @property
+    def key(self):
+        """
+        Canonical form, to tell cached payloads apart
+        """
+        fields = '*' if self.fields is None else ','.join(sorted(self.fields))
+        nested = ','.join(sorted(f'{relation}.{field}' for relation, names in self.nested.items() for field in names))
+        return f'{fields};{nested};{",".join(sorted(self.expand))}'
+
+    def select(self, available, relations=()):
+        """
+        Returns the requested fields among `available`, in the order of `available`
+        Raises a ParseError on unknown fields, or on unknown relations to expand
+        """
+        requested = set(available) if self.fields is None else self.fields
+        unknown = (requested - set(available)) | (self.expand - set(relations))
+        if unknown:
+            raise ParseError(f'Unknown fields : {", ".join(sorted(unknown))}')
+        return tuple(name for name in available if name in requested)
+
+    def select_nested(self, relation, available):
+        """
+        Returns the requested fields of an expanded relation, in the order of `available`
+        """
+        requested = self.nested.get(relation)
+        if requested is None:
+            return tuple(available)
+        unknown = requested - set(available)
+        if unknown:
+            raise ParseError(f'Unknown fields : {", ".join(f"{relation}.{name}" for name in sorted(unknown))}')
+        return tuple(name for name in available if name in requested)
+
+
+def select(fieldset, available, relations=()):
+    """
+    Fieldset.select, every field being returned without a fieldset
+    """
+    return tuple(available) if fieldset is None else fieldset.select(available, relations)
+
+
+def select_nested(fieldset, relation, available):
+    """
+    The requested fields of a relation, None if it is returned as ids
+    """
+    if fieldset is None:
+        return tuple(available)
+    if relation not in fieldset.expand:
+        return None
+    return fieldset.select_nested(relation, available)
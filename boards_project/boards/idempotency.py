@@ -0,0 +1,141 @@
+"""
+Idempotency keys for the requests changing boards and members
+
+A client retrying a request sends the same `Idempotency-Key` header as the first attempt :
+the first response is stored in the shared cache (see cache.py), keyed by user and key, for
+IDEMPOTENCY_KEY_TIMEOUT seconds, and replayed to the retries without executing the view again.
+While the first attempt is running, retries are answered with a 409, and a key reused for a
+different request with a 422. Server errors are not stored, so that they can be retried.
+The key is locked by a running attempt for IDEMPOTENCY_LOCK_TIMEOUT seconds at most, so that
+the attempts abandoned by a worker killed or timed out can be retried soon after.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .cache import get_cache
+
+
+IDEMPOTENCY_KEY = 'idempotency:{user_id}:{digest}'
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+# Headers of the first response which are replayed along with its data
+REPLAYED_HEADERS = ('ETag', 'Location')
+
+IN_PROGRESS = 'in progress'
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still in progress'
+    default_code = 'request_in_progress'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """
+    Raised instead of executing a request already answered, with the response to send again
+    """
+    def __init__(self, response):
+        self.response = response
+
+
+class Attempt:
+    """
+    The execution of a request carrying an idempotency key, whose response is to be stored
+    """
+    def __init__(self, key, fingerprint):
+        self.key = key
+        self.fingerprint = fingerprint
+
+    def finish(self, response):
+        if response.status_code >= 500:
+            self.abort()
+            return
+        stored = {
+            'fingerprint': self.fingerprint,
+            'status': response.status_code,
+            'data': getattr(response, 'data', None),
+            'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+        }
+        get_cache().set(self.key, stored, settings.IDEMPOTENCY_KEY_TIMEOUT)
+
+    def abort(self):
+        get_cache().delete(self.key)
+
+
+def get_fingerprint(request):
+    content = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.get_full_path()} {content}'.encode()).hexdigest()
+
+
+def begin(request):
+    """
+    Returns the Attempt of a request carrying an idempotency key, None for the other ones.
+    Raises Replay if the request was already answered, RequestInProgress or KeyReused.
+    """
+    key = request.META.get(HEADER)
+    if not key or request.method in SAFE_METHODS:
+        return None
+
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    cache_key = IDEMPOTENCY_KEY.format(user_id=request.user.pk, digest=digest)
+    fingerprint = get_fingerprint(request)
+    cache = get_cache()
+    # add() is atomic : of concurrent attempts, only one gets to run
+    if cache.add(cache_key, IN_PROGRESS, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+        return Attempt(cache_key, fingerprint)
+
+    stored = cache.get(cache_key)
+    if stored is None:
+        # Expired or evicted just now
+        cache.set(cache_key, IN_PROGRESS, settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        return Attempt(cache_key, fingerprint)
+    if stored == IN_PROGRESS:
+        raise RequestInProgress()
+    if stored['fingerprint'] != fingerprint:
+        raise KeyReused()
+    response = Response(stored['data'], status=stored['status'], headers=stored['headers'])
+    response['Idempotent-Replayed'] = 'true'
+    raise Replay(response)
+
+
+class IdempotentMixin:
+    """
+    Honors the Idempotency-Key header of the requests changing data, once the user is
+    authenticated and allowed to make the request
+    """
+    idempotency = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.idempotency = begin(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled, the request may be retried
+            if self.idempotency is not None:
+                self.idempotency.abort()
+                self.idempotency = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency is not None:
+            self.idempotency.finish(response)
+            self.idempotency = None
+        return response
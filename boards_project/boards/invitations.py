@@ -0,0 +1,37 @@
+"""
+Invitations sent to the people added to a board by an email matching no user yet
+
+They are sent by the jobs workers (see jobs.py), so that board creation does not wait for SMTP.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from . import jobs
+
+
+SUBJECT = '{inviter} invited you to {board_title}'
+MESSAGE = (
+    'Hello,\n\n'
+    '{inviter} added you to the board "{board_title}".\n'
+    'Sign up with this email address to join it.\n'
+)
+
+
+@jobs.job
+def send_invitation(email, board_title, inviter):
+    context = {'board_title': board_title, 'inviter': inviter}
+    send_mail(
+        SUBJECT.format(**context),
+        MESSAGE.format(**context),
+        settings.DEFAULT_FROM_EMAIL,
+        [email],
+    )
+
+
+def invite(emails, board_title, inviter):
+    """
+    Enqueues the invitations of a board, once its creation is committed : one job per email,
+    so that each one is retried on its own
+    """
+    for email in emails:
+        jobs.enqueue_on_commit(send_invitation, email, board_title, inviter)
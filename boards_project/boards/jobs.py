@@ -0,0 +1,223 @@
+"""
+Background jobs, stored in the database and run by the run_jobs worker command
+
+Functions decorated with @job are enqueued with their JSON serializable arguments, from the
+request path or anywhere else, and called later by a worker, out of the request latency.
+A failing job is retried up to JOBS_MAX_ATTEMPTS times, with an exponential backoff.
+
+Workers claim the jobs due by batches (SELECT ... FOR UPDATE SKIP LOCKED where supported,
+so that many workers can run at once), run them in a pool of threads or processes, then
+record the outcomes of the whole batch : the queue costs a few queries per batch, not per job.
+The jobs of a worker which died are requeued once JOBS_LOCK_TIMEOUT has passed.
+"""
+from concurrent import futures
+import datetime
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+def job(func=None, max_attempts=None):
+    """
+    Decorator marking a function as a job, which can then be enqueued.
+    `max_attempts` overrides JOBS_MAX_ATTEMPTS for this job.
+    """
+    if func is None:
+        return lambda func: job(func, max_attempts)
+    func.job_name = f'{func.__module__}.{func.__qualname__}'
+    func.max_attempts = max_attempts
+    return func
+
+
+def _new_job(func, args, kwargs):
+    if not hasattr(func, 'job_name'):
+        raise ValueError(f'{func} is not a job, see the @job decorator')
+    return Job(
+        name=func.job_name,
+        arguments=json.dumps([list(args), kwargs]),
+        max_attempts=func.max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Enqueues a call of a job. Within a transaction, the job only becomes visible to the
+    workers when it is committed.
+    """
+    job = _new_job(func, args, kwargs)
+    job.save()
+    return job
+
+
+def enqueue_many(func, arguments):
+    """
+    Enqueues many calls of a job with a single INSERT, for fan-outs.
+    `arguments` holds the args tuple of each call.
+    """
+    return Job.objects.bulk_create([_new_job(func, args, {}) for args in arguments])
+
+
+def enqueue_on_commit(func, *args, **kwargs):
+    """
+    Enqueues a call of a job once the current transaction is committed (right away outside
+    of one), so that nothing is enqueued for a transaction rolled back, nor written to the
+    queue while the transaction holds its locks
+    """
+    _new_job(func, args, kwargs)  # Fails early on functions which are not jobs
+    transaction.on_commit(lambda: enqueue(func, *args, **kwargs))
+
+
+def retry_delay(attempts):
+    """
+    Seconds before the next attempt of a job which failed `attempts` times
+    """
+    return min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_MAX_RETRY_DELAY)
+
+
+def claim(batch_size):
+    """
+    Marks the next `batch_size` jobs due as running and returns them, their attempts counted
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status=Job.PENDING, run_at__lte=now).order_by('run_at', 'id')
+        jobs = list(due.select_for_update(skip_locked=True)[:batch_size])
+        if jobs:
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=Job.RUNNING, locked_at=now, attempts=models.F('attempts') + 1
+            )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def requeue_stale():
+    """
+    Requeues the jobs claimed more than JOBS_LOCK_TIMEOUT seconds ago, whose worker presumably
+    died, or fails them if they have no attempt left. Returns the number of jobs requeued.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - datetime.timedelta(seconds=settings.JOBS_LOCK_TIMEOUT),
+    )
+    stale.filter(attempts__gte=models.F('max_attempts')).update(
+        status=Job.FAILED, last_error='Lock timeout, no attempt left'
+    )
+    return stale.update(status=Job.PENDING)
+
+
+def finish(done, failed):
+    """
+    Records the outcomes of a batch : deletes the `done` jobs, and retries or fails the
+    `failed` ones, given as (job, error) pairs
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if done:
+            Job.objects.filter(id__in=[job.id for job in done]).delete()
+        for job, error in failed:
+            if job.attempts < job.max_attempts:
+                values = {'status': Job.PENDING, 'run_at': now + datetime.timedelta(seconds=retry_delay(job.attempts))}
+            else:
+                values = {'status': Job.FAILED}
+            Job.objects.filter(id=job.id).update(last_error=error, locked_at=None, **values)
+
+
+def execute(name, arguments):
+    """
+    Calls a job, in a thread or in a process of the pool
+    """
+    func = import_string(name)
+    if getattr(func, 'job_name', None) != name:
+        raise ValueError(f'{name} is not a job')
+    args, kwargs = json.loads(arguments)
+    try:
+        func(*args, **kwargs)
+    finally:
+        # Jobs using the database leave their connection open, within the limits of CONN_MAX_AGE
+        close_old_connections()
+
+
+class Worker:
+    """
+    Runs the jobs due by batches of `batch_size`, in a pool of `concurrency` threads or processes.
+    Processes are spawned, not forked, so that they do not share the database connections of the
+    worker : they set Django up again, and are meant for CPU bound jobs.
+    """
+
+    def __init__(self, concurrency=None, pool=None, batch_size=None, poll_interval=None):
+        self.concurrency = concurrency or settings.JOBS_CONCURRENCY
+        self.pool = pool or settings.JOBS_POOL
+        self.batch_size = batch_size or settings.JOBS_BATCH_SIZE
+        self.poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.done = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+
+    def executor(self):
+        if self.pool == PROCESS:
+            return futures.ProcessPoolExecutor(
+                self.concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+            )
+        return futures.ThreadPoolExecutor(self.concurrency, thread_name_prefix='job')
+
+    def stop(self):
+        """
+        Stops the worker once its current batch is done
+        """
+        self._stopping.set()
+
+    def run_batch(self, executor):
+        """
+        Runs one batch of jobs, returns how many
+        """
+        jobs = claim(self.batch_size)
+        running = {executor.submit(execute, job.name, job.arguments): job for job in jobs}
+        done, failed = [], []
+        for future in futures.as_completed(running):
+            job = running[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning('Job %s failed (attempt %s of %s)', job.name, job.attempts, job.max_attempts,
+                               exc_info=True)
+                failed.append((job, ''.join(traceback.format_exception(type(e), e, e.__traceback__))))
+            else:
+                done.append(job)
+        finish(done, failed)
+        self.done += len(done)
+        self.failed += len(failed)
+        return len(jobs)
+
+    def run(self, once=False):
+        """
+        Runs jobs until stopped, or with `once` until no job is due
+        """
+        last_requeue = 0
+        with self.executor() as executor:
+            while not self._stopping.is_set():
+                if time.monotonic() - last_requeue > settings.JOBS_LOCK_TIMEOUT / 2:
+                    requeue_stale()
+                    last_requeue = time.monotonic()
+                if self.run_batch(executor):
+                    continue
+                if once:
+                    break
+                self._stopping.wait(self.poll_interval)
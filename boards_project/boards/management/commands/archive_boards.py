@@ -0,0 +1,54 @@
+import datetime
+import json
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from boards import archive, benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the boards not modified for a while out of the boards and members tables, '
+        'into the archive they are served and restored from'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inactive-days', type=int, default=settings.ARCHIVE_INACTIVE_DAYS,
+            help='Archives the boards not modified for that many days',
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE, help='Boards archived at once')
+        parser.add_argument('--dry-run', action='store_true', help='Only counts the boards to archive')
+        parser.add_argument(
+            '--report', action='store_true',
+            help='Writes the size of the tables and the latency of the hot queries, before and after, as JSON',
+        )
+        parser.add_argument('--iterations', type=int, default=200, help='Timed queries of the report')
+
+    def handle(self, *args, **options):
+        if options['inactive_days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--inactive-days must be positive, --batch-size at least 1')
+        inactive_since = timezone.now() - datetime.timedelta(days=options['inactive_days'])
+
+        if options['dry_run']:
+            count = archive.get_candidates(inactive_since).count()
+            self.stdout.write(self.style.SUCCESS(f'{count} boards to archive'))
+            return
+
+        if options['report']:
+            report = {'inactive_days': options['inactive_days'], 'before': self.measure(options['iterations'])}
+        boards, members = archive.archive_boards(inactive_since, options['batch_size'])
+        if options['report']:
+            report.update(archived={'boards': boards, 'members': members}, after=self.measure(options['iterations']))
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Archived {boards} boards and {members} members'))
+
+    def measure(self, iterations):
+        return {
+            'tables': archive.table_sizes(),
+            'latency_us': benchmarks.measure_hot_queries(iterations, random.Random(0)),
+        }
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from boards import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every API route at several data sizes, on a throwaway test database, '
+        'and writes a JSON report of latencies, query counts and allocations'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma separated numbers of boards')
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per route and size')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per route and size')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+        parser.add_argument('--output', default=None, help='Report file, standard output by default')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma separated integers')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = benchmarks.run(
+                sizes,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                log=lambda message: self.stderr.write(message),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boards.models import Board, members_aggregates, members_count, recompute_aggregates
+
+
+AGGREGATES = ('members_count', 'min_score', 'max_score', 'next_member_id', 'next_username')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the members aggregates stored on boards with their members, '
+        'and recomputes those which drifted'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only reports drift, failing if there is any')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Boards read and fixed at once')
+
+    def handle(self, *args, **options):
+        actual = dict(members_aggregates(), members_count=members_count())
+        boards = Board.objects.annotate(**{f'actual_{name}': expression for name, expression in actual.items()})
+        rows = boards.values_list(
+            'id', *AGGREGATES, *(f'actual_{name}' for name in AGGREGATES)
+        ).order_by().iterator(chunk_size=options['batch_size'])
+
+        drifted = []
+        checked = 0
+        for board_id, *values in rows:
+            checked += 1
+            if values[:len(AGGREGATES)] != values[len(AGGREGATES):]:
+                drifted.append(board_id)
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'Checked {checked} boards, {len(drifted)} drifted')
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} boards, none drifted'))
+            return
+
+        for start in range(0, len(drifted), options['batch_size']):
+            recompute_aggregates(drifted[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} boards, recomputed {len(drifted)} which drifted'))
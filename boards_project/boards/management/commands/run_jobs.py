@@ -0,0 +1,40 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from boards import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs the background jobs (see boards/jobs.py) until stopped by SIGINT or SIGTERM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pool', choices=(jobs.THREAD, jobs.PROCESS), help='Runs jobs in threads or processes')
+        parser.add_argument('--concurrency', type=int, help='Number of jobs run at once')
+        parser.add_argument('--batch-size', type=int, help='Number of jobs claimed at once')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls while no job is due')
+        parser.add_argument('--once', action='store_true', help='Exits once no job is due')
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(
+            concurrency=options['concurrency'],
+            pool=options['pool'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
+        # The current batch is finished before exiting
+        handlers = {signum: signal.signal(signum, lambda *args: worker.stop()) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        self.stdout.write(f'Running jobs in {worker.concurrency} {worker.pool}s')
+        start = time.monotonic()
+        try:
+            worker.run(once=options['once'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{worker.done} jobs done, {worker.failed} failed, in {elapsed:.1f}s '
+            f'({worker.done / elapsed if elapsed else 0:.0f} jobs/s)'
+        ))
@@ -0,0 +1,40 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from boards import seeding
+
+
+class Command(BaseCommand):
+    help = 'Seeds users, boards and members with realistic scores, for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--boards', type=int, default=1000, help='Number of boards to create')
+        parser.add_argument('--members', default='2:12', help='Range of the number of members per board, as min:max')
+        parser.add_argument('--idle', type=float, default=0, help='Fraction of the boards gone idle, within a year')
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the random generator')
+        parser.add_argument('--password', default=seeding.DEFAULT_PASSWORD, help='Password of the users created')
+
+    def handle(self, *args, **options):
+        try:
+            members = tuple(int(value) for value in options['members'].split(':'))
+            assert len(members) == 2 and 0 <= members[0] <= members[1]
+        except (ValueError, AssertionError):
+            raise CommandError('--members must be a range such as 2:12')
+
+        if not 0 <= options['idle'] <= 1:
+            raise CommandError('--idle must be between 0 and 1')
+
+        rng = random.Random(options['seed'])
+        seeding.seed_users(options['users'], password=options['password'])
+        users = list(seeding.get_seed_users())
+        if options['boards'] and not users:
+            raise CommandError('No user to add to the boards')
+
+        members_count = seeding.seed_boards(
+            options['boards'], users, members=members, idle=options['idle'], rng=rng
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {options['users']} users, {options['boards']} boards and {members_count} members"
+        ))
@@ -0,0 +1,182 @@
+"""
+Per-request instrumentation : total time, time spent in the database, number of queries
+(and how many of them repeat a statement already run by the request, the usual sign of
+an N+1), and time spent serializing.
+
+RequestMetricsMiddleware measures every request, sends the timings back in a
+`Server-Timing` header, logs the requests slower than SLOW_REQUEST_THRESHOLD_MS, and adds
+them to per-route histograms kept by the process, served by MetricsView.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """
+    Measures of a single request, in seconds
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0
+        self.db = 0
+        self.serialize = 0
+        self.statements = {}
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return self.queries - len(self.statements)
+
+    def execute(self, execute, sql, params, many, context):
+        # Installed as a database execute wrapper (see RequestMetricsMiddleware)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def server_timing(self):
+        return ', '.join((
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+        ))
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'db_ms': round(self.db * 1000, 1),
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            'serialize_ms': round(self.serialize * 1000, 1),
+        }
+
+
+@contextlib.contextmanager
+def timed_serialization():
+    """
+    Adds the time spent in the block to the serialization time of the current request, if any
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize += time.perf_counter() - start
+
+
+def get_route(request, response):
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else f'<{response.status_code}>'
+    return f'{request.method} {route}'
+
+
+def record(route, metrics):
+    total_ms = metrics.total * 1000
+    with _routes_lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = {
+                'count': 0,
+                'total_ms': 0,
+                'db_ms': 0,
+                'queries': 0,
+                'duplicates': 0,
+                'serialize_ms': 0,
+                'buckets': [0] * len(BUCKETS),
+            }
+        stats['count'] += 1
+        stats['total_ms'] += total_ms
+        stats['db_ms'] += metrics.db * 1000
+        stats['queries'] += metrics.queries
+        stats['duplicates'] += metrics.duplicates
+        stats['serialize_ms'] += metrics.serialize * 1000
+        for i, bound in enumerate(BUCKETS):
+            if total_ms <= bound:
+                stats['buckets'][i] += 1
+                break
+
+
+def get_routes():
+    """
+    Returns the histogram and the totals of each route measured by this process
+    """
+    with _routes_lock:
+        routes = {route: dict(stats, buckets=list(stats['buckets'])) for route, stats in _routes.items()}
+
+    for stats in routes.values():
+        stats['buckets'] = [
+            {'le': 'inf' if bound == float('inf') else bound, 'count': count}
+            for bound, count in zip(BUCKETS, stats['buckets'])
+        ]
+        for name in ('total_ms', 'db_ms', 'serialize_ms'):
+            stats[name] = round(stats[name], 1)
+    return routes
+
+
+def reset_routes():
+    with _routes_lock:
+        _routes.clear()
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures requests, see the module docstring. To be placed first, so that the other
+    middlewares are measured as well.
+    Streamed responses are measured until they start streaming.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.finish()
+
+        response['Server-Timing'] = metrics.server_timing()
+        route = get_route(request, response)
+        record(route, metrics)
+        if metrics.total * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            values = dict(route=route, status=response.status_code, **metrics.as_dict())
+            logger.warning(
+                'Slow request %s', ' '.join(
+                    f'{name}="{value}"' if isinstance(value, str) else f'{name}={value}'
+                    for name, value in values.items()
+                ),
+                extra={'request_metrics': values},
+            )
+        return response
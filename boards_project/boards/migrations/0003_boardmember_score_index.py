@@ -0,0 +1,17 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0002_auto_20190820_1352'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boardmember',
+            index=models.Index(fields=['board', 'score', 'id'], name='boards_member_board_score_idx'),
+        ),
+    ]
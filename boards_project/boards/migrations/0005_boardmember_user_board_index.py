@@ -0,0 +1,17 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0004_board_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boardmember',
+            index=models.Index(fields=['user', 'board'], name='boards_member_user_board_idx'),
+        ),
+    ]
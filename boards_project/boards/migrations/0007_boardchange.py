@@ -0,0 +1,34 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0006_board_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('board', 'Board'), ('member', 'Member')], max_length=8)),
+                ('object_id', models.UUIDField()),
+                ('board_id', models.UUIDField()),
+                ('user_id', models.UUIDField(null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='boardchange',
+            index=models.Index(fields=['board_id', 'id'], name='boards_change_board_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boardchange',
+            index=models.Index(fields=['user_id', 'id'], name='boards_change_user_idx'),
+        ),
+    ]
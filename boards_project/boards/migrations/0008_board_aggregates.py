@@ -0,0 +1,56 @@
+# Generated by Django 2.2.8 on 2026-10-18 09:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def compute_aggregates(apps, schema_editor):
+    Board = apps.get_model('boards', 'Board')
+    BoardMember = apps.get_model('boards', 'BoardMember')
+    members = BoardMember.objects.filter(board=OuterRef('pk'))
+    first = members.order_by('score', 'id')
+    counts = members.order_by().values('board').annotate(count=Count('*')).values('count')
+    Board.objects.update(
+        members_count=Coalesce(Subquery(counts), 0),
+        min_score=Subquery(first.values('score')[:1]),
+        max_score=Subquery(members.order_by('-score').values('score')[:1]),
+        next_member_id=Subquery(first.values('id')[:1]),
+        next_username=Subquery(first.values('username')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0007_boardchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='max_score',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='members_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='min_score',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='next_member_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='next_username',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(compute_aggregates, migrations.RunPython.noop),
+    ]
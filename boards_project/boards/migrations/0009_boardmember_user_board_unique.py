@@ -0,0 +1,64 @@
+# Generated by Django 2.2.8 on 2026-10-18 09:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keeps one member per user and board, the one with the lowest id, before the constraint is added.
+    Removed members leave a tombstone in the changes feed, and the aggregates of their boards are recomputed.
+    """
+    Board = apps.get_model('boards', 'Board')
+    BoardMember = apps.get_model('boards', 'BoardMember')
+    BoardChange = apps.get_model('boards', 'BoardChange')
+
+    duplicated = (
+        BoardMember.objects.values('user', 'board')
+        .annotate(count=Count('*'))
+        .filter(count__gt=1)
+    )
+    board_ids = set()
+    for group in duplicated:
+        members = BoardMember.objects.filter(user=group['user'], board=group['board'])
+        removed = list(members.order_by('id').values_list('id', flat=True))[1:]
+        BoardChange.objects.bulk_create([
+            BoardChange(kind='member', object_id=member_id, board_id=group['board'], user_id=group['user'], deleted=True)
+            for member_id in removed
+        ])
+        BoardMember.objects.filter(id__in=removed).delete()
+        board_ids.add(group['board'])
+    if not board_ids:
+        return
+
+    members = BoardMember.objects.filter(board=OuterRef('pk'))
+    first = members.order_by('score', 'id')
+    counts = members.order_by().values('board').annotate(count=Count('*')).values('count')
+    Board.objects.filter(id__in=board_ids).update(
+        members_count=Coalesce(Subquery(counts), 0),
+        min_score=Subquery(first.values('score')[:1]),
+        max_score=Subquery(members.order_by('-score').values('score')[:1]),
+        next_member_id=Subquery(first.values('id')[:1]),
+        next_username=Subquery(first.values('username')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0008_board_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        # Its index replaces the (user, board) one
+        migrations.AddConstraint(
+            model_name='boardmember',
+            constraint=models.UniqueConstraint(fields=('user', 'board'), name='boards_member_user_board_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='boardmember',
+            name='boards_member_user_board_idx',
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.8 on 2026-10-18 10:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBoard',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=256)),
+                ('version', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField()),
+                ('members_count', models.PositiveIntegerField()),
+                ('min_score', models.IntegerField(null=True)),
+                ('max_score', models.IntegerField(null=True)),
+                ('next_member_id', models.UUIDField(null=True)),
+                ('next_username', models.CharField(max_length=32, null=True)),
+                ('members_data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('users', models.ManyToManyField(related_name='archived_boards', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,12 +1,19 @@
 # Core imports
 import datetime
+import json
 import uuid
+import zlib
 
 # Django dependencies
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from . import cache, events, ranks
+
 
 class AppUser(AbstractUser):
     """
@@ -23,6 +30,12 @@ class AppUser(AbstractUser):
         return f"{self.email}"
 
 
+class MemberAlreadyExists(Exception):
+    """
+    Raised when adding a member for a user who already is a member of the board
+    """
+
+
 class BoardMember(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     username = models.CharField(max_length=32)
@@ -30,6 +43,16 @@ class BoardMember(models.Model):
     user = models.ForeignKey('boards.AppUser', on_delete=models.CASCADE, related_name='memberships')
     board = models.ForeignKey('boards.Board', on_delete=models.CASCADE, related_name='members')
 
+    class Meta:
+        indexes = [
+            # Serves the leaderboard ordering, its keyset pagination and rank counts
+            models.Index(fields=['board', 'score', 'id'], name='boards_member_board_score_idx'),
+        ]
+        constraints = [
+            # A user is a member of a board once. Its index serves the membership checks of IsBoardMember
+            models.UniqueConstraint(fields=['user', 'board'], name='boards_member_user_board_uniq'),
+        ]
+
     def __str__(self):
         return f'{self.username} ({self.user.email})'
 
@@ -40,38 +63,485 @@ class Board(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=256)
+    # Bumped on every change of the board or of its members, see board_modified
+    version = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True, editable=False)
+    # Aggregates of the members, kept up to date along with the version (see boards_modified)
+    # The next member is the first one in the leaderboard
+    members_count = models.PositiveIntegerField(default=0, editable=False)
+    min_score = models.IntegerField(null=True, editable=False)
+    max_score = models.IntegerField(null=True, editable=False)
+    next_member_id = models.UUIDField(null=True, editable=False)
+    next_username = models.CharField(max_length=32, null=True, editable=False)
 
-    def add_member(self, member_username, user_id, score=None):
-        user = AppUser.objects.get(id=user_id)
+    # Fields only ever set in the database
+    MAINTAINED_FIELDS = (
+        'version', 'updated_at', 'members_count', 'min_score', 'max_score', 'next_member_id', 'next_username',
+    )
+    # Set on the boards read from the archive, which are not in the table (see ArchivedBoard.get_board)
+    archived = False
 
-        if self.members.filter(user=user).exists():
-            raise Exception(f'User {user} already exists in this board')
+    def add_member(self, member_username, user_id, score=None, upsert=False):
+        """
+        Adds a member to the board. If the user already is a member, raises MemberAlreadyExists,
+        or with `upsert` updates the username and score of the existing member and returns it.
+        Duplicates are caught by the (user, board) unique constraint, so that concurrent adds
+        of the same user cannot both succeed.
+        """
+        user = AppUser.objects.get(id=user_id)
 
         if score is None:
             score = int(datetime.datetime.utcnow().timestamp())
-        
-        member = BoardMember.objects.create(
-            username = member_username,
-            score = score,
-            user = user,
-            board = self
+
+        try:
+            with transaction.atomic():
+                member = BoardMember.objects.create(
+                    username = member_username,
+                    score = score,
+                    user = user,
+                    board = self
+                )
+                ranks.members_changed(self, [(member.id, member.score)])
+                return member
+        except IntegrityError:
+            existing = self.members.filter(user=user).values_list('id', flat=True).first()
+            if existing is None:
+                raise
+        if not upsert:
+            raise MemberAlreadyExists(f'User {user} already exists in this board')
+        return self.update_member(existing, username=member_username, score=score)
+
+    @transaction.atomic
+    def add_members(self, members_data):
+        """
+        Bulk version of add_member, used when a board is created with many people at once.
+        Each item of members_data holds either a `user` id or an `email`, and optionally
+        a `username` and a `score`.
+
+        Users are resolved with a single query, emails being matched case insensitively,
+        duplicates are checked with a single query and the members are inserted with one
+        bulk_create, their scores already set. Items matching no AppUser are skipped.
+        """
+        user_ids = [str(item['user']) for item in members_data if item.get('user')]
+        emails = [item['email'].lower() for item in members_data if item.get('email')]
+        users = AppUser.objects.annotate(email_lower=Lower('email')).filter(
+            Q(id__in=user_ids) | Q(email_lower__in=emails)
         )
-        self.members.add(member)
-        return member
+        users_by_id = {str(user.id): user for user in users}
+        users_by_email = {user.email.lower(): user for user in users_by_id.values()}
 
+        default_score = int(datetime.datetime.utcnow().timestamp())
+        members = []
+        for item in members_data:
+            if item.get('user'):
+                user = users_by_id.get(str(item['user']))
+            else:
+                user = users_by_email.get((item.get('email') or '').lower())
+            if user is None:
+                continue
+
+            score = item.get('score')
+            members.append(BoardMember(
+                username = item.get('username') or user.username,
+                score = default_score if score is None else score,
+                user = user,
+                board = self
+            ))
+
+        new_user_ids = [member.user_id for member in members]
+        if len(set(new_user_ids)) != len(new_user_ids):
+            raise MemberAlreadyExists('The same user is provided more than once')
+
+        existing = self.members.filter(user_id__in=new_user_ids).values_list('user__email', flat=True)
+        if existing:
+            raise MemberAlreadyExists(f'Users {", ".join(existing)} already exist in this board')
+
+        # Users added concurrently since the check make it fail on the unique constraint
+        members = BoardMember.objects.bulk_create(members)
+        # bulk_create does not send post_save signals
+        board_modified(self.id, members_added=len(members), members_changed=True)
+        BoardChange.objects.bulk_create(
+            [BoardChange.for_member(member) for member in members]
+            + [BoardChange.for_new_member(member) for member in members]
+        )
+        ranks.members_changed(self, [(member.id, member.score) for member in members])
+        for member in members:
+            events.member_changed(member, events.MEMBER_ADDED)
+        for user_id in new_user_ids:
+            cache.invalidate_user(user_id)
+        return members
+
+    @transaction.atomic
     def remove_member(self, member_id):
         member = self.members.get(id=member_id)
         id = member.id
         member.delete()
+        ranks.member_removed(self, id)
         return id
 
     def reset_score(self, member_id, score=None):
-        member = self.members.get(id=member_id)
         if score is None:
             score = int(datetime.datetime.utcnow().timestamp())
-        member.score = score
-        member.save()
+        return self.update_member(member_id, score=score)
+
+    @transaction.atomic
+    def update_member(self, member_id, **values):
+        """
+        Updates the given fields of a member with a single UPDATE statement, then returns it.
+        Values may be expressions computed by the database, such as F('score') + 10,
+        so that concurrent updates of a member never get lost.
+        """
+        if not self.members.filter(id=member_id).update(**values):
+            raise BoardMember.DoesNotExist('BoardMember matching query does not exist.')
+        # update() does not send post_save signals
+        board_modified(self.id, members_changed=True)
+        # Still within the transaction, so no other update of the row can have happened since ours
+        member = self.members.get(id=member_id)
+        BoardChange.for_member(member).save()
+        ranks.members_changed(self, [(member.id, member.score)])
+        events.member_changed(member, events.MEMBER_UPDATED)
         return member
 
+    @transaction.atomic
+    def take_turn(self, score=None, delta=None):
+        """
+        Takes the turn of the next member : their score is set to `score`, adjusted by `delta`,
+        or reset to now by default. Returns the member, None if the board has none.
+        The next member is locked with SKIP LOCKED where supported : concurrent calls take
+        the following members instead of waiting for this one, and never get the same.
+        """
+        member = self.leaderboard().select_for_update(skip_locked=True).first()
+        if member is None:
+            return None
+        if delta is not None:
+            return self.update_member(member.id, score=models.F('score') + delta)
+        return self.reset_score(member.id, score)
+
+    def leaderboard(self, after=None):
+        """
+        Returns the board members ordered by score, the next one to pay first.
+        Ties are broken by id so the ordering is total, which allows keyset pagination :
+        `after` is the (score, id) pair of the last member of the previous page.
+        Filtering and ordering are both served by the (board, score, id) index.
+        """
+        members = self.members.order_by('score', 'id')
+        if after is not None:
+            score, member_id = after
+            members = members.filter(score__gte=score).filter(
+                Q(score__gt=score) | Q(score=score, id__gt=member_id)
+            )
+        return members
+
+    def members_ahead_of(self, member):
+        """
+        Returns the members placed before `member` in the leaderboard
+        """
+        return self.members.filter(score__lte=member.score).filter(
+            Q(score__lt=member.score) | Q(score=member.score, id__lt=member.id)
+        )
+
+    def get_rank(self, member_id):
+        """
+        Returns a member along with its 1-based rank in the leaderboard, from the in-memory
+        index of the board if it has one (see ranks.py)
+        """
+        member = self.members.get(id=member_id)
+        index = ranks.get_index(self)
+        rank = index and index.rank(member.id, member.score)
+        if rank is None:
+            rank = self.members_ahead_of(member).count() + 1
+        return member, rank
+
+    def get_neighbours(self, member, count):
+        """
+        Returns the `count` members placed just before `member` in the leaderboard and the
+        `count` placed just after it, in the leaderboard order
+        """
+        index = ranks.get_index(self)
+        around = index and index.around(member.id, member.score, count)
+        if around is None:
+            before = list(self.members_ahead_of(member).order_by('-score', '-id')[:count])[::-1]
+            after = list(self.leaderboard((member.score, member.id))[:count])
+            return before, after
+        members = self.members.in_bulk([member_id for _, member_id in around[0] + around[1]])
+        # Members removed since are skipped
+        return tuple(
+            [members[member_id] for _, member_id in side if member_id in members] for side in around
+        )
+
+    def save(self, *args, **kwargs):
+        # The version, update time and aggregates are only ever set in the database (see
+        # board_modified), saving an instance loaded before a change must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def etag(self):
+        return f'"{self.id}-{self.version}"'
+
     def __str__(self):
         return "-".join([self.title, str(self.id)])
+
+
+class BoardChange(models.Model):
+    """
+    Append-only log of the changes made to boards and members, read by the changes feed.
+    Its auto-incremented id is the cursor clients sync from.
+    Only ids are logged, so that deletions leave a tombstone : the feed reads the current
+    state of the objects inserted or updated. The deletion of a board leaves a tombstone for
+    each of its members' users, who are no longer members of it once it is gone, in place of
+    the tombstones of its members. Conversely, a member added to a board leaves a change of the
+    board for its user, to whom the feed sends the whole board, which they did not know of.
+    """
+    BOARD = 'board'
+    MEMBER = 'member'
+    KIND_CHOICES = (
+        (BOARD, 'Board'),
+        (MEMBER, 'Member'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    object_id = models.UUIDField()
+    board_id = models.UUIDField()
+    # The member's user, so that users are told about their own removal from a board
+    user_id = models.UUIDField(null=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['board_id', 'id'], name='boards_change_board_idx'),
+            models.Index(fields=['user_id', 'id'], name='boards_change_user_idx'),
+        ]
+
+    @classmethod
+    def for_member(cls, member, deleted=False):
+        return cls(kind=cls.MEMBER, object_id=member.id, board_id=member.board_id, user_id=member.user_id, deleted=deleted)
+
+    @classmethod
+    def for_new_member(cls, member):
+        return cls(kind=cls.BOARD, object_id=member.board_id, board_id=member.board_id, user_id=member.user_id)
+
+    @classmethod
+    def for_board(cls, board, deleted=False, user_id=None):
+        return cls(kind=cls.BOARD, object_id=board.id, board_id=board.id, user_id=user_id, deleted=deleted)
+
+
+class ArchivedBoard(models.Model):
+    """
+    A board gone idle, moved out of the hot tables by the archive_boards command (see archive.py).
+    It keeps the fields of the board, aggregates included, and its members in the leaderboard
+    order, as a compressed JSON list of [id, username, score, user id] rows.
+    Its users are kept in a table of their own, for the membership checks.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    title = models.CharField(max_length=256)
+    version = models.PositiveIntegerField()
+    updated_at = models.DateTimeField()
+    members_count = models.PositiveIntegerField()
+    min_score = models.IntegerField(null=True)
+    max_score = models.IntegerField(null=True)
+    next_member_id = models.UUIDField(null=True)
+    next_username = models.CharField(max_length=32, null=True)
+    members_data = models.BinaryField()
+    users = models.ManyToManyField('boards.AppUser', related_name='archived_boards')
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    # Fields copied from and to Board
+    BOARD_FIELDS = ('id', 'title') + Board.MAINTAINED_FIELDS
+
+    @staticmethod
+    def pack(members):
+        """
+        Compresses the (id, username, score, user id) rows of members
+        """
+        return zlib.compress(json.dumps([
+            [str(member_id), username, score, str(user_id)] for member_id, username, score, user_id in members
+        ], separators=(',', ':')).encode())
+
+    @classmethod
+    def for_board(cls, board, members):
+        """
+        Returns the archive of a board, given the (id, username, score, user id) rows of its
+        members in the leaderboard order
+        """
+        return cls(members_data=cls.pack(members), **{name: getattr(board, name) for name in cls.BOARD_FIELDS})
+
+    def set_members(self, members):
+        """
+        Replaces the members by the given BoardMember instances, in the leaderboard order,
+        and sets the aggregates accordingly (see members_aggregates)
+        """
+        self.members_data = self.pack(
+            (member.id, member.username, member.score, member.user_id) for member in members
+        )
+        self.members_count = len(members)
+        first, last = (members[0], members[-1]) if members else (None, None)
+        self.min_score = first and first.score
+        self.max_score = last and last.score
+        self.next_member_id = first and first.id
+        self.next_username = first and first.username
+
+    def get_members(self):
+        """
+        Returns the members, as unsaved BoardMember instances in the leaderboard order
+        """
+        return [
+            BoardMember(id=uuid.UUID(id), username=username, score=score, user_id=uuid.UUID(user_id), board_id=self.id)
+            for id, username, score, user_id in json.loads(zlib.decompress(bytes(self.members_data)))
+        ]
+
+    def get_board(self, members=True):
+        """
+        Returns the board, as an unsaved Board instance, with its members prefetched
+        (as by members_prefetch) so that it can be serialized without any query
+        """
+        board = Board(**{name: getattr(self, name) for name in self.BOARD_FIELDS})
+        board.archived = True
+        if members:
+            prefetched = BoardMember.objects.filter(board_id=self.id).order_by('score', 'id')
+            prefetched._result_cache = self.get_members()
+            prefetched._prefetch_done = True
+            board._prefetched_objects_cache = {'members': prefetched}
+        return board
+
+    def __str__(self):
+        return "-".join([self.title, str(self.id)])
+
+
+class Job(models.Model):
+    """
+    Background job, enqueued and run by the run_jobs worker (see jobs.py)
+    `name` is the dotted path of the function to call, with the JSON encoded [args, kwargs].
+    Done jobs are deleted, failed ones are kept for inspection.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=256)
+    arguments = models.TextField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    # Not run before, pushed back on each retry
+    run_at = models.DateTimeField(default=timezone.now)
+    # When a worker claimed it, to requeue the jobs of the workers which died meanwhile
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Serves the claims of the workers, the next jobs due first
+            models.Index(fields=['status', 'run_at', 'id'], name='boards_job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+def members_aggregates():
+    """
+    Expressions of the score extremes and of the next member of boards, for an UPDATE of
+    boards : each one is read from the (board, score, id) index, whatever the number of members
+    """
+    members = BoardMember.objects.filter(board=OuterRef('pk'))
+    first = members.order_by('score', 'id')
+    return {
+        'min_score': Subquery(first.values('score')[:1]),
+        'max_score': Subquery(members.order_by('-score').values('score')[:1]),
+        'next_member_id': Subquery(first.values('id')[:1]),
+        'next_username': Subquery(first.values('username')[:1]),
+    }
+
+
+def members_count():
+    """
+    Expression of the number of members of boards, counted, for an UPDATE of boards
+    """
+    counts = BoardMember.objects.filter(board=OuterRef('pk')).order_by().values('board').annotate(count=Count('*'))
+    return Coalesce(Subquery(counts.values('count')), 0)
+
+
+def board_modified(board_id, members_added=0, members_changed=False):
+    """
+    Called whenever a board or one of its members changes : bumps the board version,
+    which changes its ETag, stamps its update time and evicts its cached payloads.
+    When members changed, their aggregates are updated as well : members_added (negative
+    for removals) is added to the count, see members_aggregates for the others.
+    """
+    boards_modified([board_id], members_added, members_changed)
+
+
+def boards_modified(board_ids, members_added=0, members_changed=False):
+    """
+    board_modified for many boards at once, with a single UPDATE
+    """
+    values = {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+    if members_added:
+        values['members_count'] = models.F('members_count') + members_added
+    boards = Board.objects.filter(id__in=board_ids)
+    if not members_changed:
+        boards.update(**values)
+    else:
+        values.update(members_aggregates())
+        with transaction.atomic(savepoint=False):
+            # Under READ COMMITTED, an UPDATE waiting for a row lock still evaluates its subqueries
+            # on the snapshot taken before the wait : the boards are locked first, so that the
+            # aggregates are read once concurrent changes of their members are committed
+            if connection.features.has_select_for_update:
+                list(boards.order_by('id').select_for_update().values_list('id', flat=True))
+            boards.update(**values)
+    for board_id in board_ids:
+        cache.invalidate_board(board_id)
+
+
+@transaction.atomic
+def settle_scores(board_ids, member_ids=None, score=None, delta=None):
+    """
+    Settles a round on many boards at once, with a single UPDATE statement :
+    the score of every member of the boards (or only of the given members) is either
+    reset to `score`, or adjusted by `delta`. Without any of them, scores are reset to now.
+    Returns the number of members updated.
+    """
+    members = BoardMember.objects.filter(board_id__in=board_ids)
+    if member_ids is not None:
+        members = members.filter(id__in=member_ids)
+
+    if delta is not None:
+        count = members.update(score=models.F('score') + delta)
+    else:
+        if score is None:
+            score = int(datetime.datetime.utcnow().timestamp())
+        count = members.update(score=score)
+
+    # update() does not send post_save signals
+    boards_modified(board_ids, members_changed=True)
+    members = list(members.only('id', 'board_id', 'user_id', 'score'))
+    BoardChange.objects.bulk_create([BoardChange.for_member(member) for member in members])
+    scores = {}
+    for member in members:
+        scores.setdefault(member.board_id, []).append({'id': str(member.id), 'score': member.score})
+    for board_id, board_scores in scores.items():
+        events.publish(board_id, events.MEMBERS_SETTLED, members=board_scores)
+    return count
+
+
+def recompute_aggregates(board_ids):
+    """
+    Recomputes the members aggregates of boards from scratch, with a single UPDATE,
+    without bumping their version
+    """
+    return Board.objects.filter(id__in=board_ids).update(members_count=members_count(), **members_aggregates())
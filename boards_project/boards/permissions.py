@@ -1,8 +1,35 @@
 from rest_framework import permissions
-from boards.models import Board
+from boards.models import ArchivedBoard, Board, BoardMember
+from boards import cache
+
+
+def get_user_board_ids(user):
+    """
+    Returns the set of ids of the boards the user is a member of, archived ones included,
+    from the cache or from a single query on the (user, board) index and the archived users
+    """
+    return cache.get_or_set_user_board_ids(
+        user.id,
+        lambda: set(BoardMember.objects.filter(user=user).values_list('board_id', flat=True).union(
+            ArchivedBoard.users.through.objects.filter(appuser=user).values_list('archivedboard_id', flat=True)
+        )),
+    )
+
 
 class IsBoardMember(permissions.BasePermission):
+    """
+    Only lets the members of a board access it.
+    On routes nested under a board, this is checked before the view does anything else,
+    so denied requests never reach the queryset. Membership is tested against the cached
+    set of the user's board ids, whatever the number of members of the board.
+    """
+
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            return False
+        board_id = view.kwargs.get('board_id')
+        return board_id is None or board_id in get_user_board_ids(request.user)
 
     def has_object_permission(self, request, view, obj):
-        board = Board.objects.get(id=obj.board.id)
-        return request.parser_context['kwargs']['member_id'] in board.members.all()
\ No newline at end of file
+        board_id = obj.id if isinstance(obj, Board) else obj.board_id
+        return board_id in get_user_board_ids(request.user)
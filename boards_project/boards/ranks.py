@@ -0,0 +1,296 @@
+"""
+In-process sorted index of the scores of the largest boards, answering ranks in O(log n)
+
+Counting the members ahead of one (see Board.members_ahead_of) reads a range of the
+(board, score, id) index as long as the rank : on boards of many members, the ranks far down
+the leaderboard cost a scan each. Boards of at least RANK_INDEX_MIN_MEMBERS members get
+instead a sorted array of their members, in the leaderboard order, built lazily on the first
+rank asked : ranks, percentiles and neighbours are then found by bisection.
+
+Each entry packs the score and the id of a member into a single integer, ordered as the
+(score, id) pair, so that an index costs one list of integers and a dict of the scores.
+At most RANK_INDEX_MAX_MEMBERS members are held per process, the least recently used boards
+being evicted beyond.
+
+Indexes follow the version of their board (see board_modified). The changes made by
+Board.add_member(s), update_member (reset_score and take_turn included) and remove_member in
+this process are applied to the index once committed, along with the version they made.
+Any other change, by another process, a bulk update or the admin, leaves the index behind
+the version of the board : it is then rebuilt by the next query.
+"""
+import bisect
+import collections
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+
+ID_BITS = 128
+ID_MASK = (1 << ID_BITS) - 1
+# Scores are shifted to be positive, so that the packed keys sort as the (score, id) pairs
+SCORE_OFFSET = 1 << 63
+BUILD_ATTEMPTS = 3
+
+
+def pack(score, member_id):
+    return ((score + SCORE_OFFSET) << ID_BITS) | member_id.int
+
+
+def unpack(key):
+    return (key >> ID_BITS) - SCORE_OFFSET, uuid.UUID(int=key & ID_MASK)
+
+
+class ScoreIndex:
+    """
+    Members of a board in the leaderboard order, as of a version of the board.
+    A `version` of None marks an index which missed a change, to be rebuilt.
+    """
+
+    def __init__(self, board_id, version, members):
+        self.board_id = board_id
+        self.version = version
+        self.scores = {member_id: score for score, member_id in members}
+        self.keys = sorted(pack(score, member_id) for member_id, score in self.scores.items())
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _set(self, member_id, score):
+        self._discard(member_id)
+        self.scores[member_id] = score
+        bisect.insort(self.keys, pack(score, member_id))
+
+    def _discard(self, member_id):
+        score = self.scores.pop(member_id, None)
+        if score is not None:
+            del self.keys[bisect.bisect_left(self.keys, pack(score, member_id))]
+
+    def _position(self, member_id, score):
+        key = pack(score, member_id)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def apply(self, version, scores=(), removed=()):
+        """
+        Applies a change committed as `version` of the board : members set to the given
+        (id, score) pairs, members removed. The index stays current only if it was at the
+        previous version, otherwise a change was missed, or applied out of order.
+        """
+        with self._lock:
+            for member_id, score in scores:
+                self._set(member_id, score)
+            for member_id in removed:
+                self._discard(member_id)
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+            else:
+                self.version = None
+
+    def position(self, member_id, score):
+        """
+        Returns the 0-based position of a member of the given score, None if the index
+        does not hold it with this score
+        """
+        with self._lock:
+            return self._position(member_id, score)
+
+    def rank(self, member_id, score):
+        """
+        Returns the 1-based rank of a member in the leaderboard, None if unknown
+        """
+        position = self.position(member_id, score)
+        return None if position is None else position + 1
+
+    def percentile(self, member_id, score):
+        """
+        Returns the percentage of the members placed before a member, None if unknown
+        """
+        position = self.position(member_id, score)
+        return None if position is None else percentile(position + 1, len(self))
+
+    def around(self, member_id, score, count):
+        """
+        Returns the (score, id) pairs of the `count` members placed before a member and of the
+        `count` placed after it, None if unknown
+        """
+        with self._lock:
+            position = self._position(member_id, score)
+            if position is None:
+                return None
+            before = self.keys[max(0, position - count):position]
+            after = self.keys[position + 1:position + 1 + count]
+        return [unpack(key) for key in before], [unpack(key) for key in after]
+
+    def members(self):
+        with self._lock:
+            return [unpack(key) for key in self.keys]
+
+
+class Indexes:
+    """
+    Indexes of the boards, by board id, evicting the least recently used ones beyond
+    `max_members` members in total, as counted when they were built
+    """
+
+    def __init__(self, max_members):
+        self.max_members = max_members
+        self.members_count = 0
+        # Board id -> (index, members counted)
+        self._indexes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def peek(self, board_id):
+        """
+        Returns the index of a board without marking it as used
+        """
+        with self._lock:
+            entry = self._indexes.get(board_id)
+            return entry and entry[0]
+
+    def get(self, board_id):
+        with self._lock:
+            entry = self._indexes.get(board_id)
+            if entry is None:
+                return None
+            self._indexes.move_to_end(board_id)
+            return entry[0]
+
+    def put(self, index):
+        with self._lock:
+            self._pop(index.board_id)
+            self._indexes[index.board_id] = (index, len(index))
+            self.members_count += len(index)
+            while self.members_count > self.max_members and len(self._indexes) > 1:
+                self._pop(next(iter(self._indexes)))
+
+    def pop(self, board_id):
+        with self._lock:
+            self._pop(board_id)
+
+    def _pop(self, board_id):
+        entry = self._indexes.pop(board_id, None)
+        if entry is not None:
+            self.members_count -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self.members_count = 0
+
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+
+def get_indexes():
+    global _indexes
+    with _indexes_lock:
+        if _indexes is None:
+            _indexes = Indexes(settings.RANK_INDEX_MAX_MEMBERS)
+        return _indexes
+
+
+def clear():
+    get_indexes().clear()
+
+
+def percentile(rank, count):
+    return round(100 * (rank - 1) / count, 2) if count else None
+
+
+def get_version(board):
+    return type(board).objects.filter(id=board.id).values_list('version', flat=True).first()
+
+
+def build(board):
+    """
+    Builds the index of a board from its members. The version is read before and after,
+    so that the members read are those of that version. Returns None if the board kept
+    changing, or is gone.
+    """
+    for _ in range(BUILD_ATTEMPTS):
+        version = get_version(board)
+        if version is None:
+            return None
+        members = list(board.members.values_list('score', 'id').order_by().iterator())
+        if get_version(board) == version:
+            return ScoreIndex(board.id, version, members)
+    return None
+
+
+def get_index(board):
+    """
+    Returns the index of a board, at least as recent as the given instance, building it if
+    needed. Returns None for the boards which are not indexed : small, too large, or
+    changing too fast, their ranks are to be counted by the database.
+    """
+    if not settings.RANK_INDEX_ENABLED:
+        return None
+    if not settings.RANK_INDEX_MIN_MEMBERS <= board.members_count <= settings.RANK_INDEX_MAX_MEMBERS:
+        return None
+    indexes = get_indexes()
+    index = indexes.get(board.id)
+    if index is not None and index.version is not None and index.version >= board.version:
+        return index
+    index = build(board)
+    if index is None:
+        indexes.pop(board.id)
+    else:
+        indexes.put(index)
+    return index
+
+
+def _changed(board, **change):
+    """
+    Registers a change of a board, to be applied to its index, if any, once committed.
+    To be called within the transaction which changed it, after the version was bumped :
+    the board row is then locked until the commit, the version read is the one of the change.
+    """
+    index = get_indexes().peek(board.id)
+    if index is None:
+        return
+    version = get_version(board)
+    transaction.on_commit(lambda: index.apply(version, **change))
+
+
+def members_changed(board, members):
+    """
+    Hook of the members added to a board or whose score changed, given as (id, score) pairs
+    """
+    _changed(board, scores=[(member_id, score) for member_id, score in members])
+
+
+def member_removed(board, member_id):
+    """
+    Hook of a member removed from a board
+    """
+    _changed(board, removed=[member_id])
+
+
+def check(board):
+    """
+    Consistency checker : compares the index of a board with its members in the database.
+    Returns a list of differences, empty if the index is consistent, or not to be used.
+    """
+    index = get_indexes().peek(board.id)
+    # Indexes behind their board are rebuilt before being used
+    if index is None or index.version is None or index.version < get_version(board):
+        return []
+    expected = list(board.leaderboard().values_list('score', 'id'))
+    actual = index.members()
+    differences = []
+    if len(actual) != len(expected):
+        differences.append(f'{len(actual)} members indexed, {len(expected)} in the database')
+    for position, (indexed, stored) in enumerate(zip(actual, expected)):
+        if indexed != stored:
+            differences.append(f'At rank {position + 1}, {indexed} indexed, {stored} in the database')
+            break
+    return differences
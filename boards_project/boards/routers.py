@@ -0,0 +1,124 @@
+"""
+Reads of the read-only board and member views from a replica of the database
+
+ReplicaRouter sends every write to the primary ('default'), and the reads too, except within
+the views marked with `replica_reads = True`, on safe methods, which ReplicaMiddleware routes
+to REPLICA_DATABASE. Within a transaction.atomic() block, reads stay on the primary.
+
+Replicas lag : after a write, a client reads from the primary for REPLICA_PIN_SECONDS, so that
+it never reads a board older than its own write. The end of this window is sent along with the
+responses to writes, as a `primary_until` cookie for browsers and as a Primary-Until header,
+which API clients send back with their next requests.
+
+Payloads cached by reads from the replica may be stale : they are only served to other reads
+from the replica, and live REPLICA_PIN_SECONDS at most (see cache.py).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+PIN_COOKIE = 'primary_until'
+PIN_HEADER = 'Primary-Until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def get_replica():
+    """
+    Returns the alias of the replica, None if there is none, or if it is the primary database
+    itself, as test mirrors are : its connection would not see the test transactions
+    """
+    alias = settings.REPLICA_DATABASE
+    if alias is None:
+        return None
+    replica, primary = connections[alias].settings_dict, connections[DEFAULT_DB_ALIAS].settings_dict
+    if all(replica[key] == primary[key] for key in ('NAME', 'HOST', 'PORT')):
+        return None
+    return alias
+
+
+def reading_from_replica():
+    """
+    Tells whether the reads of the current thread go to the replica
+    """
+    return (
+        getattr(_local, 'replica', False)
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        and get_replica() is not None
+    )
+
+
+def read_from_primary():
+    """
+    Sends the remaining reads of the current request to the primary, once it wrote
+    """
+    _local.replica = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return get_replica() if reading_from_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data
+        return True
+
+
+def is_pinned(request):
+    """
+    Tells whether the reads of a request must stay on the primary, the client having written
+    recently. Windows longer than REPLICA_PIN_SECONDS are ignored.
+    """
+    now = time.time()
+    for value in (request.COOKIES.get(PIN_COOKIE), request.META.get('HTTP_PRIMARY_UNTIL')):
+        try:
+            until = float(value)
+        except (TypeError, ValueError):
+            continue
+        if now < until <= now + settings.REPLICA_PIN_SECONDS:
+            return True
+    return False
+
+
+def pin(response):
+    """
+    Pins the reads of the client to the primary for REPLICA_PIN_SECONDS
+    """
+    until = f'{time.time() + settings.REPLICA_PIN_SECONDS:.3f}'
+    response[PIN_HEADER] = until
+    response.set_cookie(PIN_COOKIE, until, max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+
+
+class ReplicaMiddleware:
+    """
+    Routes the reads of the views with `replica_reads` to the replica, unless the client is
+    pinned to the primary, and pins the clients which wrote
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.replica = False
+        if request.method not in SAFE_METHODS and response.status_code < 400 and get_replica() is not None:
+            pin(response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        _local.replica = (
+            request.method in SAFE_METHODS
+            and getattr(view_class, 'replica_reads', False)
+            and not is_pinned(request)
+        )
@@ -0,0 +1,102 @@
+"""
+Generation of realistic datasets of users, boards and members, for load tests
+
+Everything is inserted with bulk_create : no signal is sent, so no change is logged and
+nothing is invalidated in the boards cache. The members aggregates of the boards are set
+as they are built (see members_aggregates).
+"""
+import datetime
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+
+from .models import AppUser, Board, BoardMember
+
+
+SEED_DOMAIN = 'seed.ilconto.app'
+DEFAULT_PASSWORD = 'seedpassword123'
+
+# Members pay on average once a week, within the last year
+MEAN_SCORE_AGE = 7 * 24 * 3600
+MAX_SCORE_AGE = 365 * 24 * 3600
+
+
+def random_score(rng, now):
+    """
+    Scores are the timestamps of the members' last payment, older payments being rarer
+    """
+    return now - min(int(rng.expovariate(1 / MEAN_SCORE_AGE)), MAX_SCORE_AGE)
+
+
+def bulk_create(model, objs, batch_size):
+    """
+    Inserts objs batch_size at a time, each batch being split further if the database
+    backend cannot take that many parameters at once
+    """
+    created = []
+    for i in range(0, len(objs), batch_size):
+        created += model.objects.bulk_create(objs[i:i + batch_size])
+    return created
+
+
+def get_seed_users():
+    return AppUser.objects.filter(email__endswith=f'@{SEED_DOMAIN}')
+
+
+def seed_users(count, password=DEFAULT_PASSWORD, batch_size=1000):
+    """
+    Creates count users, all sharing the same password, after the ones already seeded
+    """
+    start = get_seed_users().count()
+    hashed_password = make_password(password)
+    return bulk_create(AppUser, [
+        AppUser(username=f'seed_{i}', email=f'seed_{i}@{SEED_DOMAIN}', password=hashed_password)
+        for i in range(start, start + count)
+    ], batch_size)
+
+
+def set_aggregates(board, members):
+    """
+    Sets the members aggregates of an unsaved board, as members_aggregates computes them
+    """
+    board.members_count = len(members)
+    if members:
+        first = min(members, key=lambda member: (member.score, member.id))
+        board.min_score = first.score
+        board.max_score = max(member.score for member in members)
+        board.next_member_id = first.id
+        board.next_username = first.username
+
+
+def seed_boards(count, users, members=(2, 12), idle=0, rng=None, batch_size=1000):
+    """
+    Creates count boards, each with a random number of members (within the members range)
+    picked among users. Returns the number of members created.
+    A board was last modified when its last member paid. The `idle` fraction of the boards
+    went idle at some point within the last year, their members having paid before.
+    """
+    rng = rng or random.Random()
+    now = int(time.time())
+
+    created = 0
+    for start in range(0, count, batch_size):
+        boards, pending = [], []
+        for i in range(start, min(start + batch_size, count)):
+            idle_since = now - (rng.randint(0, MAX_SCORE_AGE) if rng.random() < idle else 0)
+            size = min(rng.randint(*members), len(users))
+            scores = [random_score(rng, idle_since) for _ in range(size)]
+            board = Board(
+                title=f'Seed board {i}',
+                updated_at=datetime.datetime.fromtimestamp(max(scores, default=idle_since), datetime.timezone.utc),
+            )
+            board_members = [
+                BoardMember(username=user.username, score=score, user=user, board=board)
+                for user, score in zip(rng.sample(users, size), scores)
+            ]
+            set_aggregates(board, board_members)
+            boards.append(board)
+            pending += board_members
+        bulk_create(Board, boards, batch_size)
+        created += len(bulk_create(BoardMember, pending, batch_size))
+    return created
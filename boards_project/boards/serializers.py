@@ -1,11 +1,63 @@
+from collections import OrderedDict
 from datetime import datetime
 import json
 
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from .models import Board, AppUser, BoardMember
+from .models import Board, AppUser, BoardMember, MemberAlreadyExists
+from .fieldsets import Fieldset, select_nested
+from .metrics import timed_serialization
+from . import batch, invitations
 
 
-class AppUserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    Counts the time spent building `data` in the metrics of the request (see metrics.py)
+    Lists (many=True) are timed by setting TimedListSerializer as `list_serializer_class`
+    """
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class SparseFieldsMixin:
+    """
+    Returns only the fields of the fieldset of the request, if any (see fieldsets.py)
+    Relations listed in Meta.expandable, nested by depth=1, are lists of ids unless expanded
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        fieldset = Fieldset.from_request(request) if request is not None else None
+        if fieldset is None:
+            return fields
+
+        expandable = getattr(self.Meta, 'expandable', ())
+        fields = OrderedDict((name, fields[name]) for name in fieldset.select(list(fields), expandable))
+        for relation in expandable:
+            if relation not in fields:
+                continue
+            nested = fields[relation].child
+            selected = select_nested(fieldset, relation, list(nested.fields))
+            if selected is None:
+                fields[relation] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+                continue
+            for name in list(nested.fields):
+                if name not in selected:
+                    del nested.fields[name]
+        return fields
+
+
+class AppUserSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(max_length=256)
     email = serializers.EmailField(max_length=256)
 
@@ -15,9 +67,11 @@ class AppUserSerializer(serializers.ModelSerializer):
         required_fields = ('username', 'email',)
         read_only_fields = ('id', 'memberships', 'email',)
         depth = 1
+        expandable = ('memberships',)
+        list_serializer_class = TimedListSerializer
 
 
-class MemberSerializer(serializers.ModelSerializer):
+class MemberSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(max_length=256, required=True)
     score = serializers.IntegerField(required=False)
     
@@ -25,58 +79,195 @@ class MemberSerializer(serializers.ModelSerializer):
         model = BoardMember
         fields = ('id', 'board', 'user', 'username', 'score')
         read_only_fields = ('id', 'board',)
+        list_serializer_class = TimedListSerializer
+
+
+class MemberUpdateSerializer(serializers.Serializer):
+    """
+    Validates a member update : the score is either set, or adjusted by delta
+    """
+    username = serializers.CharField(max_length=32, required=False)
+    score = serializers.IntegerField(required=False)
+    delta = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if 'score' in attrs and 'delta' in attrs:
+            raise serializers.ValidationError('score and delta cannot be both provided')
+        return attrs
+
+
+class TakeTurnSerializer(serializers.Serializer):
+    """
+    Validates a turn taken : the score of the next member is either set, or adjusted by delta
+    (reset to now by default)
+    """
+    score = serializers.IntegerField(required=False)
+    delta = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if 'score' in attrs and 'delta' in attrs:
+            raise serializers.ValidationError('score and delta cannot be both provided')
+        return attrs
+
+
+class SettleScoresSerializer(serializers.Serializer):
+    """
+    Validates a round settlement over whole boards, or some of their members
+    Scores are either reset to score (now by default), or adjusted by delta
+    """
+    boards = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    members = serializers.ListField(child=serializers.UUIDField(), required=False)
+    score = serializers.IntegerField(required=False)
+    delta = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if 'score' in attrs and 'delta' in attrs:
+            raise serializers.ValidationError('score and delta cannot be both provided')
+        return attrs
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    """
+    Validates one operation of a batch : a request to one of the other endpoints
+    """
+    method = serializers.ChoiceField(choices=batch.METHODS)
+    path = serializers.CharField()
+    query = serializers.DictField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+    body = serializers.JSONField(required=False)
 
 
-class BoardSerializer(serializers.ModelSerializer):
+class BatchSerializer(serializers.Serializer):
+    """
+    Validates a batch of at most BATCH_MAX_OPERATIONS operations, executed in order
+    """
+    requests = BatchOperationSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=False)
+
+    def validate_requests(self, requests):
+        if len(requests) > settings.BATCH_MAX_OPERATIONS:
+            raise serializers.ValidationError(f'A batch has at most {settings.BATCH_MAX_OPERATIONS} requests')
+        return requests
+
+
+class MemberImportSerializer(serializers.Serializer):
+    """
+    Validates one item of a bulk member import (board creation or batch add)
+    A member is identified either by its user id or by its email
+    """
+    user = serializers.UUIDField(required=False)
+    email = serializers.EmailField(max_length=256, required=False)
+    username = serializers.CharField(max_length=32, required=False)
+    score = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if 'user' not in attrs and 'email' not in attrs:
+            raise serializers.ValidationError('Either user or email must be provided')
+        return attrs
+
+
+class BoardPartialSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Used to update a board's own attributes (basically its title), members being
+    managed through the members views
+    """
+    class Meta:
+        model = Board
+        fields = ('id', 'title',)
+        read_only_fields = ('id',)
+        list_serializer_class = TimedListSerializer
+
+
+class BoardSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A board card : the board with the aggregates of its members, which are read from
+    the board itself (see Board.members_count)
+    """
+    next_member = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Board
+        fields = ('id', 'title', 'members_count', 'min_score', 'max_score', 'next_member')
+        read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+
+    def get_next_member(self, board):
+        if board.next_member_id is None:
+            return None
+        return {'id': str(board.next_member_id), 'username': board.next_username}
+
+
+class BoardSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Board
         fields = ('id', 'title', 'members',)
         read_only_fields = ('id', 'members',)
         depth = 1
+        expandable = ('members',)
+        list_serializer_class = TimedListSerializer
+
+    def validate(self, attrs):
+        # Members are read only on the model serializer, so the members to import
+        # are validated separately from the raw request body on creation
+        if self.instance is None:
+            members = MemberImportSerializer(data=self.initial_data.get('members', []), many=True)
+            members.is_valid(raise_exception=True)
+            attrs['members'] = members.validated_data
+            identifiers = [
+                ('user', str(item['user'])) if item.get('user') else ('email', item['email'].lower())
+                for item in attrs['members']
+            ]
+            if len(set(identifiers)) != len(identifiers):
+                raise serializers.ValidationError({'members': ['The same user is provided more than once']})
+        return attrs
+
+    def is_requesting_user(self, item):
+        user = self.context['request'].user
+        if item.get('user'):
+            return str(item['user']) == str(user.id)
+        return item.get('email', '').lower() == user.email.lower()
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         This function is triggered during access to the create view
         Classic attributes are set as usual (basically this is just the board's title)
-        Then members are inserted with scores
+        Then members are inserted with scores, all at once (see Board.add_members)
 
         - The requesting user is added to the baord members by default
         !!! IMPORTANT !!! : This should be mentionned as a warning in the front applciation
-        
-        Additional possible feature : Something should happen if one of the key in the scores dict does not
-        match with any of the members email provided.
+
+        Emails matching no user are sent an invitation by a background job (see invitations.py)
         """
 
         members_data = validated_data.pop('members', [])
         board = Board.objects.create(**validated_data)
 
         # By default, the requesting user is added to the board
-        if self.context['request'].user not in members_data:
-            # Retrieve user infos
-            user = self.context['request'].user
-            filtered_members_data = [item for item in members_data if item['email'] == user.email]
-
-            # Deals with the case where the request body does not provide information on it's score or username
-            if len(filtered_members_data) == 0:
-                member_username = user.username
-                member_score = int(datetime.utcnow().timestamp())
-            else:
-                member_username = filtered_members_data[0].get('username', user.username)
-                member_score = filtered_members_data[0].get('score', int(datetime.utcnow().timestamp()))
-                
-            # Add this user to the board
-            member = board.add_member(member_username, user.id)
-            board.reset_score(member.id, member_score)
-
-        # Add the other members to the board
-        for member_data in members_data:
-            try:
-                user = User.objects.get(email=member_data['email'])
-                member = board.add_member(member_data['username'], user.id)
-                board.reset_score(member.id, member_data.get('score', int(datetime.utcnow().timestamp())))
-            except AppUser.DoesNotExist:
-                # That's where we'll implement the email to non-existing members feature
-                # @TODO: Implement it !
-                pass
+        # Deals with the case where the request body does not provide information on it's score or username
+        # The requesting user may be given by email or by id
+        user = self.context['request'].user
+        filtered_members_data = [item for item in members_data if self.is_requesting_user(item)]
+        if len(filtered_members_data) > 1:
+            raise serializers.ValidationError({'members': ['The same user is provided more than once']})
+        requesting_member = filtered_members_data[0] if filtered_members_data else {}
+        other_members = [item for item in members_data if not self.is_requesting_user(item)]
+
+        # Add every member to the board
+        # Emails with no matching AppUser are skipped, and invited once the board is committed
+        # A user given both by id and by email is only found out once resolved
+        try:
+            members = board.add_members([dict(requesting_member, user=user.id)] + other_members)
+        except MemberAlreadyExists as e:
+            raise serializers.ValidationError({'members': [str(e)]})
+        added_emails = {member.user.email.lower() for member in members}
+        invitations.invite(
+            sorted({
+                item['email'] for item in other_members
+                if item.get('email') and not item.get('user') and item['email'].lower() not in added_emails
+            }),
+            board.title,
+            user.username,
+        )
 
         return board
\ No newline at end of file
@@ -0,0 +1,117 @@
+import threading
+
+from allauth.account.signals import password_changed, password_reset, password_set
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import archive, authentication, cache, events
+from .models import AppUser, Board, BoardChange, BoardMember, board_modified, boards_modified
+
+
+# Ids of the boards and users being deleted by the current thread, between their pre_delete
+# and post_delete : the members deleted along with them do not modify their boards one by one
+_deleting = threading.local()
+
+
+def _deleting_ids(name):
+    if not hasattr(_deleting, name):
+        setattr(_deleting, name, set())
+    return getattr(_deleting, name)
+
+
+@receiver(post_save, sender=Board)
+def board_saved(sender, instance, created, **kwargs):
+    if not created:
+        board_modified(instance.id)
+    BoardChange.for_board(instance).save()
+
+
+@receiver(pre_delete, sender=Board)
+def board_deleting(sender, instance, **kwargs):
+    # Published before the removals of its members, deleted with it, which streams then ignore
+    events.publish(instance.id, events.BOARD_DELETED)
+    # Its users, to whom the changes feed sends its tombstone
+    instance._member_user_ids = set(instance.members.values_list('user_id', flat=True))
+    _deleting_ids('boards').add(instance.id)
+
+
+@receiver(post_delete, sender=Board)
+def board_deleted(sender, instance, **kwargs):
+    _deleting_ids('boards').discard(instance.id)
+    cache.invalidate_board(instance.id)
+    user_ids = getattr(instance, '_member_user_ids', None) or [None]
+    BoardChange.objects.bulk_create([
+        BoardChange.for_board(instance, deleted=True, user_id=user_id) for user_id in user_ids
+    ])
+
+
+@receiver(post_save, sender=BoardMember)
+def member_saved(sender, instance, created, **kwargs):
+    board_modified(instance.board_id, members_added=1 if created else 0, members_changed=True)
+    if created:
+        BoardChange.objects.bulk_create([BoardChange.for_member(instance), BoardChange.for_new_member(instance)])
+    else:
+        BoardChange.for_member(instance).save()
+    events.member_changed(instance, events.MEMBER_ADDED if created else events.MEMBER_UPDATED)
+    if created:
+        cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=BoardMember)
+def member_deleted(sender, instance, **kwargs):
+    cache.invalidate_user(instance.user_id)
+    if instance.board_id in _deleting_ids('boards'):
+        # Along with its board, whose tombstones cover its members
+        return
+    events.member_changed(instance, events.MEMBER_REMOVED)
+    if instance.user_id in _deleting_ids('users'):
+        # Along with its user : the boards are modified at once by user_deleted
+        return
+    board_modified(instance.board_id, members_added=-1, members_changed=True)
+    BoardChange.for_member(instance, deleted=True).save()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # rest-auth's logout deletes the token
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(pre_delete, sender=AppUser)
+def user_deleting(sender, instance, **kwargs):
+    # Their memberships of archived boards are only known to the archives
+    archive.remove_user(instance)
+    instance._memberships = list(instance.memberships.values_list('id', 'board_id'))
+    _deleting_ids('users').add(instance.id)
+
+
+@receiver(post_delete, sender=AppUser)
+def user_deleted(sender, instance, **kwargs):
+    _deleting_ids('users').discard(instance.id)
+    memberships = getattr(instance, '_memberships', [])
+    if not memberships:
+        return
+    # A user is a member of a board once
+    boards_modified([board_id for _, board_id in memberships], members_added=-1, members_changed=True)
+    BoardChange.objects.bulk_create([
+        BoardChange.for_member(BoardMember(id=id, board_id=board_id, user_id=instance.id), deleted=True)
+        for id, board_id in memberships
+    ])
+
+
+@receiver(post_save, sender=AppUser)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Password changes and deactivations save the user, logins only update last_login
+    if not created and update_fields != frozenset(['last_login']):
+        authentication.invalidate_user_tokens(instance.id)
+
+
+@receiver(user_logged_out)
+@receiver(password_changed)
+@receiver(password_set)
+@receiver(password_reset)
+def user_credentials_changed(sender, user, **kwargs):
+    if user is not None:
+        authentication.invalidate_user_tokens(user.id)
@@ -0,0 +1,88 @@
+import unittest
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from ..admin import estimate_count
+from ..models import Board, BoardMember
+
+
+user_model = get_user_model()
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=50)
+class TestAdminChangelists(TestCase):
+    """
+    Pins the number of queries of the changelists, at 10k members
+    """
+    boards_count = 100
+    users_count = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = user_model.objects.create_superuser(
+            username='admin', email='admin@test.com', password='testpassword123'
+        )
+        cls.users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com', password='!')
+            for i in range(cls.users_count)
+        ])
+        cls.boards = Board.objects.bulk_create([Board(title=f'board {i}') for i in range(cls.boards_count)])
+        BoardMember.objects.bulk_create([
+            BoardMember(username=user.username, score=i, user=user, board=board)
+            for board in cls.boards
+            for i, user in enumerate(cls.users)
+        ])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_query_count(self):
+        # session + user + count, or its estimate + page, whatever the number of rows
+        for model in ('board', 'boardmember', 'appuser'):
+            url = reverse(f'admin:boards_{model}_changelist')
+            with self.subTest(model=model), self.assertNumQueries(4):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_members_changelist(self):
+        response = self.client.get(reverse('admin:boards_boardmember_changelist'))
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        count = response.context['cl'].result_count
+        if connection.vendor == 'postgresql':
+            self.assertAlmostEqual(count, 10000, delta=1000)
+        else:
+            self.assertEqual(count, 10000)
+
+    def test_indexed_search(self):
+        url = reverse('admin:boards_boardmember_changelist')
+        for term, count in (
+            ('test_1@test.com', self.boards_count),
+            (str(self.boards[0].id), self.users_count),
+            ('nothing', 0),
+        ):
+            with self.subTest(term=term):
+                response = self.client.get(url, {'q': term, 'all': ''})
+                cl = response.context['cl']
+                self.assertEqual(cl.queryset.count(), count)
+                self.assertNotIn('UPPER', str(cl.queryset.query))
+
+        response = self.client.get(reverse('admin:boards_board_changelist'), {'q': 'not a uuid'})
+        self.assertEqual(response.context['cl'].queryset.count(), 0)
+
+    def test_change_pages(self):
+        member = BoardMember.objects.first()
+        for model, id in (('board', member.board_id), ('boardmember', member.id), ('appuser', member.user_id)):
+            with self.subTest(model=model):
+                response = self.client.get(reverse(f'admin:boards_{model}_change', args=[id]))
+                self.assertEqual(response.status_code, 200)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Planner statistics of PostgreSQL')
+    def test_estimate_count(self):
+        self.assertAlmostEqual(estimate_count(BoardMember.objects.all()), 10000, delta=1000)
+        self.assertLess(estimate_count(BoardMember.objects.filter(board=self.boards[0])), 1000)
@@ -0,0 +1,144 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board, settle_scores
+
+
+user_model = get_user_model()
+
+
+class TestBoardAggregates(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 5)]
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.board = Board.objects.create(title='hello board')
+
+    def assertAggregates(self, count, min_score, max_score, next_member):
+        self.board.refresh_from_db()
+        self.assertEqual(
+            (self.board.members_count, self.board.min_score, self.board.max_score),
+            (count, min_score, max_score),
+        )
+        self.assertEqual(self.board.next_member_id, next_member and next_member.id)
+        self.assertEqual(self.board.next_username, next_member and next_member.username)
+
+    def test_empty_board(self):
+        self.assertAggregates(0, None, None, None)
+
+    def test_members_changes(self):
+        first = self.board.add_member('testeur_1', self.users[0].id, score=5)
+        self.assertAggregates(1, 5, 5, first)
+
+        second, third = self.board.add_members([
+            {'user': self.users[1].id, 'score': 3},
+            {'user': self.users[2].id, 'score': 8},
+        ])
+        self.assertAggregates(3, 3, 8, second)
+
+        self.board.update_member(second.id, score=10, username='renamed')
+        self.assertAggregates(3, 5, 10, first)
+
+        self.board.reset_score(first.id, score=1)
+        first.refresh_from_db()
+        self.assertAggregates(3, 1, 10, first)
+
+        self.board.remove_member(first.id)
+        self.assertAggregates(2, 8, 10, third)
+
+        settle_scores([self.board.id], score=0)
+        # Ties are broken by id, as in the leaderboard
+        self.assertAggregates(2, 0, 0, self.board.leaderboard()[0])
+
+    def test_member_views(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        member = self.board.add_member('testeur_1', self.users[0].id, score=5)
+        other = self.board.add_member('testeur_2', self.users[1].id, score=7)
+        url = reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': member.id})
+
+        client.patch(url, {'delta': 10}, format='json')
+        self.assertAggregates(2, 7, 15, other)
+        client.delete(url)
+        self.assertAggregates(1, 7, 7, other)
+
+    def test_title_change(self):
+        self.board.add_member('testeur_1', self.users[0].id, score=5)
+        self.board.refresh_from_db()
+        self.board.title = 'renamed'
+        self.board.save()
+        self.assertEqual(self.board.members_count, 1)
+        self.assertAggregates(1, 5, 5, self.board.members.get())
+
+    def test_recompute_command(self):
+        member = self.board.add_member('testeur_1', self.users[0].id, score=5)
+        other = Board.objects.create(title='other board')
+        other.add_member('testeur_1', self.users[0].id, score=1)
+
+        call_command('recompute_board_aggregates', check=True, stdout=io.StringIO())
+
+        Board.objects.filter(id=self.board.id).update(members_count=12, next_member_id=None)
+        with self.assertRaisesMessage(CommandError, '1 drifted'):
+            call_command('recompute_board_aggregates', check=True, stdout=io.StringIO())
+
+        output = io.StringIO()
+        call_command('recompute_board_aggregates', stdout=output)
+        self.assertIn('recomputed 1 which drifted', output.getvalue())
+        self.assertAggregates(1, 5, 5, member)
+
+
+class TestBoardSummaries(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        cls.other = user_model.objects.create_user(
+            username='testeur_2', email='test_2@test.com', password='testpassword123'
+        )
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_members([{'user': cls.user.id, 'score': 4}, {'user': cls.other.id, 'score': 2}])
+        Board.objects.create(title='empty board')
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_summaries(self):
+        response = self.client.get(reverse('boards'), {'summary': 'true'})
+        member = self.board.members.get(user=self.other)
+        self.assertEqual(response.json(), [{
+            'id': str(self.board.id),
+            'title': 'hello board',
+            'members_count': 2,
+            'min_score': 2,
+            'max_score': 4,
+            'next_member': {'id': str(member.id), 'username': 'testeur_2'},
+        }])
+
+    def test_no_member_table(self):
+        self.client.get(reverse('boards'), {'summary': 'true'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('boards'), {'summary': 'true'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('boards_boardmember', queries[0]['sql'])
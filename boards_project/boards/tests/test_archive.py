@@ -0,0 +1,204 @@
+import datetime
+import io
+import json
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import archive, cache, seeding
+from ..models import ArchivedBoard, Board, BoardChange, BoardMember
+from ..permissions import get_user_board_ids
+
+
+user_model = get_user_model()
+
+
+class TestArchive(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_members([
+            {'user': cls.users[0].id, 'score': 5},
+            {'user': cls.users[1].id, 'score': 3},
+        ])
+        cls.hot_board = Board.objects.create(title='hot board')
+        cls.hot_board.add_member('testeur_1', cls.users[0].id, score=1)
+        cls.long_ago = timezone.now() - datetime.timedelta(days=365)
+        Board.objects.filter(id=cls.board.id).update(updated_at=cls.long_ago)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+        self.url = reverse('board_details', kwargs={'board_id': self.board.id})
+
+    def archive(self):
+        return archive.archive_boards(timezone.now() - datetime.timedelta(days=90))
+
+    def test_idle_boards_are_archived(self):
+        members = list(self.board.leaderboard().values_list('id', 'username', 'score', 'user_id'))
+        changes = BoardChange.objects.count()
+        self.assertEqual(self.archive(), (1, 2))
+
+        self.assertFalse(Board.objects.filter(id=self.board.id).exists())
+        self.assertFalse(BoardMember.objects.filter(board_id=self.board.id).exists())
+        self.assertTrue(Board.objects.filter(id=self.hot_board.id).exists())
+        archived = ArchivedBoard.objects.get(id=self.board.id)
+        self.assertEqual(
+            [(member.id, member.username, member.score, member.user_id) for member in archived.get_members()], members
+        )
+        self.assertEqual(set(archived.users.all()), set(self.users[:2]))
+        # Nothing changed for the clients
+        self.assertEqual(BoardChange.objects.count(), changes)
+        self.assertEqual(self.archive(), (0, 0))
+
+    def test_details_are_read_from_the_archive(self):
+        response = self.client.get(self.url)
+        cache.get_cache().clear()
+        self.archive()
+
+        archived = self.client.get(self.url)
+        self.assertEqual(archived.status_code, 200)
+        self.assertEqual(archived.json(), response.json())
+        self.assertEqual(archived['ETag'], response['ETag'])
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertFalse(Board.objects.filter(id=self.board.id).exists())
+
+    def test_writes_restore_the_board(self):
+        members = list(self.board.leaderboard().values_list('id', 'username', 'score', 'user_id'))
+        self.board.refresh_from_db()
+        self.archive()
+
+        response = self.client.put(self.url, {'title': 'renamed board'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ArchivedBoard.objects.exists())
+        board = Board.objects.get(id=self.board.id)
+        self.assertEqual((board.title, board.version), ('renamed board', self.board.version + 1))
+        self.assertEqual(list(board.leaderboard().values_list('id', 'username', 'score', 'user_id')), members)
+
+    def test_reads_are_served_from_the_archive(self):
+        member = self.board.leaderboard().first()
+        kwargs = {'board_id': self.board.id}
+        leaderboard = reverse('board_leaderboard', kwargs=kwargs)
+        requests = [
+            (reverse('board_members', kwargs=kwargs), {}),
+            (reverse('board_members', kwargs=kwargs), {'fields': 'id,score'}),
+            (reverse('board_member_details', kwargs=dict(kwargs, member_id=member.id)), {}),
+            (leaderboard, {}),
+            (leaderboard, {'limit': 1, 'cursor': f'{member.score}:{member.id}'}),
+            (leaderboard, {'member': str(member.id), 'around': 1}),
+            (reverse('board_next_member', kwargs=kwargs), {}),
+        ]
+        responses = [self.client.get(url, params) for url, params in requests]
+        cache.get_cache().clear()
+        self.archive()
+
+        for (url, params), response in zip(requests, responses):
+            with self.subTest(url=url, params=params):
+                archived = self.client.get(url, params)
+                self.assertEqual((archived.status_code, archived.json()), (200, response.json()))
+        self.assertEqual(self.client.get(requests[0][0], HTTP_IF_NONE_MATCH=responses[0]['ETag']).status_code, 304)
+        missing = reverse('board_member_details', kwargs=dict(kwargs, member_id=self.board.id))
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        self.assertEqual(self.client.get(leaderboard, {'member': 'nope'}).status_code, 404)
+        # Still archived
+        self.assertFalse(Board.objects.filter(id=self.board.id).exists())
+        self.assertEqual(self.archive(), (0, 0))
+
+    def test_restored_boards_are_not_archived_again(self):
+        self.archive()
+        response = self.client.post(reverse('board_next_member', kwargs={'board_id': self.board.id}), {'score': 10})
+        self.assertEqual((response.status_code, response.data['username']), (200, 'testeur_2'))
+        self.assertFalse(ArchivedBoard.objects.exists())
+        self.assertEqual(self.archive(), (0, 0))
+
+        Board.objects.filter(id=self.board.id).update(updated_at=self.long_ago)
+        self.archive()
+        self.assertGreater(archive.restore(self.board.id).updated_at, self.long_ago)
+        self.assertEqual(self.archive(), (0, 0))
+
+    def test_deletion(self):
+        self.archive()
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(Board.objects.filter(id=self.board.id).exists())
+        self.assertFalse(ArchivedBoard.objects.exists())
+        self.assertNotIn(self.board.id, get_user_board_ids(self.users[0]))
+
+    def test_deleted_users_are_removed_from_the_archives(self):
+        etag = self.client.get(self.url)['ETag']
+        self.archive()
+        user_model.objects.get(id=self.users[0].id).delete()
+        archived = ArchivedBoard.objects.get(id=self.board.id)
+        self.assertEqual([member.user_id for member in archived.get_members()], [self.users[1].id])
+        self.assertEqual(
+            (archived.members_count, archived.min_score, archived.max_score, archived.next_username),
+            (1, 3, 3, 'testeur_2'),
+        )
+
+        self.client.force_authenticate(user=self.users[1])
+        response = self.client.get(self.url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([member['user'] for member in response.json()['members']], [str(self.users[1].id)])
+        # Restored without them
+        response = self.client.put(self.url, {'title': 'renamed board'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Board.objects.get(id=self.board.id).members.values_list('user', flat=True)), [self.users[1].id])
+        call_command('recompute_board_aggregates', check=True, stdout=io.StringIO())
+
+    def test_memberships(self):
+        self.archive()
+        self.assertEqual(get_user_board_ids(self.users[0]), {self.board.id, self.hot_board.id})
+        self.client.force_authenticate(user=self.users[2])
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_archived_boards_are_listed(self):
+        listed = self.client.get(reverse('boards')).json()
+        summaries = self.client.get(reverse('boards'), {'summary': 'true'}).json()
+        self.archive()
+
+        key = lambda board: board['id']
+        self.assertEqual(sorted(self.client.get(reverse('boards')).json(), key=key), sorted(listed, key=key))
+        self.assertEqual(
+            sorted(self.client.get(reverse('boards'), {'summary': 'true'}).json(), key=key),
+            sorted(summaries, key=key),
+        )
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('archive_boards', dry_run=True, stdout=output)
+        self.assertIn('1 boards to archive', output.getvalue())
+        self.assertFalse(ArchivedBoard.objects.exists())
+
+        output = io.StringIO()
+        call_command('archive_boards', report=True, iterations=5, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['archived'], {'boards': 1, 'members': 2})
+        self.assertEqual(report['before']['tables']['boards_board']['rows'], 2)
+        self.assertEqual(report['after']['tables']['boards_board']['rows'], 1)
+        self.assertEqual(report['after']['tables']['boards_archivedboard']['rows'], 1)
+        self.assertEqual(set(report['after']['latency_us']), set(report['before']['latency_us']))
+
+
+class TestIdleSeeding(TestCase):
+
+    def test_idle_boards(self):
+        users = seeding.seed_users(10)
+        seeding.seed_boards(50, users, idle=1)
+        seeding.seed_boards(50, users, idle=0)
+        for board in Board.objects.all():
+            latest = board.members.order_by('-score').values_list('score', flat=True).first()
+            self.assertEqual(board.updated_at.timestamp(), latest)
+        inactive_since = timezone.now() - datetime.timedelta(days=90)
+        self.assertGreater(archive.get_candidates(inactive_since).count(), 10)
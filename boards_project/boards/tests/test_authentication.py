@@ -0,0 +1,95 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .. import authentication, cache
+
+
+user_model = get_user_model()
+
+
+class TestCachedTokenAuthentication(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+
+    def setUp(self):
+        cache.get_cache().clear()
+        authentication.clear()
+        self.user = user_model.objects.get(id=self.user.id)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_no_query_once_cached(self):
+        self.assertEqual(self.client.get(reverse('boards')).status_code, 200)
+        with self.assertNumQueries(2):
+            # The boards list itself, and the archived boards
+            response = self.client.get(reverse('boards'))
+        self.assertEqual(response.status_code, 200)
+
+        # Another process only has the shared cache
+        authentication.clear()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('boards'))
+
+    def test_each_request_gets_its_own_user(self):
+        backend = authentication.CachedTokenAuthentication()
+        first, _ = backend.authenticate_credentials(self.token.key)
+        second, _ = backend.authenticate_credentials(self.token.key)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    def test_passwords_are_not_cached(self):
+        backend = authentication.CachedTokenAuthentication()
+        backend.authenticate_credentials(self.token.key)
+        user, _ = backend.authenticate_credentials(self.token.key)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertNotIn(self.user.password.encode(), cache.get_cache().get(authentication._get_key(self.token.key)))
+
+        # Saving a cached user keeps its password, which is read from the database
+        user.first_name = 'Testeur'
+        user.save()
+        self.assertTrue(user_model.objects.get(id=self.user.id).check_password('testpassword123'))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpassword123'))
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(self.client.get(reverse('boards')).status_code, 401)
+
+    def test_logout(self):
+        self.client.get(reverse('boards'))
+        self.client.post(reverse('rest_logout'))
+        self.assertEqual(self.client.get(reverse('boards')).status_code, 401)
+
+    def test_password_change(self):
+        self.client.get(reverse('boards'))
+        self.user.set_password('newpassword456')
+        self.user.save()
+        # Saving the user evicted the token : it is authenticated from the database again
+        with self.assertNumQueries(1):
+            authentication.CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+    def test_deactivation(self):
+        self.client.get(reverse('boards'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('boards')).status_code, 401)
+
+    def test_lru(self):
+        lru = authentication.LRU(size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+        expired = authentication.LRU(size=2, ttl=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
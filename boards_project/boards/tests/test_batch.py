@@ -0,0 +1,117 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+class TestBatchView(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 3 users and 2 boards, the first user being a member of the first one only
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.member = cls.board.add_member('testeur_1', cls.users[0].id, score=10)
+        cls.other_board = Board.objects.create(title='other board')
+        cls.other_board.add_member('testeur_2', cls.users[1].id, score=10)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def batch(self, requests, **data):
+        response = self.client.post(reverse('batch'), dict(data, requests=requests), format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def members_path(self, board):
+        return f'boards/{board.id}/members/'
+
+    def test_sync(self):
+        # Responses are those of separate requests, in order
+        member_path = f'/api/v1/boards/{self.board.id}/members/{self.member.id}'
+        result = self.batch([
+            {'method': 'GET', 'path': 'boards/', 'query': {'fields': 'id,title'}},
+            {'method': 'PATCH', 'path': member_path, 'body': {'delta': 5}},
+            {'method': 'GET', 'path': self.members_path(self.board)},
+        ])
+        self.assertNotIn('committed', result)
+        self.assertEqual([response['status'] for response in result['responses']], [200, 200, 200])
+        self.assertEqual(result['responses'][0]['body'], [{'id': str(self.board.id), 'title': 'hello board'}])
+        self.assertEqual(result['responses'][1]['body']['score'], 15)
+        members = self.client.get(reverse('board_members', kwargs={'board_id': self.board.id}))
+        self.assertEqual(result['responses'][2]['body'], members.json())
+        self.assertEqual(result['responses'][2]['headers']['ETag'], members['ETag'])
+
+    def test_permissions_are_checked(self):
+        result = self.batch([
+            {'method': 'GET', 'path': self.members_path(self.other_board)},
+            {'method': 'GET', 'path': self.members_path(self.board)},
+        ])
+        self.assertEqual([response['status'] for response in result['responses']], [403, 200])
+
+    def test_conditional_requests(self):
+        etag = self.client.get(reverse('board_members', kwargs={'board_id': self.board.id}))['ETag']
+        result = self.batch([
+            {'method': 'GET', 'path': self.members_path(self.board), 'headers': {'If-None-Match': etag}},
+        ])
+        self.assertEqual(result['responses'][0]['status'], 304)
+        self.assertIsNone(result['responses'][0]['body'])
+
+    def test_atomic_batch_is_rolled_back(self):
+        # The members read within the batch must not outlive its rollback in the cache
+        result = self.batch([
+            {'method': 'POST', 'path': self.members_path(self.board), 'body': {'user': str(self.users[2].id)}},
+            {'method': 'GET', 'path': self.members_path(self.board)},
+            {'method': 'PATCH', 'path': f'boards/{self.board.id}/members/{self.member.id}', 'body': {'score': 'nope'}},
+            {'method': 'DELETE', 'path': f'boards/{self.board.id}/'},
+        ], atomic=True)
+        self.assertFalse(result['committed'])
+        self.assertEqual([response['status'] for response in result['responses']], [200, 200, 400])
+        self.assertEqual(len(result['responses'][1]['body']), 2)
+
+        members = self.client.get(reverse('board_members', kwargs={'board_id': self.board.id})).json()
+        self.assertEqual([member['id'] for member in members], [str(self.member.id)])
+
+    def test_atomic_batch_is_committed(self):
+        result = self.batch([
+            {'method': 'POST', 'path': self.members_path(self.board), 'body': {'user': str(self.users[2].id)}},
+            {'method': 'PUT', 'path': f'boards/{self.board.id}/', 'body': {'title': 'renamed'}},
+        ], atomic=True)
+        self.assertTrue(result['committed'])
+        self.assertEqual(self.board.members.count(), 2)
+        self.assertEqual(Board.objects.get(id=self.board.id).title, 'renamed')
+
+    def test_invalid_requests(self):
+        result = self.batch([
+            {'method': 'GET', 'path': 'nowhere/'},
+            {'method': 'GET', 'path': 'boards/export/ndjson/'},
+            {'method': 'POST', 'path': 'batch/', 'body': {'requests': []}},
+        ])
+        self.assertEqual([response['status'] for response in result['responses']], [404, 400, 400])
+
+        url = reverse('batch')
+        self.assertEqual(self.client.post(url, {'requests': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'requests': [{'method': 'HEAD', 'path': 'boards/'}]},
+                                          format='json').status_code, 400)
+        with override_settings(BATCH_MAX_OPERATIONS=1):
+            requests = [{'method': 'GET', 'path': 'boards/'}] * 2
+            self.assertEqual(self.client.post(url, {'requests': requests}, format='json').status_code, 400)
+
+    def test_anonymous(self):
+        response = APIClient().post(reverse('batch'), {'requests': [{'method': 'GET', 'path': 'boards/'}]}, format='json')
+        self.assertEqual(response.status_code, 401)
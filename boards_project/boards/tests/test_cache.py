@@ -0,0 +1,124 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class TestBoardCache(TestCase):
+    """
+    Checks board payloads are served from the cache, and that no read following a write is stale
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 6)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.member = cls.board.add_member('testeur_1', cls.users[0].id, score=1)
+        cls.board_url = reverse('board_details', kwargs={'board_id': cls.board.id})
+        cls.members_url = reverse('board_members', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.reset_stats()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def get_member_scores(self):
+        return {
+            'board': {m['username']: m['score'] for m in self.client.get(self.board_url).data['members']},
+            'members': {m['username']: m['score'] for m in self.client.get(self.members_url).data},
+        }
+
+    def assertScores(self, scores):
+        self.assertEqual(self.get_member_scores(), {'board': scores, 'members': scores})
+
+    def test_second_read_is_a_hit(self):
+        self.client.get(self.board_url)
+        self.client.get(self.members_url)
+        with self.assertNumQueries(2):
+            # board lookups, the membership check being cached too
+            self.assertScores({'testeur_1': 1})
+        self.assertEqual(cache.get_stats(), {'hits': 2, 'misses': 2, 'evictions': 0})
+
+    def test_no_stale_read_after_add_member(self):
+        self.assertScores({'testeur_1': 1})
+        self.board.add_member('testeur_2', self.users[1].id, score=2)
+        self.assertScores({'testeur_1': 1, 'testeur_2': 2})
+        self.assertGreater(cache.get_stats()['evictions'], 0)
+
+    def test_no_stale_read_after_bulk_add(self):
+        self.assertScores({'testeur_1': 1})
+        self.client.post(self.members_url, [{'user': str(self.users[1].id), 'score': 2}], format='json')
+        self.assertScores({'testeur_1': 1, 'testeur_2': 2})
+
+    def test_no_stale_read_after_reset_score(self):
+        self.assertScores({'testeur_1': 1})
+        self.board.reset_score(self.member.id, 5)
+        self.assertScores({'testeur_1': 5})
+
+    def test_no_stale_read_after_member_update(self):
+        self.assertScores({'testeur_1': 1})
+        url = reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': self.member.id})
+        self.client.put(url, {'score': 7, 'username': 'renamed'}, format='json')
+        self.assertScores({'renamed': 7})
+
+    def test_no_stale_read_after_remove_member(self):
+        member = self.board.add_member('testeur_2', self.users[1].id, score=2)
+        self.assertScores({'testeur_1': 1, 'testeur_2': 2})
+        self.board.remove_member(member.id)
+        self.assertScores({'testeur_1': 1})
+
+    def test_no_stale_read_after_user_deletion(self):
+        self.board.add_member('testeur_2', self.users[1].id, score=2)
+        self.assertScores({'testeur_1': 1, 'testeur_2': 2})
+        user_model.objects.filter(id=self.users[1].id).delete()
+        self.assertScores({'testeur_1': 1})
+
+    def test_no_stale_read_after_title_update(self):
+        self.client.get(self.board_url)
+        self.board.title = 'goodbye board'
+        self.board.save()
+        self.assertEqual(self.client.get(self.board_url).data['title'], 'goodbye board')
+
+    def test_late_write_of_a_previous_generation_is_ignored(self):
+        """
+        A request computing the payload while the board is modified stores outdated data,
+        which must not be served afterwards
+        """
+        def slow_serialize():
+            cache.invalidate_board(self.board.id)
+            return 'outdated'
+
+        self.assertEqual(cache.get_or_set(self.board.id, 'detail', slow_serialize), 'outdated')
+        self.assertEqual(cache.get_or_set(self.board.id, 'detail', lambda: 'fresh'), 'fresh')
+
+    def test_forbidden_for_non_members(self):
+        self.client.get(self.board_url)
+        self.client.force_authenticate(user=self.users[1])
+        self.assertEqual(self.client.get(self.board_url).status_code, 403)
+        self.assertEqual(self.client.get(self.members_url).status_code, 403)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='boards-cache-'),
+    },
+})
+class TestBoardFileCache(TestBoardCache):
+    pass
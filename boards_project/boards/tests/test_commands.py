@@ -0,0 +1,52 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from .. import benchmarks, seeding
+from ..models import Board, BoardMember
+
+
+class TestSeedBoardsCommand(TestCase):
+
+    def test_seed_boards(self):
+        call_command('seed_boards', users=20, boards=10, members='2:5', seed=1, stdout=io.StringIO())
+        self.assertEqual(seeding.get_seed_users().count(), 20)
+        self.assertEqual(Board.objects.count(), 10)
+        for board in Board.objects.all():
+            members = BoardMember.objects.filter(board=board)
+            self.assertTrue(2 <= members.count() <= 5)
+            # A seeded user is at most once on a given board
+            self.assertEqual(members.values('user').distinct().count(), members.count())
+
+    def test_seeded_aggregates_do_not_drift(self):
+        call_command('seed_boards', users=20, boards=20, members='0:8', seed=1, stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command('recompute_board_aggregates', check=True, stdout=stdout)
+        self.assertIn('Checked 20 boards, none drifted', stdout.getvalue())
+
+    def test_invalid_members_range(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_boards', users=1, boards=1, members='5:2', stdout=io.StringIO())
+
+
+class TestBenchmarks(TestCase):
+
+    def test_run(self):
+        report = benchmarks.run([5, 10], iterations=2, warmup=0)
+        self.assertEqual(len(report['sizes']), 2)
+        for size in report['sizes']:
+            self.assertEqual(set(size['routes']), {route[0] for route in benchmarks.ROUTES})
+            for name, route in size['routes'].items():
+                # Metrics are read from the process, staff being authenticated from the tokens cache
+                if name == 'metrics':
+                    self.assertEqual(route['queries'], 0)
+                else:
+                    self.assertGreater(route['queries'], 0)
+                self.assertLessEqual(route['latency_ms']['p50'], route['latency_ms']['max'])
+        self.assertEqual(set(report['serialization']), set(benchmarks.SERIALIZATION_ROUTES))
+        self.assertEqual(report['authentication']['cached_token']['queries'], 0)
+        self.assertEqual(report['ranks']['index']['rank']['queries'], 1)
+        self.assertEqual(report['ranks']['sql']['rank']['queries'], 2)
+        self.assertEqual(set(report['throttling']), {'token_bucket', 'token_bucket_shared', 'drf_user_rate'})
@@ -0,0 +1,101 @@
+import io
+import random
+import threading
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite does not allow concurrent writers')
+class TestConcurrentScoreUpdates(TransactionTestCase):
+    """
+    Adjusts the score of one member from many threads at once and checks no update gets lost
+    """
+    threads = 8
+    updates_per_thread = 25
+
+    def setUp(self):
+        user = user_model.objects.create_user(
+            username='testeur', email='test@test.com', password='testpassword123'
+        )
+        self.board = Board.objects.create(title='hello board')
+        self.member = self.board.add_member('testeur', user.id, score=0)
+
+    def run_in_threads(self, update):
+        errors = []
+
+        def target():
+            try:
+                for _ in range(self.updates_per_thread):
+                    update()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_lost_update(self):
+        board = Board.objects.get(id=self.board.id)
+        self.run_in_threads(lambda: board.update_member(self.member.id, score=F('score') + 1))
+        self.assertEqual(
+            board.members.get(id=self.member.id).score,
+            self.threads * self.updates_per_thread
+        )
+
+    def test_no_lost_update_through_settle(self):
+        from ..models import settle_scores
+        self.run_in_threads(lambda: settle_scores([self.board.id], delta=1))
+        self.assertEqual(
+            self.board.members.get(id=self.member.id).score,
+            self.threads * self.updates_per_thread
+        )
+
+    def test_aggregates_stay_exact(self):
+        # Members added and moved concurrently : the aggregates must match the members afterwards
+        users = iter([user_model.objects.create_user(
+            username=f'testeur_{i}', email=f'test_{i}@test.com', password='testpassword123'
+        ) for i in range(self.threads * self.updates_per_thread)])
+        lock = threading.Lock()
+
+        def update():
+            with lock:
+                user = next(users)
+            board = Board.objects.get(id=self.board.id)
+            member = board.add_member(user.username, user.id, score=random.randint(-1000, 1000))
+            board.update_member(member.id, score=F('score') + random.randint(-1000, 1000))
+
+        self.run_in_threads(update)
+        call_command('recompute_board_aggregates', check=True, stdout=io.StringIO())
+        self.board.refresh_from_db()
+        self.assertEqual(self.board.members_count, self.threads * self.updates_per_thread + 1)
+
+    def test_turns_are_never_taken_twice(self):
+        # As many turns as members, each bumping the member taken behind all the others
+        users = [user_model.objects.create_user(
+            username=f'testeur_{i}', email=f'test_{i}@test.com', password='testpassword123'
+        ) for i in range(self.threads * self.updates_per_thread - 1)]
+        self.board.add_members([{'user': user.id, 'score': i + 1} for i, user in enumerate(users)])
+        taken = []
+
+        def update():
+            board = Board.objects.get(id=self.board.id)
+            taken.append(board.take_turn(delta=1000000).id)
+
+        self.run_in_threads(update)
+        self.assertEqual(len(set(taken)), len(taken))
+        self.assertEqual(self.board.members.filter(score__lt=1000000).count(), 0)
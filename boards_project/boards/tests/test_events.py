@@ -0,0 +1,323 @@
+import asyncio
+import json
+import time
+import unittest
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+
+from .. import cache, events
+from ..asgi import BoardsApplication
+from ..models import Board, settle_scores
+
+
+user_model = get_user_model()
+
+
+class CapturingBroadcaster(events.InProcessBroadcaster):
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, board_id, event):
+        self.published.append((str(board_id), event))
+        super().publish(board_id, event)
+
+
+class TestBroadcaster(TestCase):
+
+    def test_subscriptions(self):
+        broadcaster = events.InProcessBroadcaster()
+
+        async def scenario():
+            first = broadcaster.subscribe('board-1')
+            second = broadcaster.subscribe('board-1')
+            other = broadcaster.subscribe('board-2')
+            self.assertEqual((broadcaster.subscribers_count('board-1'), broadcaster.subscribers_count()), (2, 3))
+
+            broadcaster.publish('board-1', {'type': events.MEMBER_ADDED})
+            self.assertEqual(await first.get(), {'type': events.MEMBER_ADDED})
+            self.assertEqual(await second.get(), {'type': events.MEMBER_ADDED})
+            self.assertTrue(other.queue.empty())
+
+            for subscription in (first, second, other):
+                broadcaster.unsubscribe(subscription)
+            self.assertEqual(broadcaster.subscribers_count(), 0)
+
+        asyncio.run(scenario())
+
+    @override_settings(BOARDS_EVENTS_QUEUE_SIZE=2)
+    def test_slow_subscribers_overflow(self):
+        broadcaster = events.InProcessBroadcaster()
+
+        async def scenario():
+            subscription = broadcaster.subscribe('board-1')
+            for i in range(3):
+                broadcaster.publish('board-1', {'type': events.MEMBER_UPDATED, 'i': i})
+            await asyncio.sleep(0)
+            self.assertIsNone(await subscription.get())
+            self.assertTrue(subscription.overflowed)
+
+        asyncio.run(scenario())
+
+
+class TestPublishing(TransactionTestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.broadcaster = CapturingBroadcaster()
+        events._broadcaster = self.broadcaster
+        self.addCleanup(setattr, events, '_broadcaster', None)
+        self.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        self.board = Board.objects.create(title='hello board')
+
+    def test_member_changes_are_published(self):
+        board_id = str(self.board.id)
+        member = self.board.add_member('testeur_1', self.user.id, score=10)
+        self.board.update_member(member.id, score=12)
+        settle_scores([self.board.id], delta=1)
+        self.board.remove_member(member.id)
+        self.board.delete()
+
+        published = [(board, event['type']) for board, event in self.broadcaster.published]
+        self.assertEqual(published, [(board_id, event_type) for event_type in (
+            events.MEMBER_ADDED, events.MEMBER_UPDATED, events.MEMBERS_SETTLED,
+            events.MEMBER_REMOVED, events.BOARD_DELETED,
+        )])
+        self.assertEqual(self.broadcaster.published[1][1]['member']['score'], 12)
+        self.assertEqual(self.broadcaster.published[2][1]['members'], [{'id': str(member.id), 'score': 13}])
+
+    def test_nothing_is_published_on_rollback(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.board.add_member('testeur_1', self.user.id, score=10)
+            raise RuntimeError
+        self.assertEqual(self.broadcaster.published, [])
+
+
+class ASGITestCase(TransactionTestCase):
+    """
+    Drives the ASGI application as a server would, with the requests handled in threads :
+    the data must be committed to be seen by them
+    """
+
+    def setUp(self):
+        cache.get_cache().clear()
+        events._broadcaster = None
+        self.addCleanup(setattr, events, '_broadcaster', None)
+        self.application = BoardsApplication(get_wsgi_application())
+        self.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        self.other = user_model.objects.create_user(
+            username='testeur_2', email='test_2@test.com', password='testpassword123'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.board = Board.objects.create(title='hello board')
+        self.member = self.board.add_member('testeur_1', self.user.id, score=10)
+        self.events_path = reverse('board_details', kwargs={'board_id': self.board.id}) + 'events/'
+
+    def scope(self, path, query=b'', headers=()):
+        return {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'root_path': '',
+            'path': path, 'query_string': query, 'headers': list(headers),
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        }
+
+    def authorization(self, token=None):
+        return [(b'authorization', f'Token {token or self.token.key}'.encode())]
+
+    async def request(self, scope, disconnect=None):
+        """
+        Returns the status, headers and body of the response. The client disconnects once
+        `disconnect` is set, if given.
+        """
+        messages = []
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await (disconnect or asyncio.Event()).wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        await self.application(scope, receive, send)
+        headers = {key.decode(): value.decode() for key, value in messages[0].get('headers', ())}
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], headers, body
+
+    def parse_events(self, body):
+        return [json.loads(line[len('data: '):]) for line in body.decode().splitlines() if line.startswith('data: ')]
+
+    async def in_thread(self, func, *args):
+        """
+        Changes data from another thread, as another request would
+        """
+        def run():
+            try:
+                func(*args)
+            finally:
+                connection.close()
+        await asyncio.get_event_loop().run_in_executor(None, run)
+
+    async def wait_for_subscribers(self, count):
+        while events.get_broadcaster().subscribers_count(self.board.id) < count:
+            await asyncio.sleep(0.01)
+
+
+class TestEventStreams(ASGITestCase):
+
+    def test_authentication(self):
+        status, headers, _ = asyncio.run(self.request(self.scope(self.events_path)))
+        self.assertEqual((status, headers['www-authenticate']), (401, 'Token'))
+
+        status, _, _ = asyncio.run(self.request(self.scope(self.events_path, headers=self.authorization('nope'))))
+        self.assertEqual(status, 401)
+
+        other_token = Token.objects.create(user=self.other)
+        status, _, _ = asyncio.run(self.request(self.scope(self.events_path, query=f'token={other_token}'.encode())))
+        self.assertEqual(status, 403)
+
+    def test_events_are_streamed(self):
+        async def scenario():
+            stream = asyncio.ensure_future(self.request(self.scope(self.events_path, headers=self.authorization())))
+            await self.wait_for_subscribers(1)
+            await self.in_thread(self.scenario_changes)
+            return await asyncio.wait_for(stream, 5)
+
+        status, headers, body = asyncio.run(scenario())
+        self.assertEqual((status, headers['content-type']), (200, 'text/event-stream'))
+        streamed = self.parse_events(body)
+        self.assertEqual([event['type'] for event in streamed],
+                         [events.MEMBER_ADDED, events.MEMBER_UPDATED, events.BOARD_DELETED])
+        self.assertEqual(streamed[0]['member']['username'], 'testeur_2')
+        self.assertEqual(events.get_broadcaster().subscribers_count(), 0)
+
+    def scenario_changes(self):
+        member = self.board.add_member('testeur_2', self.other.id, score=5)
+        self.board.update_member(member.id, score=7)
+        self.board.delete()
+
+    def test_stream_ends_when_the_subscriber_is_removed(self):
+        async def scenario():
+            stream = asyncio.ensure_future(self.request(self.scope(self.events_path, headers=self.authorization())))
+            await self.wait_for_subscribers(1)
+            await self.in_thread(self.board.remove_member, self.member.id)
+            return await asyncio.wait_for(stream, 5)
+
+        _, _, body = asyncio.run(scenario())
+        self.assertEqual([event['type'] for event in self.parse_events(body)], [events.MEMBER_REMOVED])
+
+    @override_settings(BOARDS_EVENTS_HEARTBEAT=0.05)
+    def test_keepalive_and_disconnection(self):
+        async def scenario():
+            disconnect = asyncio.Event()
+            stream = asyncio.ensure_future(
+                self.request(self.scope(self.events_path, headers=self.authorization()), disconnect)
+            )
+            await self.wait_for_subscribers(1)
+            await asyncio.sleep(0.2)
+            disconnect.set()
+            return await asyncio.wait_for(stream, 5)
+
+        _, _, body = asyncio.run(scenario())
+        self.assertIn(b': keepalive\n\n', body)
+        self.assertEqual(events.get_broadcaster().subscribers_count(), 0)
+
+
+class TestLongPolling(ASGITestCase):
+
+    def get_board(self):
+        return asyncio.run(self.request(self.scope(
+            reverse('board_details', kwargs={'board_id': self.board.id}), headers=self.authorization()
+        )))
+
+    def test_waits_for_a_change(self):
+        status, headers, _ = self.get_board()
+        self.assertEqual(status, 200)
+        etag = headers['etag']
+        path = reverse('board_members', kwargs={'board_id': self.board.id})
+        scope = self.scope(path, query=b'wait=5', headers=self.authorization() + [(b'if-none-match', etag.encode())])
+
+        async def scenario():
+            poll = asyncio.ensure_future(self.request(scope))
+            await self.wait_for_subscribers(1)
+            self.assertFalse(poll.done())
+            await self.in_thread(lambda: self.board.update_member(self.member.id, score=42))
+            return await asyncio.wait_for(poll, 5)
+
+        status, headers, body = asyncio.run(scenario())
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['etag'], etag)
+        self.assertEqual(json.loads(body)[0]['score'], 42)
+
+    def test_times_out_unchanged(self):
+        _, headers, _ = self.get_board()
+        path = reverse('board_details', kwargs={'board_id': self.board.id})
+        scope = self.scope(path, query=b'wait=0.1',
+                           headers=self.authorization() + [(b'if-none-match', headers['etag'].encode())])
+        start = time.monotonic()
+        status, _, _ = asyncio.run(self.request(scope))
+        self.assertEqual(status, 304)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(events.get_broadcaster().subscribers_count(), 0)
+
+
+class TestManySubscribers(ASGITestCase):
+    """
+    Thousands of streams are held by one event loop, and all get the events
+    """
+    subscribers_count = 2000
+
+    def test_fan_out(self):
+        async def scenario():
+            streams = [
+                asyncio.ensure_future(self.request(self.scope(self.events_path, headers=self.authorization())))
+                for _ in range(self.subscribers_count)
+            ]
+            await asyncio.wait_for(self.wait_for_subscribers(self.subscribers_count), 60)
+            start = time.monotonic()
+            await self.in_thread(self.board.delete)
+            responses = await asyncio.wait_for(asyncio.gather(*streams), 30)
+            return responses, time.monotonic() - start
+
+        responses, elapsed = asyncio.run(scenario())
+        self.assertEqual(len(responses), self.subscribers_count)
+        for status, _, body in responses:
+            self.assertEqual(status, 200)
+            self.assertEqual([event['type'] for event in self.parse_events(body)], [events.BOARD_DELETED])
+        # Far above what a loop needs to notify them, so that slow machines do not fail it
+        self.assertLess(elapsed, 10)
+        self.assertEqual(events.get_broadcaster().subscribers_count(), 0)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'LISTEN / NOTIFY is specific to PostgreSQL')
+class TestPostgresBroadcaster(TransactionTestCase):
+
+    def test_events_go_through_notify(self):
+        broadcaster = events.PostgresBroadcaster()
+
+        async def scenario():
+            subscription = broadcaster.subscribe('board-1')
+            broadcaster.publish('board-1', {'type': events.MEMBER_ADDED})
+            broadcaster.publish('board-1', {'type': events.MEMBER_UPDATED, 'padding': 'x' * 8000})
+            received = [await asyncio.wait_for(subscription.get(), 5) for _ in range(2)]
+            broadcaster.unsubscribe(subscription)
+            return received
+
+        try:
+            received = asyncio.run(scenario())
+        finally:
+            broadcaster._listener.close()
+        self.assertEqual(received, [{'type': events.MEMBER_ADDED}, {'type': events.BOARD_CHANGED}])
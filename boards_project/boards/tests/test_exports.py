@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import tracemalloc
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board, BoardMember
+from ..serializers import BoardSerializer
+
+
+user_model = get_user_model()
+
+
+class TestExportViews(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 3 boards : 2 of them with the first user as a member, one being empty
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_members([{'user': user.id, 'score': i} for i, user in enumerate(cls.users)])
+        cls.other_board = Board.objects.create(title='other board')
+        cls.other_board.add_member('testeur_1', cls.users[0].id, score=1)
+        cls.empty_board = Board.objects.create(title='empty board')
+        cls.staff = user_model.objects.create_user(
+            username='staff', email='staff@test.com', password='testpassword123', is_staff=True
+        )
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def export(self, export_format, **params):
+        response = self.client.get(reverse('export_boards', kwargs={'export_format': export_format}), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_serializer(self):
+        lines = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        boards = Board.objects.filter(id__in=[self.board.id, self.other_board.id]).order_by('id')
+        expected = json.loads(JSONRenderer().render(BoardSerializer(boards, many=True).data))
+        self.assertEqual(lines, expected)
+
+    def test_csv_has_one_line_per_member(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv'))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(
+            [row['member_score'] for row in rows if row['board_id'] == str(self.board.id)],
+            ['0', '1', '2']
+        )
+
+    def test_staff_exports_every_board(self):
+        self.client.force_authenticate(user=self.staff)
+        lines = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertIn({'id': str(self.empty_board.id), 'title': 'empty board', 'members': []}, lines)
+
+    def test_since_only_exports_modified_boards(self):
+        since = timezone.now()
+        self.other_board.reset_score(self.other_board.members.get().id, 10)
+        lines = [json.loads(line) for line in self.export('ndjson', since=since.isoformat()).splitlines()]
+        self.assertEqual([line['id'] for line in lines], [str(self.other_board.id)])
+
+    def test_invalid_parameters(self):
+        url = reverse('export_boards', kwargs={'export_format': 'xml'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('export_boards', kwargs={'export_format': 'csv'})
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+
+
+class TestExportMemory(TestCase):
+    """
+    Checks the memory used while exporting does not grow with the number of members
+    """
+    sizes = (5000, 100000)
+
+    @classmethod
+    def setUpTestData(cls):
+        users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com')
+            for i in range(100)
+        ])
+        boards = Board.objects.bulk_create([Board(title=f'board {i}') for i in range(max(cls.sizes) // len(users))])
+        cls.boards = [board.id for board in boards]
+        BoardMember.objects.bulk_create([
+            BoardMember(username=user.username, score=i, user=user, board=board)
+            for board in boards
+            for i, user in enumerate(users)
+        ])
+        cls.staff = user_model.objects.create_user(
+            username='staff', email='staff@test.com', password='testpassword123', is_staff=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+
+    def get_peak_memory(self, export_format, members_count):
+        """
+        Exports the boards holding the first members_count members, returns the peak of
+        memory allocated while consuming the stream
+        """
+        boards_count = members_count // 100
+        Board.objects.filter(id__in=self.boards[boards_count:]).update(updated_at=timezone.now())
+        since = timezone.now()
+        Board.objects.filter(id__in=self.boards[:boards_count]).update(updated_at=timezone.now())
+
+        url = reverse('export_boards', kwargs={'export_format': export_format})
+        tracemalloc.start()
+        response = self.client.get(url, {'since': since.isoformat()})
+        lines = sum(1 for _ in response.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertEqual(lines, boards_count if export_format == 'ndjson' else members_count + 1)
+        return peak
+
+    def test_memory_is_bounded(self):
+        for export_format in ('ndjson', 'csv'):
+            small, large = [self.get_peak_memory(export_format, size) for size in self.sizes]
+            with self.subTest(export_format=export_format, small=small, large=large):
+                # 20 times more members, far less than twice the memory
+                self.assertLess(large, small * 1.5)
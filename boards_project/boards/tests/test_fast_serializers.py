@@ -0,0 +1,109 @@
+import datetime
+import decimal
+import uuid
+from collections import OrderedDict
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board
+from ..renderers import FastJSONRenderer
+
+
+user_model = get_user_model()
+
+
+class TestFastSerializers(TestCase):
+    """
+    Golden tests : the fast path must answer the very same bytes as the serializers
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        usernames = ['testeur', 'Jérôme "JJ"', 'émoji \U0001F37A', 'line\u2028separator', '<tag>&\\']
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(len(usernames))]
+        cls.board = Board.objects.create(title='Café \u2029 "board"')
+        cls.board.add_members([
+            {'user': user.id, 'username': username, 'score': score}
+            for user, username, score in zip(cls.users, usernames, [3, -1, 3, 0, 2 ** 31 - 1])
+        ])
+        cls.other_board = Board.objects.create(title='other board')
+        cls.other_board.add_member('testeur', cls.users[0].id, score=1)
+        Board.objects.create(title='empty board')
+        cls.staff = user_model.objects.create_user(
+            username='staff', email='staff@test.com', password='testpassword123', is_staff=True
+        )
+        cls.member = cls.board.members.get(user=cls.users[1])
+
+    def get_both(self, url, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        responses = []
+        for fast in (False, True):
+            cache.get_cache().clear()
+            with override_settings(BOARDS_FAST_SERIALIZATION=fast):
+                responses.append(client.get(url))
+        return responses
+
+    def assertSameResponses(self, url, user):
+        slow, fast = self.get_both(url, user)
+        self.assertEqual(slow.status_code, fast.status_code)
+        self.assertEqual(slow['Content-Type'], fast['Content-Type'])
+        self.assertEqual(slow.content, fast.content)
+        return fast
+
+    def test_boards(self):
+        response = self.assertSameResponses(reverse('boards'), self.users[0])
+        self.assertEqual(len(response.json()), 2)
+        response = self.assertSameResponses(reverse('boards'), self.staff)
+        self.assertEqual(len(response.json()), 3)
+        self.assertSameResponses(reverse('boards'), self.users[4])
+
+    def test_members(self):
+        response = self.assertSameResponses(
+            reverse('board_members', kwargs={'board_id': self.board.id}), self.users[0]
+        )
+        self.assertIn(b'\\u2028', response.content)
+
+    def test_member_details(self):
+        self.assertSameResponses(
+            reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': self.member.id}),
+            self.users[0],
+        )
+        response = self.assertSameResponses(
+            reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': uuid.uuid4()}),
+            self.users[0],
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_renderer(self):
+        data = OrderedDict([
+            ('uuid', uuid.uuid4()),
+            ('text', 'é \u2028 \u2029 "quoted" \U0001F37A'),
+            ('lazy', gettext_lazy('Not found.')),
+            ('error', ErrorDetail('Invalid', code='invalid')),
+            ('datetime', timezone.now()),
+            ('naive', datetime.datetime(2020, 1, 2, 3, 4, 5, 678901)),
+            ('date', datetime.date(2020, 1, 2)),
+            ('decimal', decimal.Decimal('1.10')),
+            ('numbers', [0, -1, 2 ** 63 - 1, 1.5, True, None]),
+            ('nested', {1: 'int key', 'tuple': (1, 2), 'set': {3}}),
+        ])
+        # Integers over 64 bits are rendered by JSONRenderer
+        for value in [data, [data], {'big': 2 ** 70}, {}, [], 'text', None]:
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
@@ -0,0 +1,161 @@
+import gzip
+import re
+from unittest import skipIf
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..compression import brotli
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+class TestFieldsets(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_members([{'user': user.id, 'score': i} for i, user in enumerate(cls.users)])
+        cls.member = cls.board.members.get(user=cls.users[1])
+        Board.objects.create(title='other board').add_member('testeur_1', cls.users[0].id, score=1)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def get(self, url, params):
+        """
+        Gets the payload with and without the fast path, which must agree, along with the columns read
+        """
+        payloads = []
+        for fast in (False, True):
+            cache.get_cache().clear()
+            with override_settings(BOARDS_FAST_SERIALIZATION=fast), \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            payloads.append(response.content)
+        self.assertEqual(payloads[0], payloads[1])
+        return response.json(), ' '.join(
+            ' '.join(re.findall(r'SELECT (.*?) FROM', query['sql'])) for query in queries
+        )
+
+    def test_boards(self):
+        boards, columns = self.get(reverse('boards'), {'fields': 'id,title'})
+        self.assertEqual({tuple(board) for board in boards}, {('id', 'title')})
+        self.assertNotIn('boards_boardmember"."score', columns)
+
+        boards, columns = self.get(reverse('boards'), {'fields': 'title,members'})
+        board = next(board for board in boards if board['title'] == 'hello board')
+        self.assertEqual(board['members'], [str(member.id) for member in self.board.leaderboard()])
+        self.assertNotIn('boards_boardmember"."score', columns)
+
+        boards, columns = self.get(reverse('boards'), {'fields': 'title,members.username,members.score'})
+        board = next(board for board in boards if board['title'] == 'hello board')
+        self.assertEqual(board['members'], [
+            {'username': 'testeur_1', 'score': 0},
+            {'username': 'testeur_2', 'score': 1},
+            {'username': 'testeur_3', 'score': 2},
+        ])
+        self.assertNotIn('boards_boardmember"."user_id', columns)
+
+        # Relations returned but not expanded are ids
+        boards, _ = self.get(reverse('boards'), {'expand': 'members'})
+        self.assertEqual(set(boards[0]['members'][0]), {'id', 'username', 'score', 'user', 'board'})
+
+    def test_board_details(self):
+        url = reverse('board_details', kwargs={'board_id': self.board.id})
+        board, _ = self.get(url, {'fields': 'members.score'})
+        self.assertEqual(board, {'members': [{'score': 0}, {'score': 1}, {'score': 2}]})
+        # Each fieldset is cached on its own
+        self.assertEqual(self.client.get(url).json()['title'], 'hello board')
+
+    def test_members(self):
+        members, columns = self.get(
+            reverse('board_members', kwargs={'board_id': self.board.id}), {'fields': 'id,score'}
+        )
+        self.assertEqual(members[0], {'id': str(self.board.leaderboard()[0].id), 'score': 0})
+        self.assertNotIn('"username"', columns)
+
+        member, _ = self.get(
+            reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': self.member.id}),
+            {'fields': 'username'},
+        )
+        self.assertEqual(member, {'username': 'testeur_2'})
+
+    def test_leaderboard(self):
+        response = self.client.get(
+            reverse('board_leaderboard', kwargs={'board_id': self.board.id}), {'fields': 'username', 'limit': 2}
+        )
+        self.assertEqual(response.data['results'], [{'username': 'testeur_1'}, {'username': 'testeur_2'}])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_profile(self):
+        response = self.client.get(reverse('user_profile'), {'fields': 'username,memberships.score'})
+        self.assertEqual(response.json(), {'username': 'testeur_1', 'memberships': [{'score': 0}, {'score': 1}]})
+
+    def test_unknown_fields(self):
+        url = reverse('boards')
+        for params in ({'fields': 'id,secret'}, {'fields': 'members.secret'}, {'expand': 'title'}):
+            for fast in (False, True):
+                with override_settings(BOARDS_FAST_SERIALIZATION=fast):
+                    self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+@override_settings(COMPRESSION_MIN_LENGTH=100)
+class TestCompression(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        for i in range(10):
+            Board.objects.create(title=f'board {i}').add_member('testeur_1', cls.user.id, score=i)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get(reverse('boards'))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(reverse('boards'), HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_gzip(self):
+        plain = self.client.get(reverse('boards'))
+        response = self.client.get(reverse('boards'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_short_response(self):
+        response = self.client.get(reverse('user_profile'), {'fields': 'id'}, HTTP_ACCEPT_ENCODING='br')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @skipIf(brotli is None, 'brotli is not installed')
+    def test_streaming(self):
+        url = reverse('export_boards', kwargs={'export_format': 'ndjson'})
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), plain)
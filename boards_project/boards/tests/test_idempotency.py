@@ -0,0 +1,152 @@
+import time
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..idempotency import IN_PROGRESS, Attempt
+from ..models import Board, BoardChange, BoardMember
+
+
+user_model = get_user_model()
+
+
+class TestIdempotencyKeys(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 3 users and a board, the first 2 users being members of it
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.member = cls.board.add_member('testeur_1', cls.users[0].id, score=10)
+        cls.board.add_member('testeur_2', cls.users[1].id, score=10)
+        cls.url = reverse('board_members', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def add(self, key, user=None, **kwargs):
+        data = {'user': str((user or self.users[2]).id), 'score': 5}
+        return self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY=key, **kwargs)
+
+    def test_retry_is_replayed(self):
+        first = self.add('key-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+        changes = BoardChange.objects.count()
+        with mock.patch.object(Board, 'add_member') as add_member:
+            retry = self.add('key-1')
+        add_member.assert_not_called()
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(BoardChange.objects.count(), changes)
+
+        # Without a key, the duplicate is a conflict
+        self.assertEqual(self.client.post(self.url, {'user': str(self.users[2].id)}, format='json').status_code, 409)
+
+    def test_errors_are_replayed(self):
+        self.assertEqual(self.add('key-1', user=self.users[1]).status_code, 409)
+        self.board.remove_member(self.board.members.get(user=self.users[1]).id)
+        retry = self.add('key-1', user=self.users[1])
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (409, 'true'))
+
+    def test_key_reused_for_another_request(self):
+        self.add('key-1')
+        self.assertEqual(self.client.post(self.url, {'user': str(self.users[1].id)}, format='json',
+                                          HTTP_IDEMPOTENCY_KEY='key-1').status_code, 422)
+
+    def test_keys_are_per_user(self):
+        self.add('key-1')
+        self.client.force_authenticate(user=self.users[1])
+        # Executed again, the member now exists
+        response = self.add('key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_request_in_progress(self):
+        with mock.patch('boards.idempotency.get_cache') as get_cache:
+            get_cache.return_value.add.return_value = False
+            get_cache.return_value.get.return_value = IN_PROGRESS
+            self.assertEqual(self.add('key-1').status_code, 409)
+        self.assertEqual(self.add('key-1').status_code, 200)
+
+    def test_unhandled_errors_can_be_retried(self):
+        with mock.patch.object(Board, 'add_member', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.add('key-1')
+        self.assertEqual(self.add('key-1').status_code, 200)
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=1)
+    def test_abandoned_attempts_can_be_retried(self):
+        # A worker killed mid-request leaves its key locked
+        with mock.patch.object(Board, 'add_member', side_effect=RuntimeError), \
+                mock.patch.object(Attempt, 'abort'):
+            with self.assertRaises(RuntimeError):
+                self.add('key-1')
+        self.assertEqual(self.add('key-1').status_code, 409)
+        time.sleep(1.1)
+        self.assertEqual(self.add('key-1').status_code, 200)
+        # The response is stored for longer
+        time.sleep(1.1)
+        self.assertEqual(self.add('key-1')['Idempotent-Replayed'], 'true')
+
+    def test_other_mutating_views(self):
+        member_url = reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': self.member.id})
+        for _ in range(2):
+            response = self.client.patch(member_url, {'delta': 5}, format='json', HTTP_IDEMPOTENCY_KEY='key-2')
+            self.assertEqual(response.json()['score'], 15)
+        for _ in range(2):
+            response = self.client.post(reverse('settle_scores'), {'boards': [str(self.board.id)], 'delta': 1},
+                                        format='json', HTTP_IDEMPOTENCY_KEY='key-3')
+            self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(self.board.members.get(id=self.member.id).score, 16)
+
+    def test_reads_ignore_keys(self):
+        response = self.client.get(self.url, HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self.add('key-1').status_code, 200)
+
+
+class TestMemberUniqueness(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        cls.board = Board.objects.create(title='hello board')
+        cls.member = cls.board.add_member('testeur_1', cls.user.id, score=10)
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def test_constraint(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BoardMember.objects.create(username='again', score=0, user=self.user, board=self.board)
+
+    def test_upsert(self):
+        member = self.board.add_member('renamed', self.user.id, score=3, upsert=True)
+        self.assertEqual((member.id, member.username, member.score), (self.member.id, 'renamed', 3))
+        self.board.refresh_from_db()
+        self.assertEqual((self.board.members_count, self.board.min_score), (1, 3))
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('board_members', kwargs={'board_id': self.board.id})
+        response = client.post(f'{url}?upsert', {'user': str(self.user.id), 'score': 7}, format='json')
+        self.assertEqual((response.status_code, response.json()['score']), (200, 7))
@@ -0,0 +1,178 @@
+import datetime
+import io
+import time
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import jobs
+from ..models import Job
+
+
+user_model = get_user_model()
+
+
+@jobs.job
+def noop(*args, **kwargs):
+    pass
+
+
+@jobs.job(max_attempts=2)
+def fail(message):
+    raise RuntimeError(message)
+
+
+def not_a_job():
+    pass
+
+
+@override_settings(JOBS_RETRY_DELAY=10, JOBS_MAX_RETRY_DELAY=60, JOBS_LOCK_TIMEOUT=600)
+class TestJobs(TestCase):
+
+    def run_worker(self, **options):
+        worker = jobs.Worker(**dict({'concurrency': 4, 'batch_size': 10, 'poll_interval': 0}, **options))
+        worker.run(once=True)
+        return worker
+
+    def test_jobs_are_run_and_deleted(self):
+        jobs.enqueue(noop, 1, 'two', three=3)
+        jobs.enqueue_many(noop, [(i,) for i in range(20)])
+        worker = self.run_worker()
+        self.assertEqual((worker.done, worker.failed), (21, 0))
+        self.assertFalse(Job.objects.exists())
+
+    def test_only_jobs_are_enqueued(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue(not_a_job)
+        with self.assertRaises(ValueError):
+            jobs.enqueue_on_commit(not_a_job)
+        # Nor run, whatever the queue holds
+        Job.objects.create(name=f'{__name__}.not_a_job', arguments='[[], {}]', max_attempts=1)
+        with self.assertLogs('boards.jobs', 'WARNING'):
+            self.assertEqual(self.run_worker().failed, 1)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = jobs.enqueue(fail, 'boom')
+        with self.assertLogs('boards.jobs', 'WARNING'):
+            self.assertEqual(self.run_worker().failed, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertAlmostEqual((job.run_at - timezone.now()).total_seconds(), 10, delta=2)
+
+        # Not due yet
+        self.assertEqual(self.run_worker().failed, 0)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs('boards.jobs', 'WARNING'):
+            self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_retry_delay(self):
+        self.assertEqual([jobs.retry_delay(attempts) for attempts in range(1, 6)], [10, 20, 40, 60, 60])
+
+    def test_stale_jobs_are_requeued(self):
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        stale = jobs.enqueue(noop)
+        exhausted = jobs.enqueue(noop)
+        running = jobs.enqueue(noop)
+        Job.objects.update(status=Job.RUNNING, attempts=1, locked_at=long_ago)
+        Job.objects.filter(id=exhausted.id).update(attempts=exhausted.max_attempts)
+        Job.objects.filter(id=running.id).update(locked_at=timezone.now())
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {stale.id: Job.PENDING, exhausted.id: Job.FAILED, running.id: Job.RUNNING})
+
+    def test_command(self):
+        jobs.enqueue_many(noop, [()] * 3)
+        output = io.StringIO()
+        call_command('run_jobs', once=True, concurrency=2, poll_interval=0, stdout=output)
+        self.assertIn('3 jobs done, 0 failed', output.getvalue())
+
+
+class TestWorkerThroughput(TestCase):
+    """
+    The queue costs a few queries per batch whatever the number of jobs
+    """
+    jobs_count = 1000
+
+    def assertThroughput(self, **options):
+        jobs.enqueue_many(noop, [(i,) for i in range(self.jobs_count)])
+        worker = jobs.Worker(batch_size=100, poll_interval=0, **options)
+        start = time.monotonic()
+        with CaptureQueriesContext(connection) as queries:
+            worker.run(once=True)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(worker.done, self.jobs_count)
+        self.assertFalse(Job.objects.exists())
+        # Claims and outcomes of the 10 batches, the last claim finding nothing, and a requeue
+        self.assertLessEqual(len(queries), 10 * 8 + 4 + 2)
+        # Far below what no-op jobs reach, so that slow machines do not fail it
+        self.assertGreater(self.jobs_count / elapsed, 100)
+
+    def test_threads(self):
+        self.assertThroughput(concurrency=8, pool=jobs.THREAD)
+
+    def test_processes(self):
+        self.assertThroughput(concurrency=2, pool=jobs.PROCESS)
+
+
+class TestInvitations(TransactionTestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        self.other = user_model.objects.create_user(
+            username='testeur_2', email='test_2@test.com', password='testpassword123'
+        )
+
+    def test_unknown_emails_are_invited(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('boards'), {'title': 'hello board', 'members': [
+            {'email': 'test_2@test.com'},
+            {'email': 'nobody@test.com'},
+            {'email': 'someone@test.com'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.count(), 2)
+
+        jobs.Worker(poll_interval=0).run(once=True)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['nobody@test.com', 'someone@test.com'])
+        self.assertEqual(mail.outbox[0].subject, 'testeur_1 invited you to hello board')
+
+    def test_emails_are_matched_case_insensitively(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('boards'), {'title': 'hello board', 'members': [
+            {'email': 'Test_2@Test.com'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(member['username'] for member in response.data['members']), ['testeur_1', 'testeur_2']
+        )
+        self.assertFalse(Job.objects.exists())
+
+    def test_nothing_is_enqueued_on_rollback(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        # The same user by email and by id, only found out once the board is inserted
+        response = client.post(reverse('boards'), {'title': 'hello board', 'members': [
+            {'email': 'nobody@test.com'},
+            {'email': 'test_2@test.com'},
+            {'user': str(self.other.id)},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,86 @@
+import re
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache, metrics
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+class TestRequestMetrics(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        cls.staff = user_model.objects.create_user(
+            username='staff', email='staff@test.com', password='testpassword123', is_staff=True
+        )
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_member('testeur_1', cls.user.id, score=1)
+        cls.members_url = reverse('board_members', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        metrics.reset_routes()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_timings(self, response):
+        return {
+            match.group('name'): match.groupdict()
+            for match in re.finditer(
+                r'(?P<name>\w+);dur=(?P<dur>[\d.]+)(?:;desc="(?P<desc>[^"]*)")?', response['Server-Timing']
+            )
+        }
+
+    def test_server_timing(self):
+        response = self.client.get(self.members_url)
+        timings = self.get_timings(response)
+        self.assertEqual(set(timings), {'total', 'db', 'serialize'})
+        # The board lookup, the memberships check and the members
+        self.assertEqual(timings['db']['desc'], '3 queries, 0 duplicates')
+        self.assertGreater(float(timings['serialize']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+        # Served from the cache
+        timings = self.get_timings(self.client.get(self.members_url))
+        self.assertEqual(timings['db']['desc'], '1 queries, 0 duplicates')
+        self.assertEqual(timings['serialize']['dur'], '0.0')
+
+    def test_duplicates(self):
+        request_metrics = metrics.RequestMetrics()
+        for sql in ('SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1'):
+            request_metrics.execute(lambda *args: None, sql, None, False, {})
+        self.assertEqual((request_metrics.queries, request_metrics.duplicates), (4, 2))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('boards.metrics', 'WARNING') as logs:
+            self.client.get(self.members_url)
+        self.assertIn('route="GET api/v1/boards/<uuid:board_id>/members/" status=200', logs.output[0])
+        self.assertEqual(logs.records[0].request_metrics['queries'], 3)
+
+    def test_metrics_view(self):
+        for _ in range(3):
+            self.client.get(self.members_url)
+        self.client.get(reverse('boards'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(user=self.staff)
+        routes = self.client.get(reverse('metrics')).data['routes']
+        members = routes['GET api/v1/boards/<uuid:board_id>/members/']
+        self.assertEqual(members['count'], 3)
+        self.assertEqual(sum(bucket['count'] for bucket in members['buckets']), 3)
+        self.assertEqual(members['buckets'][-1]['le'], 'inf')
+        self.assertEqual(routes['GET api/v1/boards/']['count'], 1)
+        self.assertEqual(routes['GET api/v1/metrics/']['count'], 1)
@@ -1,6 +1,7 @@
 from django.test import TestCase
 import datetime
-from ..models import AppUser, BoardMember, Board
+from ..models import AppUser, BoardMember, Board, settle_scores
+from django.db import connection, models
 from django.db.utils import IntegrityError
 from django.contrib.auth import get_user_model
 
@@ -88,6 +89,47 @@ class TestBoardModel(TestCase):
         # cleans the board members field
         board.remove_member(member.id)
 
+    def test_members_are_bulk_added(self):
+        """
+        Adds members from their email or user id in one go, checks usernames and scores,
+        and that emails matching no user are skipped
+        Then, deletes them to reset state
+        """
+        board = Board.objects.get(id=self.board_id)
+        members_data = [
+            {'email': self.users_data[0]['email'], 'username': 'first', 'score': 10},
+            {'user': self.users[1].id},
+            {'email': 'nobody@test.com'},
+        ]
+
+        # 1 query for users, 1 for duplicates, 1 insert, 1 version and aggregates update,
+        # 1 change log insert, plus the savepoint, and the board lock where supported
+        with self.assertNumQueries(8 if connection.features.has_select_for_update else 7):
+            members = board.add_members(members_data)
+
+        self.assertEqual(len(members), 2)
+        self.assertEqual(board.members.get(user=self.users[0]).score, 10)
+        self.assertEqual(board.members.get(user=self.users[0]).username, 'first')
+        self.assertEqual(board.members.get(user=self.users[1]).username, self.users[1].username)
+
+        # Cleans the board members field
+        for member in members:
+            board.remove_member(member.id)
+
+    def test_cannot_bulk_add_existing_member(self):
+        """
+        Checks that a bulk add including an existing member raises and inserts nothing
+        """
+        board = Board.objects.get(id=self.board_id)
+        member = board.add_member('test_username', self.users[0].id)
+
+        with self.assertRaises(Exception):
+            board.add_members([{'user': self.users[1].id}, {'user': self.users[0].id}])
+        self.assertFalse(board.members.filter(user=self.users[1]).exists())
+
+        # cleans the board members field
+        board.remove_member(member.id)
+
     def test_member_is_removed(self):
         """
         Add a member to the board, removes it, then checks if it is removed from members list and scores
@@ -137,6 +179,84 @@ class TestBoardModel(TestCase):
         board.remove_member(member.id)
 
 
+    def test_member_score_is_adjusted(self):
+        """
+        Adjusts a member score from its current value in the database, checks the returned member
+        """
+        board = Board.objects.get(id=self.board_id)
+        member = board.add_member('test_username', self.users[0].id, score=10)
+
+        updated = board.update_member(member.id, score=models.F('score') + 5)
+        self.assertEqual(updated.score, 15)
+        self.assertEqual(board.members.get(id=member.id).score, 15)
+        board.remove_member(member.id)
+
+    def test_turns_are_taken(self):
+        """
+        Takes turns on an empty board, then with members : the next one is bumped behind the others
+        """
+        board = Board.objects.get(id=self.board_id)
+        self.assertIsNone(board.take_turn())
+        first, second = board.add_members([
+            {'user': self.users[0].id, 'score': 1},
+            {'user': self.users[1].id, 'score': 2},
+        ])
+
+        self.assertEqual(board.take_turn(delta=5), board.members.get(id=first.id))
+        self.assertEqual(board.members.get(id=first.id).score, 6)
+        self.assertEqual(board.take_turn(score=10).id, second.id)
+        self.assertEqual(board.leaderboard().first().id, first.id)
+        board.members.all().delete()
+
+    def test_round_is_settled(self):
+        """
+        Resets the scores of a whole board, then adjusts some members only
+        """
+        board = Board.objects.get(id=self.board_id)
+        other_board = Board.objects.create(title='other board')
+        members = board.add_members([{'user': user.id, 'score': i} for i, user in enumerate(self.users)])
+        other_member = other_board.add_member('other', self.users[0].id, score=0)
+
+        self.assertEqual(settle_scores([board.id], score=100), len(self.users))
+        self.assertEqual(set(board.members.values_list('score', flat=True)), {100})
+
+        self.assertEqual(settle_scores([board.id, other_board.id], member_ids=[members[0].id, other_member.id], delta=-1), 2)
+        self.assertEqual(board.members.get(id=members[0].id).score, 99)
+        self.assertEqual(board.members.get(id=members[1].id).score, 100)
+        self.assertEqual(other_board.members.get(id=other_member.id).score, -1)
+
+        for member in members:
+            board.remove_member(member.id)
+
+    def test_version_is_bumped_on_member_changes(self):
+        """
+        Checks every member mutation bumps the board version
+        """
+        board = Board.objects.get(id=self.board_id)
+
+        def get_version():
+            return Board.objects.get(id=self.board_id).version
+
+        version = get_version()
+        member = board.add_member('test_username', self.users[0].id)
+        self.assertEqual(get_version(), version + 1)
+        board.reset_score(member.id, 10)
+        self.assertEqual(get_version(), version + 2)
+        board.add_members([{'user': self.users[1].id}])
+        self.assertEqual(get_version(), version + 3)
+        board.remove_member(member.id)
+        self.assertEqual(get_version(), version + 4)
+
+    def test_saving_an_outdated_instance_keeps_the_version(self):
+        board = Board.objects.get(id=self.board_id)
+        member = board.add_member('test_username', self.users[0].id)
+        version = Board.objects.get(id=self.board_id).version
+
+        # board was loaded before the member was added
+        board.save()
+        self.assertEqual(Board.objects.get(id=self.board_id).version, version + 1)
+        board.remove_member(member.id)
+
     def test_board_title_is_modified(self):
         # test data
         new_board_title = 'goodbye board'
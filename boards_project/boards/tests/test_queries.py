@@ -0,0 +1,192 @@
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board, BoardMember
+from ..permissions import get_user_board_ids
+
+
+user_model = get_user_model()
+
+
+class TestQueryCounts(TestCase):
+    """
+    Pins the number of queries run by each endpoint, whatever the number of boards.
+    Requests are force authenticated, so authentication queries are not counted.
+    """
+    sizes = (1, 10, 1000)
+    members_per_board = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(cls.members_per_board)]
+        cls.staff = user_model.objects.create_user(
+            username='staff', email='staff@test.com', password='testpassword123', is_staff=True
+        )
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def create_boards(self, count):
+        boards = Board.objects.bulk_create([Board(title=f'board {i}') for i in range(count)])
+        BoardMember.objects.bulk_create([
+            BoardMember(username=user.username, score=i, user=user, board=board)
+            for board in boards
+            for i, user in enumerate(self.users)
+        ])
+        # bulk_create does not send the signals invalidating the users' memberships
+        for user in self.users:
+            cache.invalidate_user(user.id)
+        return boards
+
+    def assertNumQueriesAtEachSize(self, num, get_url, user=None):
+        """
+        Requests the url returned by get_url(boards) once the user is a member of each of
+        the sizes number of boards
+        """
+        user = user or self.users[0]
+        boards = []
+        for size in self.sizes:
+            boards += self.create_boards(size - len(boards))
+            url = get_url(boards)
+            # A fresh user instance, so nothing prefetched by a previous request is reused
+            self.client.force_authenticate(user=user_model.objects.get(id=user.id))
+            with self.subTest(size=size), self.assertNumQueries(num):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_boards_list(self):
+        # boards filtered by a membership subquery + members prefetch + archived boards
+        self.assertNumQueriesAtEachSize(3, lambda boards: reverse('boards'))
+
+    def test_boards_list_as_staff(self):
+        self.assertNumQueriesAtEachSize(3, lambda boards: reverse('boards'), user=self.staff)
+
+    def test_profile(self):
+        # memberships prefetch
+        self.assertNumQueriesAtEachSize(1, lambda boards: reverse('user_profile'))
+
+    def test_board_details(self):
+        # membership check + board + members, neither being cached yet
+        self.assertNumQueriesAtEachSize(
+            3, lambda boards: reverse('board_details', kwargs={'board_id': boards[-1].id})
+        )
+
+    def test_board_members(self):
+        # membership check + board + members, neither being cached yet
+        self.assertNumQueriesAtEachSize(
+            3, lambda boards: reverse('board_members', kwargs={'board_id': boards[-1].id})
+        )
+
+    def test_board_member_details(self):
+        # membership check + board + member
+        self.assertNumQueriesAtEachSize(3, lambda boards: reverse('board_member_details', kwargs={
+            'board_id': boards[-1].id,
+            'member_id': boards[-1].members.get(user=self.users[0]).id,
+        }))
+
+    def test_boards_list_returns_every_member(self):
+        self.create_boards(10)
+        response = self.client.get(reverse('boards'))
+        self.assertEqual(len(response.data), 10)
+        for board in response.data:
+            self.assertEqual([m['score'] for m in board['members']], list(range(self.members_per_board)))
+
+
+class TestMembershipCheck(TestCase):
+    """
+    Checks IsBoardMember costs at most one query, and none once cached,
+    on a board with 10k members
+    """
+    board_size = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com')
+            for i in range(cls.board_size + 1)
+        ])
+        cls.board = Board.objects.create(title='big board')
+        BoardMember.objects.bulk_create([
+            BoardMember(username=user.username, score=i, user=user, board=cls.board)
+            for i, user in enumerate(users[:cls.board_size])
+        ])
+        cls.member, cls.outsider = users[cls.board_size - 1], users[cls.board_size]
+        cls.urls = [
+            reverse('board_details', kwargs={'board_id': cls.board.id}),
+            reverse('board_members', kwargs={'board_id': cls.board.id}),
+            reverse('board_leaderboard', kwargs={'board_id': cls.board.id}),
+        ]
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def test_denied_requests_never_reach_the_queryset(self):
+        self.client.force_authenticate(user=self.outsider)
+        # the outsider's board ids are queried once, then cached
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.urls[0]).status_code, 403)
+        for url in self.urls:
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_cached_check_runs_no_query(self):
+        self.client.force_authenticate(user=self.member)
+        self.client.get(self.urls[0])
+        with self.assertNumQueries(0):
+            self.assertIn(self.board.id, get_user_board_ids(self.member))
+
+    def test_membership_changes_are_seen(self):
+        self.client.force_authenticate(user=self.outsider)
+        self.assertEqual(self.client.get(self.urls[1]).status_code, 403)
+        member = self.board.add_member('outsider', self.outsider.id)
+        self.assertEqual(self.client.get(self.urls[1]).status_code, 200)
+        self.board.remove_member(member.id)
+        self.assertEqual(self.client.get(self.urls[1]).status_code, 403)
+
+
+class TestDeletionQueryCounts(TestCase):
+    """
+    Pins the number of queries of the deletions of boards and users, whatever the number of
+    members deleted along with them
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com', password='!') for i in range(50)
+        ])
+
+    def create_board(self, users):
+        board = Board.objects.create(title='hello board')
+        board.add_members([{'user': user.id, 'score': i} for i, user in enumerate(users)])
+        return board
+
+    def test_board_deletion(self):
+        for size in (1, 10, 50):
+            board = Board.objects.get(id=self.create_board(self.users[:size]).id)
+            # Members, their users, deletions of both, and the tombstones of the board
+            with self.subTest(size=size), self.assertNumQueries(5):
+                board.delete()
+
+    def test_user_deletion(self):
+        for size in (1, 10):
+            user = user_model.objects.create_user(username='deleted', email='deleted@test.com', password='!')
+            boards = [self.create_board([user] + self.users[:2]) for _ in range(size)]
+            # The boards are modified at once, locked first where supported
+            with self.subTest(size=size), self.assertNumQueries(17 + connection.features.has_select_for_update):
+                user_model.objects.get(id=user.id).delete()
+            for board in boards:
+                board.refresh_from_db()
+                self.assertEqual((board.members_count, board.next_username), (2, 'testeur_0'))
@@ -0,0 +1,141 @@
+import random
+import uuid
+
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache, ranks
+from ..models import Board, BoardMember, board_modified
+
+
+user_model = get_user_model()
+
+
+class TestScoreIndex(TestCase):
+
+    def setUp(self):
+        self.ids = sorted(uuid.uuid4() for _ in range(5))
+        # Ties on 20 are broken by id, negative scores come first
+        self.index = ranks.ScoreIndex('board', 1, [
+            (20, self.ids[3]), (-5, self.ids[4]), (20, self.ids[1]), (10, self.ids[0]), (30, self.ids[2]),
+        ])
+        self.order = [self.ids[4], self.ids[0], self.ids[1], self.ids[3], self.ids[2]]
+
+    def test_queries(self):
+        self.assertEqual([member_id for _, member_id in self.index.members()], self.order)
+        self.assertEqual(self.index.rank(self.ids[3], 20), 4)
+        self.assertEqual(self.index.percentile(self.ids[3], 20), 60)
+        self.assertEqual(self.index.around(self.ids[1], 20, 1), ([(10, self.ids[0])], [(20, self.ids[3])]))
+        self.assertEqual(self.index.around(self.ids[4], -5, 2), ([], [(10, self.ids[0]), (20, self.ids[1])]))
+        # Unknown, or known with another score
+        self.assertIsNone(self.index.rank(uuid.uuid4(), 20))
+        self.assertIsNone(self.index.rank(self.ids[3], 21))
+
+    def test_changes_follow_the_version(self):
+        self.index.apply(2, scores=[(self.ids[2], -10)], removed=[self.ids[4]])
+        self.assertEqual((self.index.version, len(self.index)), (2, 4))
+        self.assertEqual(self.index.rank(self.ids[2], -10), 1)
+
+        # Version 3 was missed
+        self.index.apply(4, scores=[(uuid.uuid4(), 0)])
+        self.assertIsNone(self.index.version)
+
+    def test_least_recently_used_boards_are_evicted(self):
+        indexes = ranks.Indexes(max_members=10)
+        for board_id in 'abc':
+            indexes.put(ranks.ScoreIndex(board_id, 1, [(i, uuid.uuid4()) for i in range(4)]))
+            indexes.get('a')
+        self.assertEqual((indexes.peek('a') is not None, indexes.peek('b'), indexes.members_count), (True, None, 8))
+
+
+@override_settings(RANK_INDEX_MIN_MEMBERS=1)
+class TestRankIndex(TransactionTestCase):
+    """
+    Hooks are applied on commit : the changes are made outside of any test transaction
+    """
+
+    def setUp(self):
+        cache.get_cache().clear()
+        ranks.clear()
+        self.addCleanup(ranks.clear)
+        self.rng = random.Random(0)
+        self.users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com') for i in range(40)
+        ])
+        self.board = Board.objects.create(title='hello board')
+        self.board.add_members([{'user': user.id, 'score': self.rng.randint(0, 10)} for user in self.users[:20]])
+
+    def get_board(self):
+        return Board.objects.get(id=self.board.id)
+
+    def assertRanksMatchDatabase(self):
+        board = self.get_board()
+        self.assertEqual(ranks.check(board), [])
+        expected = [member.id for member in board.leaderboard()]
+        for rank, member_id in enumerate(expected, 1):
+            self.assertEqual(board.get_rank(member_id)[1], rank)
+
+    def test_index_is_kept_in_sync(self):
+        board = self.get_board()
+        member = board.leaderboard().last()
+        with self.assertNumQueries(4):
+            # The member, then the version before and after reading the members
+            board.get_rank(member.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(board.get_rank(member.id)[1], 20)
+        index = ranks.get_indexes().peek(board.id)
+
+        for user in self.users[20:25]:
+            board.add_member(user.username, user.id, score=self.rng.randint(0, 10))
+        board.add_members([{'user': user.id, 'score': 5} for user in self.users[25:30]])
+        for member in self.rng.sample(list(board.members.all()), 10):
+            board.reset_score(member.id, self.rng.randint(-5, 15))
+        board.update_member(member.id, score=F('score') + 3)
+        board.take_turn(delta=20)
+        for member in self.rng.sample(list(board.members.all()), 5):
+            board.remove_member(member.id)
+
+        # Every change was applied, none missed
+        self.assertEqual(index.version, self.get_board().version)
+        self.assertIs(ranks.get_index(self.get_board()), index)
+        self.assertRanksMatchDatabase()
+
+    def test_other_changes_rebuild_the_index(self):
+        index = ranks.get_index(self.get_board())
+        member = self.board.members.order_by('score', 'id').first()
+        BoardMember.objects.filter(id=member.id).update(score=100)
+        board_modified(self.board.id, members_changed=True)
+
+        rebuilt = ranks.get_index(self.get_board())
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.rank(member.id, 100), 20)
+        self.assertRanksMatchDatabase()
+
+    def test_neighbours(self):
+        board = self.get_board()
+        members = list(board.leaderboard())
+        for enabled in (False, True):
+            with override_settings(RANK_INDEX_ENABLED=enabled):
+                self.assertEqual(board.get_neighbours(members[1], 3), (members[:1], members[2:5]))
+                self.assertEqual(board.get_neighbours(members[-1], 2), (members[-3:-1], []))
+
+    def test_small_boards_are_not_indexed(self):
+        with override_settings(RANK_INDEX_MIN_MEMBERS=21):
+            self.assertIsNone(ranks.get_index(self.get_board()))
+        self.assertEqual(len(ranks.get_indexes()), 0)
+
+    def test_view(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        board = self.get_board()
+        members = list(board.leaderboard())
+        url = reverse('board_leaderboard', kwargs={'board_id': board.id})
+        for enabled in (False, True):
+            with override_settings(RANK_INDEX_ENABLED=enabled):
+                response = client.get(url, {'member': members[10].id, 'around': 2})
+            self.assertEqual((response.data['rank'], response.data['percentile']), (11, 50))
+            self.assertEqual([member['id'] for member in response.data['before'] + response.data['after']],
+                             [str(member.id) for member in members[8:10] + members[11:13]])
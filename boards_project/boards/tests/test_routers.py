@@ -0,0 +1,129 @@
+import time
+import unittest
+
+from django.conf import settings
+from django.db import transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache, routers
+from ..models import Board
+from ..permissions import get_user_board_ids
+
+
+user_model = get_user_model()
+
+
+def has_separate_replica():
+    if 'replica' not in settings.DATABASES:
+        return False
+    replica, primary = settings.DATABASES['replica'], settings.DATABASES['default']
+    return not replica.get('TEST', {}).get('MIRROR') and replica['NAME'] != primary['NAME']
+
+
+class TestPins(TestCase):
+
+    def test_pin_windows(self):
+        factory = RequestFactory()
+        now = time.time()
+        for value, pinned in ((now + 3, True), (now - 1, False), (now + 3600, False), ('nope', False)):
+            request = factory.get('/', HTTP_PRIMARY_UNTIL=str(value))
+            self.assertEqual(routers.is_pinned(request), pinned)
+            factory.cookies[routers.PIN_COOKIE] = str(value)
+            self.assertEqual(routers.is_pinned(factory.get('/')), pinned)
+            factory.cookies.clear()
+        self.assertFalse(routers.is_pinned(factory.get('/')))
+
+    def test_replica_of_the_primary_itself_is_not_used(self):
+        # As the test mirrors of a replica
+        with override_settings(REPLICA_DATABASE='default'):
+            self.assertIsNone(routers.get_replica())
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Board), 'default')
+
+
+@unittest.skipUnless(has_separate_replica(), 'Needs a `replica` alias of another database in DATABASES')
+@override_settings(REPLICA_DATABASE='replica')
+class TestReplicaRouting(TransactionTestCase):
+    """
+    The replica is a separate database, which does not replicate anything : boards created
+    on the primary only are not found when read from the replica
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = user_model.objects.create_user(
+            username='testeur_1', email='test_1@test.com', password='testpassword123'
+        )
+        self.board = Board.objects.create(title='hello board')
+        self.board.add_member('testeur_1', self.user.id, score=10)
+        # The user is replicated, and their memberships cached, not the board
+        self.user.save(using='replica', force_insert=True)
+        get_user_board_ids(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('board_details', kwargs={'board_id': self.board.id})
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('boards')).json(), [])
+        # Not the other views, nor atomic blocks
+        self.assertEqual(self.client.get(reverse('changes')).status_code, 200)
+        router = routers.ReplicaRouter()
+        routers._local.replica = True
+        try:
+            self.assertEqual(router.db_for_read(Board), 'replica')
+            self.assertEqual(router.db_for_write(Board), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Board), 'default')
+        finally:
+            routers._local.replica = False
+        self.assertEqual(router.db_for_read(Board), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        response = self.client.patch(self.url, {'title': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        until = float(response[routers.PIN_HEADER])
+        self.assertAlmostEqual(until, time.time() + settings.REPLICA_PIN_SECONDS, delta=1)
+
+        # The cookie is kept by the client
+        self.assertEqual(self.client.get(self.url).json()['title'], 'renamed')
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        # API clients send the header back
+        response = self.client.get(self.url, HTTP_PRIMARY_UNTIL=response[routers.PIN_HEADER])
+        self.assertEqual(response.status_code, 200)
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.patch(self.url, {'title': ''}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header(routers.PIN_HEADER))
+
+    def test_cached_replica_reads_expire_early(self):
+        Board.objects.using('replica').create(id=self.board.id, title='stale board')
+        with override_settings(REPLICA_PIN_SECONDS=1):
+            self.assertEqual(self.client.get(self.url).json()['title'], 'stale board')
+            time.sleep(1.1)
+            Board.objects.using('replica').filter(id=self.board.id).update(title='replicated board')
+            self.assertEqual(self.client.get(self.url).json()['title'], 'replicated board')
+
+    def test_pinned_reads_skip_the_payloads_cached_from_the_replica(self):
+        Board.objects.using('replica').create(id=self.board.id, title='stale board')
+        response = self.client.patch(self.url, {'title': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # Another client reads the lagging replica, after the invalidation of the write
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.user)
+        stale = other_client.get(self.url)
+        self.assertEqual(stale.json()['title'], 'stale board')
+
+        # The writer, pinned to the primary, does not get what the other client cached
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['title'], 'renamed')
+        self.assertNotEqual(response['ETag'], stale['ETag'])
+        self.assertEqual(self.client.get(self.url).json()['title'], 'renamed')
+        # Payloads cached from the primary are as fresh for reads from the replica
+        self.assertEqual(other_client.get(self.url).json()['title'], 'renamed')
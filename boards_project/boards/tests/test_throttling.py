@@ -0,0 +1,134 @@
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache, throttling
+from ..models import Board
+
+
+user_model = get_user_model()
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates))
+
+
+class TestTokenBucket(TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = throttling.TokenBucket(rate=2, capacity=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(0), 0.5)
+        self.assertEqual(bucket.take(0.5), 0)
+        self.assertAlmostEqual(bucket.take(0.5), 0.5)
+        # Refilled up to its capacity only
+        self.assertEqual([bucket.take(100) for _ in range(4)][:3], [0, 0, 0])
+        self.assertGreater(bucket.take(100), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        buckets = throttling.Buckets(size=2)
+        for key in ('a', 'b', 'a', 'c'):
+            buckets.take(key, 10, 1, now=0)
+        self.assertEqual(len(buckets), 2)
+        self.assertEqual(set(buckets._buckets), {'a', 'c'})
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('20/second'), (20, 1))
+        self.assertEqual(throttling.parse_rate('100/minute'), (100, 60))
+        self.assertIsNone(throttling.parse_rate(None))
+
+
+class TestTokenBucketThrottle(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 3)]
+        cls.board = Board.objects.create(title='hello board')
+        for user in cls.users:
+            cls.board.add_member(user.username, user.id, score=1)
+        cls.url = reverse('board_members', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        cache.get_cache().clear()
+        throttling.clear()
+
+    def get(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get(self.url)
+
+    def test_users_are_throttled(self):
+        with throttle_rates(user='3/minute'):
+            self.assertEqual([self.get(self.users[0]).status_code for _ in range(3)], [200] * 3)
+            response = self.get(self.users[0])
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(1 <= int(response['Retry-After']) <= 20)
+            # Each user has a bucket of their own
+            self.assertEqual(self.get(self.users[1]).status_code, 200)
+
+    def test_boards_are_throttled(self):
+        with throttle_rates(board='3/minute'):
+            statuses = [self.get(user).status_code for user in self.users * 2]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_global_limit(self):
+        with throttle_rates(**{'global': '2/minute'}):
+            self.assertEqual(self.get(self.users[0]).status_code, 200)
+            client = APIClient()
+            client.force_authenticate(user=self.users[1])
+            self.assertEqual(client.get(reverse('boards')).status_code, 200)
+            self.assertEqual(self.get(self.users[1]).status_code, 429)
+
+    @override_settings(THROTTLE_SHARED=True, THROTTLE_SYNC_INTERVAL=0)
+    def test_shared_limit(self):
+        with throttle_rates(user='5/day'):
+            self.assertEqual([self.get(self.users[0]).status_code for _ in range(3)], [200] * 3)
+            # Another process, with buckets of its own, which learns from the cache that 3 were allowed
+            throttling._buckets = throttling.Buckets(settings.THROTTLE_BUCKETS_SIZE)
+            statuses = [self.get(self.users[0]).status_code for _ in range(4)]
+        # The request going beyond is the last one allowed
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+
+class TestLoadShedding(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=1)
+    def test_requests_beyond_the_limit_are_turned_down(self):
+        responses = []
+
+        def get_response(request):
+            # A second request, while the first one is in flight
+            responses.append(middleware(self.factory.get('/')))
+            return HttpResponse()
+
+        middleware = throttling.LoadSheddingMiddleware(get_response)
+        self.assertEqual(middleware(self.factory.get('/')).status_code, 200)
+        self.assertEqual(responses[0].status_code, 503)
+        self.assertEqual(responses[0]['Retry-After'], str(settings.LOAD_SHEDDING_RETRY_AFTER))
+        self.assertEqual(throttling.in_flight.count, 0)
+
+    @override_settings(LOAD_SHEDDING_MAX_QUEUE_MS=1000)
+    def test_requests_which_queued_too_long_are_turned_down(self):
+        middleware = throttling.LoadSheddingMiddleware(lambda request: HttpResponse())
+        now = time.time()
+        for start, status in (
+            (f't={now - 5:.3f}', 503),
+            (f't={int((now - 5) * 1000000)}', 503),
+            (f'{int((now - 0.1) * 1000)}', 200),
+            ('garbage', 200),
+        ):
+            with self.subTest(start=start):
+                response = middleware(self.factory.get('/', HTTP_X_REQUEST_START=start))
+                self.assertEqual(response.status_code, status)
@@ -0,0 +1,548 @@
+from unittest import mock
+
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from .. import cache
+from ..models import Board, BoardChange, BoardMember
+from ..views import ChangesView
+
+
+user_model = get_user_model()
+
+
+class TestBoardViews(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 5 users, the first one being the requesting user
+        """
+        cls.users_data = [{
+            'username': f'testeur_{i}',
+            'email': f'test_{i}@test.com',
+            'password': 'testpassword123'
+        } for i in range(1, 6)]
+        cls.users = [user_model.objects.create_user(**user_data) for user_data in cls.users_data]
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_board_is_created_with_members(self):
+        """
+        Creates a board with members given by email, checks that the requesting user is added
+        with the score he provided and that unknown emails are skipped
+        """
+        data = {
+            'title': 'hello board',
+            'members': [
+                {'email': self.users_data[0]['email'], 'score': 10},
+                {'email': self.users_data[1]['email'], 'username': 'second'},
+                {'email': self.users_data[2]['email']},
+                {'email': 'nobody@test.com'},
+            ]
+        }
+        response = self.client.post(reverse('boards'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        board = Board.objects.get(id=response.data['id'])
+        self.assertEqual(board.members.count(), 3)
+        self.assertEqual(board.members.get(user=self.users[0]).score, 10)
+        self.assertEqual(board.members.get(user=self.users[1]).username, 'second')
+
+    def test_board_is_created_with_requesting_user_given_by_id(self):
+        data = {'title': 'hello board', 'members': [{'user': str(self.users[0].id), 'score': 10}]}
+        response = self.client.post(reverse('boards'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        board = Board.objects.get(id=response.data['id'])
+        self.assertEqual(list(board.members.values_list('user', 'score')), [(self.users[0].id, 10)])
+
+    def test_duplicate_members_are_rejected(self):
+        for members in (
+            [{'email': self.users_data[1]['email']}, {'email': self.users_data[1]['email'].upper()}],
+            [{'user': str(self.users[1].id)}, {'email': self.users_data[1]['email']}],
+            [{'user': str(self.users[0].id)}, {'email': self.users_data[0]['email']}],
+        ):
+            with self.subTest(members=members):
+                response = self.client.post(reverse('boards'), {'title': 'hello board', 'members': members}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('members', response.json())
+        self.assertFalse(Board.objects.exists())
+
+    def test_board_is_created_with_requesting_user_only(self):
+        response = self.client.post(reverse('boards'), {'title': 'hello board'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        board = Board.objects.get(id=response.data['id'])
+        self.assertEqual(list(board.members.values_list('user', flat=True)), [self.users[0].id])
+
+
+class TestBoardMembersViews(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 5 users and a board whose only member is the first user
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 6)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.board.add_member('testeur_1', cls.users[0].id, score=1)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_members_are_batch_added(self):
+        """
+        Posts a list of members, checks they are all added with the given scores
+        """
+        url = reverse('board_members', kwargs={'board_id': self.board.id})
+        data = [{'user': str(user.id), 'score': i} for i, user in enumerate(self.users[1:])]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(self.board.members.count(), 5)
+        self.assertEqual(self.board.members.get(user=self.users[4]).score, 3)
+
+    def test_batch_add_is_validated(self):
+        url = reverse('board_members', kwargs={'board_id': self.board.id})
+        response = self.client.post(url, [{'username': 'nobody'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.board.members.count(), 1)
+
+
+class TestLeaderboardView(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates a board with 5 members, two of them sharing the same score
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 6)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.members = [cls.board.add_member(user.username, user.id, score=score)
+                       for user, score in zip(cls.users, [30, 10, 20, 10, 40])]
+        cls.url = reverse('board_leaderboard', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def expected_order(self):
+        return [str(member.id) for member in sorted(self.members, key=lambda m: (m.score, str(m.id)))]
+
+    def test_top_members(self):
+        response = self.client.get(self.url, {'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['id'] for m in response.data['results']], self.expected_order()[:3])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_pages_follow_each_other(self):
+        """
+        Walks through the leaderboard 2 members at a time and checks nothing is skipped or repeated
+        """
+        ids, cursor = [], None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            ids += [m['id'] for m in response.data['results']]
+            cursor = response.data['next']
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected_order())
+
+    def test_member_rank(self):
+        expected = self.expected_order()
+        for member in self.members:
+            response = self.client.get(self.url, {'member': member.id})
+            self.assertEqual(response.data['rank'], expected.index(str(member.id)) + 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'member': 'nope'}).status_code, 404)
+
+
+class TestNextMemberView(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates a board with 3 members, two of them sharing the lowest score
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.members = [cls.board.add_member(user.username, user.id, score=score)
+                       for user, score in zip(cls.users, [10, 5, 5])]
+        cls.url = reverse('board_next_member', kwargs={'board_id': cls.board.id})
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_next_member(self):
+        # Ties are broken by id
+        first, second = sorted(self.members[1:], key=lambda m: str(m.id))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['id'], str(first.id))
+
+        response = self.client.post(self.url, {'delta': 20}, format='json')
+        self.assertEqual((response.data['id'], response.data['score']), (str(first.id), 25))
+        self.assertEqual(self.client.get(self.url).data['id'], str(second.id))
+
+        response = self.client.post(self.url, {'score': 7}, format='json')
+        self.assertEqual((response.data['id'], response.data['score']), (str(second.id), 7))
+
+    def test_turn_resets_score_to_now(self):
+        response = self.client.post(self.url)
+        self.assertGreater(response.data['score'], 10)
+        self.assertEqual(BoardChange.objects.filter(object_id=response.data['id']).count(), 2)
+
+    def test_turn_is_validated(self):
+        self.assertEqual(self.client.post(self.url, {'score': 1, 'delta': 1}, format='json').status_code, 400)
+
+
+class TestLeaderboardScaling(TestCase):
+    """
+    Checks the leaderboard queries are answered from the (board, score, id) index,
+    with the same number of queries on a small board and on a 100k members one
+    """
+    sizes = (10, 100000)
+    index_name = 'boards_member_board_score_idx'
+
+    @classmethod
+    def setUpTestData(cls):
+        users = user_model.objects.bulk_create([
+            user_model(username=f'testeur_{i}', email=f'test_{i}@test.com')
+            for i in range(max(cls.sizes))
+        ])
+        cls.boards = []
+        for size in cls.sizes:
+            board = Board.objects.create(title=f'board of {size}')
+            BoardMember.objects.bulk_create([
+                BoardMember(username=user.username, score=i % 1000, user=user, board=board)
+                for i, user in enumerate(users[:size])
+            ])
+            cls.boards.append(board)
+        cls.user = users[0]
+
+        # Planner statistics, as the autovacuum daemon would have gathered them by now
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE boards_boardmember')
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_query_plans_use_index(self):
+        """
+        On the largest board, pages and the rank of a member close to the top are read
+        from a range of the index rather than from every member of the board
+        """
+        board = self.boards[-1]
+        member = board.leaderboard()[100]
+        querysets = [
+            board.leaderboard()[:50],
+            board.leaderboard((member.score, member.id))[:50],
+            board.members_ahead_of(member),
+        ]
+        for queryset in querysets:
+            self.assertIn(self.index_name, queryset.explain())
+
+    def test_query_count_is_flat(self):
+        # Caches the membership check
+        self.client.get(reverse('board_leaderboard', kwargs={'board_id': self.boards[0].id}))
+        for board in self.boards:
+            url = reverse('board_leaderboard', kwargs={'board_id': board.id})
+            member = board.members.order_by('-score', '-id')[0]
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'limit': 5})
+            with self.assertNumQueries(2):
+                self.client.get(url, {'limit': 5, 'cursor': response.data['next']})
+            with self.assertNumQueries(3):
+                response = self.client.get(url, {'member': member.id})
+            self.assertEqual(response.data['rank'], board.members.count())
+
+
+class TestConditionalViews(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates a board with 2 members
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.member = cls.board.add_member('testeur_1', cls.users[0].id, score=1)
+        cls.board.add_member('testeur_2', cls.users[1].id, score=2)
+        cls.urls = [
+            reverse('board_details', kwargs={'board_id': cls.board.id}),
+            reverse('board_members', kwargs={'board_id': cls.board.id}),
+            reverse('board_member_details', kwargs={'board_id': cls.board.id, 'member_id': cls.member.id}),
+        ]
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_matching_etag_is_not_modified(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            # board lookup, the membership check being cached
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_member_changes(self):
+        updates = [
+            lambda: self.board.reset_score(self.member.id, 5),
+            lambda: self.client.put(self.urls[2], {'score': 6}, format='json'),
+            lambda: self.client.post(self.urls[1], {'user': str(self.users[2].id)}, format='json'),
+            lambda: self.client.put(self.urls[0], {'title': 'goodbye board'}, format='json'),
+        ]
+        for update in updates:
+            etags = [self.client.get(url)['ETag'] for url in self.urls]
+            update()
+            for url, etag in zip(self.urls, etags):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_forbidden_for_non_members(self):
+        self.client.force_authenticate(user=self.users[2])
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class TestScoreUpdateViews(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 2 boards, the first user being a member of the first one only
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.members = cls.board.add_members([{'user': user.id, 'score': 10} for user in cls.users[:2]])
+        cls.other_board = Board.objects.create(title='other board')
+        cls.other_board.add_member('testeur_3', cls.users[2].id, score=10)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def member_url(self, member):
+        return reverse('board_member_details', kwargs={'board_id': self.board.id, 'member_id': member.id})
+
+    def test_member_score_is_adjusted(self):
+        response = self.client.patch(self.member_url(self.members[0]), {'delta': -3}, format='json')
+        self.assertEqual(response.data['score'], 7)
+        response = self.client.put(self.member_url(self.members[0]), {'username': 'renamed'}, format='json')
+        self.assertEqual((response.data['username'], response.data['score']), ('renamed', 7))
+
+    def test_member_update_is_validated(self):
+        url = self.member_url(self.members[0])
+        self.assertEqual(self.client.put(url, {'score': 'nope'}, format='json').status_code, 400)
+        self.assertEqual(self.client.put(url, {'score': 1, 'delta': 1}, format='json').status_code, 400)
+
+    def test_round_is_settled(self):
+        response = self.client.post(reverse('settle_scores'), {'boards': [str(self.board.id)], 'delta': 5}, format='json')
+        self.assertEqual(response.data, {'updated': 2})
+        self.assertEqual(set(self.board.members.values_list('score', flat=True)), {15})
+
+    def test_cannot_settle_foreign_boards(self):
+        data = {'boards': [str(self.board.id), str(self.other_board.id)], 'score': 0}
+        self.assertEqual(self.client.post(reverse('settle_scores'), data, format='json').status_code, 403)
+        self.assertEqual(set(self.other_board.members.values_list('score', flat=True)), {10})
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class TestChangesView(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates 2 boards, the first user being a member of the first one only
+        """
+        cls.users = [user_model.objects.create_user(
+            username=f'testeur_{i}',
+            email=f'test_{i}@test.com',
+            password='testpassword123'
+        ) for i in range(1, 4)]
+        cls.board = Board.objects.create(title='hello board')
+        cls.members = cls.board.add_members([{'user': user.id, 'score': i} for i, user in enumerate(cls.users[:2])])
+        cls.other_board = Board.objects.create(title='other board')
+        cls.other_board.add_member('testeur_3', cls.users[2].id, score=10)
+
+    def setUp(self):
+        # Cached payloads and memberships outlive the rollback of the previous test
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+        self.cursor = self.client.get(reverse('changes')).data['cursor']
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse('changes'), dict({'cursor': self.cursor}, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_no_changes(self):
+        data = self.get_changes()
+        self.assertEqual((data['cursor'], data['boards'], data['members']), (self.cursor, [], []))
+
+    def test_changes_are_sent_once(self):
+        self.board.reset_score(self.members[0].id, 10)
+        self.board.update_member(self.members[0].id, score=F('score') + 1)
+        self.other_board.add_member('testeur_1', self.users[0].id)
+        self.other_board.reset_score(self.other_board.members.get(user=self.users[2]).id, 0)
+
+        data = self.get_changes()
+        self.assertEqual(len(data['members']), 3)
+        self.assertEqual(
+            [m['score'] for m in data['members'] if m['id'] == str(self.members[0].id)],
+            [11]
+        )
+        self.assertEqual(self.get_changes(cursor=data['cursor'])['members'], [])
+
+    def test_boards_joined_are_sent_whole(self):
+        client = APIClient()
+        client.force_authenticate(user=self.users[2])
+        for add in (
+            lambda: self.board.add_member('testeur_3', self.users[2].id),
+            lambda: self.board.add_members([{'user': self.users[2].id}]),
+        ):
+            with self.subTest(add=add):
+                self.board.members.filter(user=self.users[2]).delete()
+                cache.get_cache().clear()
+                cursor = client.get(reverse('changes')).data['cursor']
+                add()
+                data = client.get(reverse('changes'), {'cursor': cursor}).data
+                self.assertEqual([board['title'] for board in data['boards']], ['hello board'])
+                self.assertEqual(
+                    {member['user'] for member in data['members']},
+                    {user.id for user in self.users},
+                )
+                # The other members only get the new one
+                data = self.get_changes(cursor=cursor)
+                self.assertEqual([member['user'] for member in data['members']], [self.users[2].id])
+
+    def test_changes_of_foreign_boards_are_not_sent(self):
+        self.other_board.reset_score(self.other_board.members.get().id, 0)
+        self.other_board.title = 'renamed'
+        self.other_board.save()
+        data = self.get_changes()
+        self.assertEqual((data['boards'], data['members']), ([], []))
+
+    def test_deletions_leave_tombstones(self):
+        self.board.remove_member(self.members[1].id)
+        self.board.title = 'goodbye board'
+        self.board.save()
+
+        data = self.get_changes()
+        self.assertEqual(data['deleted']['members'], [self.members[1].id])
+        self.assertEqual([b['title'] for b in data['boards']], ['goodbye board'])
+
+        # The user is told about their own removal, even once the board is deleted
+        self.board.remove_member(self.members[0].id)
+        Board.objects.get(id=self.board.id).delete()
+        data = self.get_changes(cursor=data['cursor'])
+        self.assertEqual(data['deleted']['members'], [self.members[0].id])
+
+    def test_members_are_told_about_the_deletion_of_their_board(self):
+        other_client = APIClient()
+        other_client.force_authenticate(user=self.users[2])
+        response = self.client.delete(reverse('board_details', kwargs={'board_id': self.board.id}))
+        self.assertEqual(response.status_code, 204)
+
+        data = self.get_changes()
+        self.assertEqual(data['deleted']['boards'], [self.board.id])
+        # Covered by the board's
+        self.assertEqual(data['deleted']['members'], [])
+        # Not the users of other boards
+        data = other_client.get(reverse('changes'), {'cursor': self.cursor}).data
+        self.assertEqual(data['deleted']['boards'], [])
+
+    @override_settings(CHANGES_SETTLE_SECONDS=60)
+    def test_changes_committed_late_are_not_skipped(self):
+        self.assertEqual(self.client.get(reverse('changes')).data['cursor'], '0')
+        self.board.reset_score(self.members[0].id, 10)
+        self.board.reset_score(self.members[1].id, 20)
+        # The first change, logged by a transaction not committed yet
+        late_change = BoardChange.objects.filter(id__gt=self.cursor).order_by('id').first()
+        late_change.delete()
+
+        data = self.get_changes()
+        self.assertEqual([m['score'] for m in data['members']], [20])
+        # Sent again until it settled
+        self.assertEqual(data['cursor'], self.cursor)
+        self.assertFalse(data['has_more'])
+        late_change.save(force_insert=True)
+        data = self.get_changes(cursor=data['cursor'])
+        self.assertEqual(sorted(m['score'] for m in data['members']), [10, 20])
+
+        with override_settings(CHANGES_SETTLE_SECONDS=0):
+            data = self.get_changes(cursor=data['cursor'])
+            self.assertEqual(len(data['members']), 2)
+            self.assertEqual(self.get_changes(cursor=data['cursor'])['members'], [])
+
+    @mock.patch.object(ChangesView, 'page_size', 2)
+    def test_changes_are_paginated(self):
+        self.board.add_member('testeur_3', self.users[2].id)
+        for i in range(4):
+            self.board.reset_score(self.members[0].id, i)
+
+        member_ids, cursor, pages = set(), self.cursor, 0
+        while True:
+            data = self.get_changes(cursor=cursor)
+            member_ids |= {m['id'] for m in data['members']}
+            cursor, pages = data['cursor'], pages + 1
+            if not data['has_more']:
+                break
+        self.assertEqual(len(member_ids), 2)
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(reverse('changes'), {'cursor': 'nope'}).status_code, 400)
@@ -0,0 +1,278 @@
+"""
+Throttling of the API with token buckets kept in the process, and shedding of the load the
+process cannot take
+
+TokenBucketThrottle limits the requests of each user (of each client address for anonymous
+ones), to each board, and in total, at the rates of DEFAULT_THROTTLE_RATES of REST_FRAMEWORK
+for the `user`, `anon`, `board` and `global` scopes. A rate of 'N/period' lets N requests go
+at once, then N per period. Scopes without a rate are not limited.
+Buckets live in the process : taking a token costs no query and no cache round trip. Each
+process thus allows the rates on its own. With THROTTLE_SHARED, the requests allowed by each
+bucket are also counted in the shared cache (see cache.py), every THROTTLE_SYNC_INTERVAL
+seconds, per window of the period of the rate : once the processes together went beyond N in a
+window, the bucket turns every request down until the window ends.
+Throttled requests get a 429 with a Retry-After header.
+
+LoadSheddingMiddleware turns requests down with a 503 and a Retry-After header, before they
+cost anything, once the process already handles LOAD_SHEDDING_MAX_IN_FLIGHT requests, or once a
+request waited more than LOAD_SHEDDING_MAX_QUEUE_MS in front of it, according to the
+X-Request-Start header set by the proxy : it would be answered too late anyway.
+"""
+import collections
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .cache import get_cache
+
+
+THROTTLE_KEY = 'throttle:{scope}:{key}:{window}'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+USER = 'user'
+ANON = 'anon'
+BOARD = 'board'
+GLOBAL = 'global'
+
+
+class TokenBucket:
+    """
+    `capacity` tokens, refilled at `rate` per second. Not thread-safe, see Buckets.
+    Requests allowed since the last sync are `pending`, requests are turned down until `blocked_until`.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'pending', 'synced', 'blocked_until')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.pending = 0
+        self.synced = now
+        self.blocked_until = 0
+
+    def take(self, now):
+        """
+        Takes a token, returning 0, or returns the seconds to wait for the next one
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.pending += 1
+        return 0
+
+
+class Buckets:
+    """
+    Token buckets by key, the least recently used ones being dropped beyond `size`
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, count, period, now, sync_interval=None):
+        """
+        Takes a token from the bucket of `key`, for a rate of `count` per `period` seconds.
+        Returns the seconds to wait, 0 if allowed, the bucket, and the requests it allowed
+        since its last sync if `sync_interval` passed since, 0 otherwise.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.capacity != count or bucket.rate != count / period:
+                bucket = self._buckets[key] = TokenBucket(count / period, count, now)
+                if len(self._buckets) > self.size:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+            pending = 0
+            if sync_interval is not None and now - bucket.synced >= sync_interval:
+                pending, bucket.pending, bucket.synced = bucket.pending, 0, now
+            return wait, bucket, pending
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+_rates = {}
+
+
+def get_buckets():
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            _buckets = Buckets(settings.THROTTLE_BUCKETS_SIZE)
+        return _buckets
+
+
+def clear():
+    get_buckets().clear()
+
+
+def parse_rate(rate):
+    """
+    Returns the (count, period in seconds) of a rate such as '20/second', None for None
+    """
+    if rate is None:
+        return None
+    parsed = _rates.get(rate)
+    if parsed is None:
+        count, period = rate.split('/')
+        parsed = _rates[rate] = (int(count), PERIODS[period[0]])
+    return parsed
+
+
+def sync(scope, key, bucket, pending, count, period, now):
+    """
+    Adds the requests allowed by a bucket since its last sync to the count of its window in
+    the shared cache, and blocks the bucket until the window ends if the count went beyond
+    """
+    window = math.floor(time.time() / period)
+    cache_key = THROTTLE_KEY.format(scope=scope, key=key, window=window)
+    cache = get_cache()
+    cache.add(cache_key, 0, period + 1)
+    try:
+        total = cache.incr(cache_key, pending)
+    except ValueError:
+        # Expired in between
+        return
+    if total > count:
+        bucket.blocked_until = now + (window + 1) * period - time.time()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the requests per user, per board and in total, see the module docstring
+    """
+
+    def get_scopes(self, request, view):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        if request.user and request.user.is_authenticated:
+            yield USER, str(request.user.pk), rates.get(USER)
+        else:
+            yield ANON, self.get_ident(request), rates.get(ANON)
+        board_id = view.kwargs.get('board_id') if hasattr(view, 'kwargs') else None
+        if board_id is not None:
+            yield BOARD, str(board_id), rates.get(BOARD)
+        yield GLOBAL, '', rates.get(GLOBAL)
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        buckets = get_buckets()
+        sync_interval = settings.THROTTLE_SYNC_INTERVAL if settings.THROTTLE_SHARED else None
+        now = time.monotonic()
+        for scope, key, rate in self.get_scopes(request, view):
+            rate = parse_rate(rate)
+            if rate is None:
+                continue
+            count, period = rate
+            wait, bucket, pending = buckets.take(f'{scope}:{key}', count, period, now, sync_interval)
+            if pending:
+                sync(scope, key, bucket, pending, count, period, now)
+            if wait:
+                self.retry_after = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class InFlight:
+    """
+    Number of requests being handled by the process
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def enter(self, limit):
+        """
+        Counts a request in, unless `limit` requests are already in flight
+        """
+        with self._lock:
+            if limit and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def exit(self):
+        with self._lock:
+            self.count -= 1
+
+
+in_flight = InFlight()
+
+
+def get_queue_time(request):
+    """
+    Returns the seconds a request waited since the proxy received it, according to the
+    X-Request-Start header, as t=<timestamp> in seconds, milliseconds or microseconds
+    None if the header is missing or invalid
+    """
+    value = request.META.get('HTTP_X_REQUEST_START')
+    if not value:
+        return None
+    try:
+        start = float(value[2:] if value.startswith('t=') else value)
+    except ValueError:
+        return None
+    # Told apart by their magnitude
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return time.time() - start
+
+
+def overloaded():
+    response = HttpResponse(
+        json.dumps({'detail': 'The server is overloaded, retry later.'}),
+        content_type='application/json',
+        status=503,
+    )
+    response['Retry-After'] = str(settings.LOAD_SHEDDING_RETRY_AFTER)
+    return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Turns requests down while the process is overloaded, see the module docstring.
+    To be placed right after RequestMetricsMiddleware, so that turned down requests cost nothing
+    but are still measured. Streamed responses are in flight until they start streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        max_queue_ms = settings.LOAD_SHEDDING_MAX_QUEUE_MS
+        if max_queue_ms:
+            queue_time = get_queue_time(request)
+            if queue_time is not None and queue_time * 1000 > max_queue_ms:
+                return overloaded()
+        if not in_flight.enter(settings.LOAD_SHEDDING_MAX_IN_FLIGHT):
+            return overloaded()
+        try:
+            return self.get_response(request)
+        finally:
+            in_flight.exit()
@@ -1,18 +1,32 @@
 from django.urls import path
 from .views import (
     ListCreateBoardsView,
+    ExportBoardsView,
     RetrieveUpdateDeleteBoardsView,
     ListCreateBoardMembersView,
+    LeaderboardView,
+    NextMemberView,
     RetrieveUpdateDeleteBoardMembersView,
+    SettleScoresView,
+    BatchView,
+    ChangesView,
+    MetricsView,
+    UserProfileView,
 )
-from rest_auth.views import UserDetailsView
 from .models import Board
 
 
 urlpatterns = [
     path('boards/', ListCreateBoardsView.as_view(), name='boards'),
+    path('boards/export/<str:export_format>/', ExportBoardsView.as_view(), name='export_boards'),
+    path('boards/settle/', SettleScoresView.as_view(), name='settle_scores'),
     path("boards/<uuid:board_id>/", RetrieveUpdateDeleteBoardsView.as_view(), name='board_details'),
     path("boards/<uuid:board_id>/members/", ListCreateBoardMembersView.as_view(), name='board_members'),
+    path("boards/<uuid:board_id>/members/leaderboard/", LeaderboardView.as_view(), name='board_leaderboard'),
+    path("boards/<uuid:board_id>/next/", NextMemberView.as_view(), name='board_next_member'),
     path("boards/<uuid:board_id>/members/<uuid:member_id>", RetrieveUpdateDeleteBoardMembersView.as_view(), name='board_member_details'),
-    path("profile/", UserDetailsView.as_view(), name='user_profile'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('changes/', ChangesView.as_view(), name='changes'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path("profile/", UserProfileView.as_view(), name='user_profile'),
 ]
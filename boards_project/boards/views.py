@@ -1,52 +1,271 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import uuid
 
 
 from rest_framework.views import APIView
 from rest_framework import generics
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import APIException, NotFound, ParseError, PermissionDenied
+from rest_framework.renderers import BrowsableAPIRenderer
 
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.db.models import F, Q, Prefetch, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
-from .models import Board, AppUser, BoardMember
+from .models import ArchivedBoard, Board, AppUser, BoardChange, BoardMember, MemberAlreadyExists, settle_scores
 from .serializers import (
     BoardSerializer,
+    BoardPartialSerializer,
+    BoardSummarySerializer,
     AppUserSerializer,
     MemberSerializer,
+    MemberImportSerializer,
+    MemberUpdateSerializer,
+    SettleScoresSerializer,
+    BatchSerializer,
+    TakeTurnSerializer,
 )
-from .permissions import IsBoardMember
+from .permissions import IsBoardMember, get_user_board_ids
+from .fieldsets import Fieldset, select, select_nested
+from .idempotency import IdempotentMixin
+from .renderers import FastJSONRenderer
+from . import archive, batch, cache, exports, fast_serializers, metrics, ranks
+
+from rest_auth.views import UserDetailsView
+
+
+# Renderers of the views with a fast path, see fast_serializers.py
+FAST_RENDERER_CLASSES = (FastJSONRenderer, BrowsableAPIRenderer)
+
+
+def members_prefetch(lookup='members', fields=None):
+    """
+    Prefetches the members nested by the depth=1 serializers in a single query,
+    ordered as in the leaderboard
+    `fields` limits the columns read to those of the given fields (see fieldsets.py)
+    """
+    queryset = BoardMember.objects.order_by('score', 'id')
+    if fields is not None:
+        # Along with the key of the relation
+        queryset = queryset.only(*fields, 'board' if lookup == 'members' else 'user')
+    return Prefetch(lookup, queryset=queryset)
+
+
+def board_members_prefetches(fieldset):
+    """
+    Returns the prefetches of the members of boards as serialized by BoardSerializer,
+    reading only the columns of the fieldset, if any (see fieldsets.py)
+    """
+    if fieldset is None:
+        return [members_prefetch()]
+    if 'members' not in select(fieldset, fast_serializers.BOARD_FIELDS, ('members',)):
+        return []
+    fields = select_nested(fieldset, 'members', fast_serializers.NESTED_MEMBER_FIELDS) or ('id',)
+    return [members_prefetch(fields=fields)]
+
+
+def only_fields(queryset, fieldset, available, *required):
+    """
+    Reads only the columns of the fields of the fieldset, if any, and of the `required` ones
+    """
+    if fieldset is None:
+        return queryset
+    return queryset.only(*select(fieldset, available), *required)
+
+
+def cache_name(name, fieldset):
+    # Each fieldset of a payload is cached on its own
+    return name if fieldset is None else f'{name}:{fieldset.key}'
+
+
+def get_board_or_404(board_id, archived=False):
+    """
+    Returns a board, restoring it first if it was archived, or with `archived` reading it
+    from the archive instead (see archive.py)
+    """
+    board = Board.objects.filter(id=board_id).first()
+    if board is None:
+        board = archive.get_archived_board(board_id) if archived else archive.restore(board_id)
+    if board is None:
+        raise Http404('No Board matches the given query.')
+    return board
+
+
+class Conflict(APIException):
+    status_code = 409
+    default_detail = 'Conflict with the current state of the board'
+    default_code = 'conflict'
+
+
+class BoardViewMixin:
+    """
+    Used by the views nested under a board, whose access is checked by IsBoardMember
+    beforehand : the board is fetched once per request.
+    GET requests are answered conditionally on the board version : responses carry an
+    ETag, and a matching `If-None-Match` gets a 304 right after the board lookup, without
+    loading or serializing anything else.
+    Archived boards are restored first, unless the view reads them from the archive on
+    safe requests (`archived_reads`) : such views serve archived boards, whose `archived` is
+    set, from the members read in memory (see archive.py).
+    """
+    _board = None
+    archived_reads = False
+
+    def get_board(self):
+        if self._board is None:
+            archived = self.archived_reads and self.request.method in SAFE_METHODS
+            self._board = get_board_or_404(self.kwargs['board_id'], archived=archived)
+        return self._board
+
+    def get(self, request, *args, **kwargs):
+        board = self.get_board()
+        not_modified = get_conditional_response(request, etag=board.etag)
+        if not_modified is not None:
+            not_modified['ETag'] = board.etag
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        response.setdefault('ETag', board.etag)
+        return response
+
+
+def get_user_boards(user):
+    """
+    Staff users can see every boards, others only the boards they are a member of
+    """
+    if user.is_staff:
+        return Board.objects.all()
+    else:
+        board_ids = BoardMember.objects.filter(user=user).values('board_id')
+        return Board.objects.filter(id__in=board_ids)
 
 
 """ ===============================
 ============ Board views ==========
 =============================== """
-class ListCreateBoardsView(generics.ListCreateAPIView):
+class ListCreateBoardsView(IdempotentMixin, generics.ListCreateAPIView):
     """
     This view extends the generic ListCreateAPIView, overriding it's get_queryset method
     User has to be authenticated. If the user is part of the staff group, he is able to see
     every boards.
     Otherwise, he can only get the boards which he is a member of.
+    Listed boards can be sparse (see fieldsets.py).
+    With `summary`, boards are listed as cards, with the aggregates of their members instead
+    of the members themselves : the member table is not read, the user's boards being cached.
+    Archived boards are listed after the others (see archive.py).
     """
     permission_classes = (IsAuthenticated,)
+    replica_reads = True
     serializer_class = BoardSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return Board.objects.all()
+        fieldset = Fieldset.from_request(self.request)
+        boards = get_user_boards(self.request.user)
+        if fieldset is not None:
+            fields = select(fieldset, fast_serializers.BOARD_FIELDS, ('members',))
+            boards = boards.only(*(name for name in fields if name != 'members'))
+        return boards.prefetch_related(*board_members_prefetches(fieldset))
+
+    def list(self, request, *args, **kwargs):
+        if 'summary' in request.query_params:
+            archived = ArchivedBoard.objects.defer('members_data')
+            if request.user.is_staff:
+                boards = list(Board.objects.all())
+            else:
+                board_ids = get_user_board_ids(request.user)
+                boards = list(Board.objects.filter(id__in=board_ids))
+                # The archive is only read for the boards missing from the boards table
+                missing = board_ids - {board.id for board in boards}
+                archived = archived.filter(id__in=missing) if missing else archived.none()
+            boards += [board.get_board(members=False) for board in archived]
+            return Response(BoardSummarySerializer(boards, many=True).data)
+
+        if not settings.BOARDS_FAST_SERIALIZATION:
+            response = super().list(request, *args, **kwargs)
         else:
-            board_ids = [item.board_id for item in self.request.user.memberships.all()]
-            return Board.objects.filter(id__in=board_ids)
+            response = Response(fast_serializers.serialize_boards(
+                get_user_boards(request.user), Fieldset.from_request(request)
+            ))
+        archived = [board.get_board() for board in archive.get_archived_boards(request.user)]
+        if archived:
+            response.data += self.get_serializer(archived, many=True).data
+        return response
+
+
+class ExportBoardsView(APIView):
+    """
+    This view streams the boards visible to the user (see ListCreateBoardsView) with
+    their members, either as NDJSON (one board per line) or as CSV (one member per line).
+    `since`, an ISO 8601 datetime, only exports the boards modified since then.
+    """
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    # Streamed, it cannot be returned within a batch
+    batchable = False
+    formats = {
+        'ndjson': (exports.iter_ndjson, 'application/x-ndjson'),
+        'csv': (exports.iter_csv, 'text/csv'),
+    }
+
+    def get(self, request, export_format):
+        if export_format not in self.formats:
+            raise NotFound(f'Unknown export format {export_format}')
+        iter_lines, content_type = self.formats[export_format]
+
+        boards = get_user_boards(request.user)
+        if 'since' in request.query_params:
+            since = parse_datetime(request.query_params['since'])
+            if since is None:
+                raise ParseError('since must be an ISO 8601 datetime')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, timezone.utc)
+            boards = boards.filter(updated_at__gte=since)
+
+        response = StreamingHttpResponse(iter_lines(boards), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="boards.{export_format}"'
+        return response
 
 
-class RetrieveUpdateDeleteBoardsView(generics.RetrieveUpdateDestroyAPIView):
+class RetrieveUpdateDeleteBoardsView(IdempotentMixin, BoardViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     This view deals with retrieving a board and deleting it, as well as basic
     updates (title). For updating board members, a custom view is used.
+    The retrieved board is served from the boards cache, and can be sparse (see fieldsets.py).
+    Archived boards are retrieved from the archive, and restored by updates and deletions.
     """
     permission_classes = (IsBoardMember,)
-    queryset = Board.objects.all()
+    replica_reads = True
+    archived_reads = True
+    queryset = Board.objects.prefetch_related(members_prefetch())
+    lookup_url_kwarg = 'board_id'
+
+    def retrieve(self, request, *args, **kwargs):
+        # The payload comes from the cache, along with the ETag of the version it was built from
+        board = self.get_board()
+        fieldset = Fieldset.from_request(request)
+
+        def serialize():
+            prefetch_related_objects([board], *board_members_prefetches(fieldset))
+            return board.etag, self.get_serializer(board).data
+
+        etag, data = cache.get_or_set(board.id, cache_name('detail', fieldset), serialize)
+        return Response(data, headers={'ETag': etag})
+
+    def get_object(self):
+        # The generic lookup only reads the boards table : archived boards are restored first
+        self.get_board()
+        return super().get_object()
     
     def get_serializer_class(self):
         if self.request.method in ('PUT',):
@@ -55,43 +274,188 @@ class RetrieveUpdateDeleteBoardsView(generics.RetrieveUpdateDestroyAPIView):
             return BoardSerializer
 
 
-class ListCreateBoardMembersView(generics.ListCreateAPIView):
+class ListCreateBoardMembersView(IdempotentMixin, BoardViewMixin, generics.ListCreateAPIView):
     """
     This view deals with adding and listing board members
+    The members list is served from the boards cache, and can be sparse (see fieldsets.py)
+    Posting a list of members instead of a single one adds them all in a single transaction
+    Adding a user who already is a member is a conflict (409), unless `upsert` is given :
+    the existing member is then updated.
+    Members of archived boards are listed from the archive.
     """
     permission_classes = (IsBoardMember,)
+    replica_reads = True
+    archived_reads = True
     serializer_class = MemberSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def get_queryset(self):
-        board_id = self.kwargs['board_id']
-        board = get_object_or_404(Board.objects.all(), id=board_id)
-        return board.members.all()
+        return self.get_board().leaderboard()
+
+    def list(self, request, board_id):
+        board = self.get_board()
+        fieldset = Fieldset.from_request(request)
+
+        def serialize():
+            if board.archived:
+                return board.etag, self.get_serializer(archive.get_members(board), many=True).data
+            if settings.BOARDS_FAST_SERIALIZATION:
+                return board.etag, fast_serializers.serialize_members(board.leaderboard(), fieldset)
+            members = only_fields(board.leaderboard(), fieldset, fast_serializers.MEMBER_FIELDS)
+            return board.etag, self.get_serializer(members, many=True).data
+
+        etag, data = cache.get_or_set(board.id, cache_name('members', fieldset), serialize)
+        return Response(data, headers={'ETag': etag})
 
     def create(self, request, board_id):
         # Retrieves the board where the new member is to be added
-        board_id = self.kwargs['board_id']
-        board = get_object_or_404(Board.objects.all(), id=board_id)
+        board = self.get_board()
+
+        # A list in the request body adds all those members at once
+        if isinstance(request.data, list):
+            members_data = MemberImportSerializer(data=request.data, many=True)
+            members_data.is_valid(raise_exception=True)
+            try:
+                members = board.add_members(members_data.validated_data)
+            except MemberAlreadyExists as e:
+                raise Conflict(str(e))
+            except IntegrityError:
+                raise Conflict('Some users were added to this board meanwhile')
+            return Response(MemberSerializer(members, many=True).data)
 
         # Retrieves user infos
         user_id = request.data['user']
         username = request.data.get('username', AppUser.objects.get(id=user_id).username)
         score = request.data.get('score', None)
 
-        member = board.add_member(username, user_id, score)
+        try:
+            member = board.add_member(username, user_id, score, upsert='upsert' in request.query_params)
+        except MemberAlreadyExists as e:
+            raise Conflict(str(e))
+        return Response(MemberSerializer(member).data)
+
+
+class LeaderboardView(APIView):
+    """
+    This view lists board members ordered by score, the next one to pay first.
+    Query parameters :
+    - `limit` : number of members returned (top N), up to `max_limit`
+    - `cursor` : returned as `next` by the previous page, to get the following members
+    - `member` : a member id, returns this member's rank and percentile (the percentage of
+      members placed before it) instead of a page
+    - `around` : along with `member`, also returns the members placed just before and after
+      it, up to `max_limit` of each
+    Listed members can be sparse (see fieldsets.py). Archived boards are read from the archive.
+    """
+    permission_classes = (IsBoardMember,)
+    replica_reads = True
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, board_id):
+        board = get_board_or_404(board_id, archived=True)
+
+        if 'member' in request.query_params:
+            try:
+                if board.archived:
+                    member, rank = archive.get_rank(board, request.query_params['member'])
+                else:
+                    member, rank = board.get_rank(request.query_params['member'])
+            except (BoardMember.DoesNotExist, ValidationError):
+                raise NotFound('Member not found')
+            data = {
+                'rank': rank,
+                'percentile': ranks.percentile(rank, board.members_count),
+                'member': MemberSerializer(member).data,
+            }
+            if 'around' in request.query_params:
+                neighbours = archive.get_neighbours if board.archived else Board.get_neighbours
+                before, after = neighbours(board, member, self.get_limit(request, 'around'))
+                data['before'] = MemberSerializer(before, many=True).data
+                data['after'] = MemberSerializer(after, many=True).data
+            return Response(data)
+
+        limit = self.get_limit(request)
+        after = self.parse_cursor(request.query_params.get('cursor'))
+        fieldset = Fieldset.from_request(request)
+        if board.archived:
+            members = archive.get_members(board, after)[:limit]
+        else:
+            members = only_fields(board.leaderboard(after), fieldset, fast_serializers.MEMBER_FIELDS, 'score')
+            members = list(members[:limit])
+
+        next_cursor = None
+        if len(members) == limit:
+            next_cursor = f'{members[-1].score}:{members[-1].id}'
+        results = MemberSerializer(members, many=True, context={'request': request}).data
+        return Response({'next': next_cursor, 'results': results})
+
+    def get_limit(self, request, param='limit'):
+        try:
+            limit = int(request.query_params.get(param) or self.default_limit)
+        except ValueError:
+            raise ParseError(f'{param} must be an integer')
+        return max(1, min(limit, self.max_limit))
+
+    def parse_cursor(self, cursor):
+        if cursor is None:
+            return None
+        try:
+            score, member_id = cursor.split(':', 1)
+            return int(score), uuid.UUID(member_id)
+        except ValueError:
+            raise ParseError('Invalid cursor')
+
+
+class NextMemberView(IdempotentMixin, APIView):
+    """
+    This view tells whose turn it is : the member with the lowest score, ties being broken
+    by id as in the leaderboard, read with a seek on the (board, score, id) index.
+    POST takes the turn (see Board.take_turn) : the next member's score is reset to now,
+    set (`score`) or adjusted (`delta`), and the member is returned. Concurrent calls never
+    get the same member. Archived boards are read from the archive, and restored by POST.
+    """
+    permission_classes = (IsBoardMember,)
+    replica_reads = True
+
+    def get(self, request, board_id):
+        board = get_board_or_404(board_id, archived=True)
+        if board.archived:
+            member = next(iter(archive.get_members(board)), None)
+        else:
+            member = board.leaderboard().first()
+        if member is None:
+            raise NotFound('This board has no member')
         return Response(MemberSerializer(member).data)
 
+    def post(self, request, board_id):
+        data = TakeTurnSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
 
-class RetrieveUpdateDeleteBoardMembersView(generics.RetrieveUpdateDestroyAPIView):
+        board = get_board_or_404(board_id)
+        member = board.take_turn(**data.validated_data)
+        if member is None:
+            raise NotFound('This board has no member')
+        return Response(MemberSerializer(member).data)
+
+
+class RetrieveUpdateDeleteBoardMembersView(IdempotentMixin, BoardViewMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     This view deals with retrieving a member infos, updating it's score, or deleting it
+    A score is either set (`score`) or adjusted (`delta`), with a single UPDATE statement
+    The retrieved member can be sparse (see fieldsets.py), archived boards being read from the archive
     """
     permission_classes = (IsBoardMember,)
+    replica_reads = True
+    archived_reads = True
     serializer_class = MemberSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
 
     def get_queryset(self):
-        board_id = self.kwargs['board_id']
-        board = get_object_or_404(Board.objects.all(), id=board_id)
-        return board.members.all()
+        members = self.get_board().members.all()
+        if self.request.method == 'GET':
+            members = only_fields(members, Fieldset.from_request(self.request), fast_serializers.MEMBER_FIELDS)
+        return members
 
     def get_object(self):
         queryset = self.get_queryset()
@@ -99,20 +463,201 @@ class RetrieveUpdateDeleteBoardMembersView(generics.RetrieveUpdateDestroyAPIView
         member = get_object_or_404(queryset, id=member_id)
         return member
 
-    def update(self, request, board_id, member_id):
-        member = self.get_object()
+    def retrieve(self, request, *args, **kwargs):
+        board = self.get_board()
+        if board.archived:
+            member = archive.get_member(board, self.kwargs['member_id'])
+            if member is None:
+                raise NotFound()
+            return Response(self.get_serializer(member).data)
+        if not settings.BOARDS_FAST_SERIALIZATION:
+            return super().retrieve(request, *args, **kwargs)
+        member = fast_serializers.serialize_member(
+            self.get_board().members.all(), self.kwargs['member_id'], Fieldset.from_request(request)
+        )
+        if member is None:
+            raise NotFound()
+        return Response(member)
+
+    def update(self, request, *args, **kwargs):
+        data = MemberUpdateSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
 
-        if 'score' in request.data:
-            member.score = request.data['score']
-        
-        if 'username' in request.data:
-            member.username = request.data['username']
+        # Only the given fields are written, with a single UPDATE
+        values = dict(data.validated_data)
+        if 'delta' in values:
+            values['score'] = F('score') + values.pop('delta')
+        if not values:
+            return Response(MemberSerializer(self.get_object()).data)
 
-        member.save()
+        try:
+            member = self.get_board().update_member(self.kwargs['member_id'], **values)
+        except BoardMember.DoesNotExist:
+            raise NotFound()
         return Response(MemberSerializer(member).data)
 
 
     def delete(self, request, board_id, member_id):
-        board = Board.objects.get(id=board_id)
+        board = self.get_board()
         id = board.remove_member(member_id)
-        return Response(f'Succesfully deleted member {id}')
\ No newline at end of file
+        return Response(f'Succesfully deleted member {id}')
+
+
+class BatchView(IdempotentMixin, APIView):
+    """
+    This view executes a batch of requests to the other endpoints in one round trip (see batch.py).
+    The body is {"requests": [{"method", "path", "query", "headers", "body"}, ...], "atomic": false},
+    the paths being those of boards/urls.py, relative to the API root or not.
+    The responses are returned in order, as {"responses": [{"status", "headers", "body"}, ...]}.
+    An atomic batch is rolled back by its first failing request, "committed" telling whether it was.
+    """
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = FAST_RENDERER_CLASSES
+    batchable = False
+
+    def post(self, request):
+        data = BatchSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
+
+        atomic = data.validated_data['atomic']
+        prefix = reverse('batch')[:-len('batch/')]
+        responses, committed = batch.execute(request, data.validated_data['requests'], atomic, prefix)
+        if atomic:
+            return Response({'responses': responses, 'committed': committed})
+        return Response({'responses': responses})
+
+
+class SettleScoresView(IdempotentMixin, APIView):
+    """
+    This view settles a round on many boards at once : the scores of all their members,
+    or of the given members only, are reset or adjusted with a single statement.
+    The requesting user has to be a member of every board. Archived boards are restored first.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        data = SettleScoresSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
+
+        board_ids = set(data.validated_data['boards'])
+        if not board_ids <= get_user_board_ids(request.user):
+            raise PermissionDenied()
+
+        archive.restore_many(board_ids)
+        count = settle_scores(
+            board_ids,
+            member_ids=data.validated_data.get('members'),
+            score=data.validated_data.get('score'),
+            delta=data.validated_data.get('delta'),
+        )
+        return Response({'updated': count})
+
+
+class ChangesView(APIView):
+    """
+    This view is a delta-sync feed of the changes made to the boards the user is a member of,
+    from the log of changes (see BoardChange).
+    `cursor` is the one returned by the previous call. Without it, only the current cursor is
+    returned : get it before downloading the boards, then poll from it.
+    Each page holds the current state of the boards and members inserted or updated since the
+    cursor, and the ids of those deleted. `has_more` tells whether to call again right away.
+    The boards the user was added to are sent along with every one of their members.
+    Transactions may commit their changes after later ones, with greater ids, are visible : the
+    cursor never goes beyond the changes logged less than CHANGES_SETTLE_SECONDS ago, which are
+    sent again by the next calls, along with those committed late between them.
+    """
+    permission_classes = (IsAuthenticated,)
+    page_size = 500
+
+    def get(self, request):
+        settled_at = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+        if 'cursor' not in request.query_params:
+            last_change = (
+                BoardChange.objects.filter(created_at__lte=settled_at)
+                .order_by('-id').values_list('id', flat=True).first()
+            )
+            return Response({'cursor': str(last_change or 0), 'has_more': False})
+
+        try:
+            cursor = int(request.query_params['cursor'])
+        except ValueError:
+            raise ParseError('Invalid cursor')
+
+        board_ids = get_user_board_ids(request.user)
+        changes = list(
+            BoardChange.objects
+            .filter(Q(board_id__in=board_ids) | Q(user_id=request.user.id), id__gt=cursor)
+            .order_by('id')[:self.page_size + 1]
+        )
+        has_more = len(changes) > self.page_size
+        changes = changes[:self.page_size]
+        next_cursor = cursor
+        for change in changes:
+            if change.created_at > settled_at:
+                # Called again once they settled
+                has_more = False
+                break
+            next_cursor = change.id
+
+        # Only the last change of each object matters
+        latest = {(change.kind, change.object_id): change for change in changes}
+        upserted = {BoardChange.BOARD: [], BoardChange.MEMBER: []}
+        deleted = {BoardChange.BOARD: [], BoardChange.MEMBER: []}
+        for (kind, object_id), change in latest.items():
+            (deleted if change.deleted else upserted)[kind].append(object_id)
+
+        # The user was added to these boards : their other members are new to them as well
+        joined = {
+            change.board_id for change in changes
+            if change.kind == BoardChange.BOARD and change.user_id == request.user.id and not change.deleted
+        }
+
+        # Objects of boards the user has left since are not sent
+        boards = Board.objects.filter(id__in=[id for id in upserted[BoardChange.BOARD] if id in board_ids])
+        members = BoardMember.objects.filter(
+            Q(id__in=upserted[BoardChange.MEMBER]) | Q(board_id__in=joined), board_id__in=board_ids
+        )
+
+        return Response({
+            'cursor': str(next_cursor),
+            'has_more': has_more,
+            'boards': BoardPartialSerializer(boards, many=True).data,
+            'members': MemberSerializer(members, many=True).data,
+            'deleted': {
+                'boards': deleted[BoardChange.BOARD],
+                'members': deleted[BoardChange.MEMBER],
+            },
+        })
+
+
+class MetricsView(APIView):
+    """
+    This view returns, for staff users, the latency histogram and the totals of each route
+    measured by this process (see metrics.py), along with the boards cache statistics.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'routes': metrics.get_routes(),
+            'cache': {scope: cache.get_stats(scope) for scope in (cache.BOARDS, cache.USERS)},
+        })
+
+
+""" ===============================
+============ User views ===========
+=============================== """
+class UserProfileView(UserDetailsView):
+    """
+    rest-auth's user details view, with the memberships nested by AppUserSerializer
+    loaded in a single query. The profile can be sparse (see fieldsets.py).
+    """
+    def get_object(self):
+        user = super().get_object()
+        fieldset = Fieldset.from_request(self.request)
+        if fieldset is None:
+            prefetch_related_objects([user], members_prefetch('memberships'))
+        elif 'memberships' in select(fieldset, AppUserSerializer.Meta.fields, ('memberships',)):
+            fields = select_nested(fieldset, 'memberships', fast_serializers.NESTED_MEMBER_FIELDS) or ('id',)
+            prefetch_related_objects([user], members_prefetch('memberships', fields=fields))
+        return user